@@ -0,0 +1,147 @@
+"""
+pytest-benchmark suite of the hot paths: parsing, moderating a file, comparing scores and
+serving /moderate, all against the local stub upstream.
+
+Run with `python -m pytest benchmarks/bench_hot_paths.py --corpus-scales 1,100,1000
+--benchmark-json=benchmark.json` and compare two runs with `python -m benchmarks.compare`.
+Each benchmark records `messages_per_s`, `us_per_message` and `peak_rss_mb` in its
+`extra_info`.
+"""
+
+import asyncio
+
+import numpy as np
+import pytest
+
+from benchmarks.harness import API_KEY, serve_app
+from src.scripts.content_moderator import (
+    iter_transcript_messages,
+    process_conversations,
+)
+from src.scripts.file_converter import _parse_conversations, convert_to_json
+from src.scripts.load_tester import create_http_client
+from src.scripts.test_client import compare_results
+from src.stub_upstream import serve_stub
+from src.utils.openai_moderation_handler import DEFAULT_BATCH_SIZE, ModerationClient
+
+CATEGORIES = ["harassment", "hate", "violence"]
+
+# Largest scale of the paths that hold the whole corpus in memory or send one request per
+# message; larger corpora would need several GB or hours without telling anything more
+MAX_IN_MEMORY_SCALE = 100
+MAX_SERVED_SCALE = 1
+
+THREADS = 8
+CONNECTIONS = 16
+
+
+def rounds_at(scale: int) -> int:
+    """Repeats the quick runs on small corpora, and runs the large ones once."""
+    return max(1, 5 // scale)
+
+
+def skip_above(scale: int, max_scale: int) -> None:
+    if scale > max_scale:
+        pytest.skip(f"only benchmarked up to {max_scale}x")
+
+
+@pytest.fixture(scope="module")
+def stub_url():
+    with serve_stub() as url:
+        yield url
+
+
+def test_parse_in_memory(corpora, measure, scale):
+    skip_above(scale, MAX_IN_MEMORY_SCALE)
+    corpus = corpora(scale)
+
+    conversations = measure(
+        lambda: _parse_conversations(corpus.path), corpus.messages, rounds_at(scale)
+    )
+
+    assert sum(len(c["messages"]) for c in conversations) == corpus.messages
+
+
+def test_parse_to_json(corpora, measure, scale, tmp_path):
+    corpus = corpora(scale)
+    output_file = str(tmp_path / "conversations.json")
+
+    measure(
+        lambda: convert_to_json(corpus.path, output_file),
+        corpus.messages,
+        rounds_at(scale),
+    )
+
+
+def test_process_conversations(corpora, measure, scale, stub_url):
+    skip_above(scale, MAX_IN_MEMORY_SCALE)
+    corpus = corpora(scale)
+    conversations = _parse_conversations(corpus.path)
+
+    with ModerationClient(api_key="benchmark", base_url=stub_url) as client:
+        results = measure(
+            lambda: process_conversations(
+                conversations,
+                CATEGORIES,
+                THREADS,
+                client,
+                batch_size=DEFAULT_BATCH_SIZE,
+            ),
+            corpus.messages,
+            rounds_at(scale),
+        )
+
+    assert len(results) == corpus.messages
+
+
+def test_compare_results(measure, scale, sample_messages):
+    messages = scale * sample_messages
+    rng = np.random.default_rng(0)
+    file_scores = rng.random((messages, len(CATEGORIES)))
+    api_scores = file_scores + rng.normal(0, 1e-3, file_scores.shape)
+    # A few failed requests, left out of the statistics
+    api_scores[::1000] = np.nan
+
+    stats = measure(
+        lambda: compare_results(file_scores, api_scores, CATEGORIES),
+        messages,
+        rounds_at(scale),
+    )
+
+    assert set(stats) == set(CATEGORIES)
+
+
+async def _send_all(url: str, contents: list[str]) -> None:
+    """Sends one /moderate request per content, `CONNECTIONS` at a time."""
+    semaphore = asyncio.Semaphore(CONNECTIONS)
+    headers = {"Authorization": f"Bearer {API_KEY}"}
+
+    async with create_http_client(CONNECTIONS) as http_client:
+
+        async def send(idx: int, content: str) -> None:
+            body = {
+                "message_id": str(idx),
+                "content": content,
+                "categories": CATEGORIES,
+            }
+            async with semaphore:
+                response = await http_client.post(url, json=body, headers=headers)
+            response.raise_for_status()
+
+        await asyncio.gather(*(send(idx, c) for idx, c in enumerate(contents)))
+
+
+def test_serve_moderate(corpora, measure, scale, stub_url):
+    skip_above(scale, MAX_SERVED_SCALE)
+    corpus = corpora(scale)
+    contents = [m["content"] for m in iter_transcript_messages(corpus.path)]
+
+    client = ModerationClient(api_key="benchmark", base_url=stub_url)
+    try:
+        with serve_app(client) as base_url:
+            measure(
+                lambda: asyncio.run(_send_all(f"{base_url}/moderate", contents)),
+                len(contents),
+            )
+    finally:
+        client.close()
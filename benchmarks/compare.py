@@ -0,0 +1,102 @@
+"""
+Compares two runs of the benchmark suite saved with `--benchmark-json` and flags the
+benchmarks whose throughput or peak RSS regressed beyond a tolerance.
+
+Run with `python -m benchmarks.compare baseline.json current.json`.
+"""
+
+import json
+import sys
+from typing import Any
+
+import click
+
+
+def load_run(path: str) -> dict[str, dict[str, Any]]:
+    """Returns the `extra_info` metrics of each benchmark of a run, by name."""
+    with open(path, "r", encoding="utf-8") as file:
+        run = json.load(file)
+    return {
+        benchmark["name"]: benchmark["extra_info"] for benchmark in run["benchmarks"]
+    }
+
+
+def compare_runs(
+    baseline: dict[str, dict[str, Any]],
+    current: dict[str, dict[str, Any]],
+    max_slowdown: float,
+    max_rss_growth: float,
+) -> list[dict[str, Any]]:
+    """
+    Compares the benchmarks found in both runs.
+
+    Args:
+        baseline (dict[str, dict[str, Any]]): The metrics of the reference run, by name.
+        current (dict[str, dict[str, Any]]): The metrics of the new run, by name.
+        max_slowdown (float): The tolerated increase of the per-message time, e.g. 0.1.
+        max_rss_growth (float): The tolerated increase of the peak RSS, e.g. 0.2.
+
+    Returns:
+        list[dict[str, Any]]: For each benchmark, its `name`, the relative `time_change`
+        and `rss_change` and whether it `regressed`.
+    """
+    rows = []
+    for name in sorted(baseline.keys() & current.keys()):
+        before, after = baseline[name], current[name]
+        time_change = after["us_per_message"] / before["us_per_message"] - 1
+        rss_change = after["peak_rss_mb"] / before["peak_rss_mb"] - 1
+        rows.append(
+            {
+                "name": name,
+                "messages_per_s": after["messages_per_s"],
+                "time_change": time_change,
+                "rss_change": rss_change,
+                "regressed": time_change > max_slowdown or rss_change > max_rss_growth,
+            }
+        )
+    return rows
+
+
+@click.command()
+@click.argument("baseline_file", type=click.Path(exists=True, dir_okay=False))
+@click.argument("current_file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "--max-slowdown",
+    default=0.1,
+    show_default=True,
+    help="Tolerated increase of the time per message, as a fraction.",
+)
+@click.option(
+    "--max-rss-growth",
+    default=0.2,
+    show_default=True,
+    help="Tolerated increase of the peak RSS, as a fraction.",
+)
+def main(
+    baseline_file: str, current_file: str, max_slowdown: float, max_rss_growth: float
+) -> None:
+    """Flag the benchmarks of CURRENT_FILE that regressed from BASELINE_FILE."""
+    rows = compare_runs(
+        load_run(baseline_file), load_run(current_file), max_slowdown, max_rss_growth
+    )
+    if not rows:
+        click.echo("No benchmark was found in both runs.", err=True)
+        sys.exit(1)
+
+    for row in rows:
+        status = "REGRESSED" if row["regressed"] else "ok"
+        click.echo(
+            f"{row['name']:<36}{row['messages_per_s']:>14,.0f} msg/s"
+            f"  time/msg {row['time_change']:+7.1%}  peak RSS {row['rss_change']:+7.1%}"
+            f"  {status}"
+        )
+
+    regressions = sum(row["regressed"] for row in rows)
+    if regressions:
+        click.echo(f"{regressions} of {len(rows)} benchmarks regressed.", err=True)
+        sys.exit(1)
+    click.echo(f"No regression in {len(rows)} benchmarks.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+"""
+Fixtures of the pytest-benchmark suite in `bench_hot_paths.py`.
+
+Corpora are made by repeating the bundled conversations.txt; `--corpus-scales` picks the
+repetitions to benchmark (1 by default, e.g. `--corpus-scales 1,100,1000` for all of them).
+"""
+
+import resource
+import sys
+from pathlib import Path
+from typing import Any, Callable
+
+import pytest
+
+from src.scripts.file_converter import iter_conversations
+
+SAMPLE_FILE = Path(__file__).parent.parent / "conversations.txt"
+
+
+def pytest_addoption(parser: pytest.Parser) -> None:
+    parser.addoption(
+        "--corpus-scales",
+        default="1",
+        help="Comma separated repetitions of conversations.txt to benchmark, e.g. 1,100,1000.",
+    )
+
+
+def pytest_generate_tests(metafunc: pytest.Metafunc) -> None:
+    if "scale" in metafunc.fixturenames:
+        scales = [int(s) for s in metafunc.config.getoption("corpus_scales").split(",")]
+        metafunc.parametrize("scale", scales, ids=[f"{s}x" for s in scales])
+
+
+class Corpus:
+    """A synthetic transcript of `scale` copies of conversations.txt."""
+
+    def __init__(self, path: Path, scale: int, messages: int) -> None:
+        self.path = str(path)
+        self.scale = scale
+        self.messages = messages
+
+
+@pytest.fixture(scope="session")
+def sample_messages() -> int:
+    """The number of messages in conversations.txt."""
+    with open(SAMPLE_FILE, "r", encoding="utf-8") as file:
+        return sum(len(c["messages"]) for c in iter_conversations(file))
+
+
+@pytest.fixture(scope="session")
+def corpora(
+    tmp_path_factory: pytest.TempPathFactory, sample_messages: int
+) -> Callable[[int], Corpus]:
+    """Returns the corpus of a scale, written on first use and kept for the session."""
+    directory = tmp_path_factory.mktemp("corpora")
+    # Conversations are separated by a blank line, so each copy adds the same messages
+    sample = SAMPLE_FILE.read_bytes().strip() + b"\n\n"
+    written: dict[int, Corpus] = {}
+
+    def corpus(scale: int) -> Corpus:
+        if scale not in written:
+            path = directory / f"conversations.{scale}x.txt"
+            with open(path, "wb") as file:
+                for _ in range(scale):
+                    file.write(sample)
+            written[scale] = Corpus(path, scale, scale * sample_messages)
+        return written[scale]
+
+    return corpus
+
+
+def reset_peak_rss() -> bool:
+    """Resets the peak RSS of this process, where the kernel allows it (Linux)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as file:
+            file.write("5")
+        return True
+    except OSError:
+        return False
+
+
+def peak_rss_bytes() -> int:
+    """Returns the peak RSS of this process since it started or was last reset."""
+    try:
+        with open("/proc/self/status", "r") as file:
+            for line in file:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) * 1024
+    except OSError:
+        pass
+    # Kilobytes on Linux, bytes on macOS, and never reset
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+@pytest.fixture
+def measure(benchmark) -> Callable[..., Any]:
+    """
+    Runs a benchmark and records its throughput, per-message overhead and peak RSS.
+
+    The returned function takes the benchmarked function, the number of messages it
+    handles per call and the number of rounds, and returns the result of the last call.
+    The metrics are saved in the `extra_info` of the pytest-benchmark JSON output.
+    """
+
+    def run(function: Callable[[], Any], messages: int, rounds: int = 1) -> Any:
+        rss_reset = reset_peak_rss()
+        result = benchmark.pedantic(function, rounds=rounds, iterations=1)
+        seconds = benchmark.stats.stats.mean
+        benchmark.extra_info.update(
+            {
+                "messages": messages,
+                "messages_per_s": messages / seconds,
+                "us_per_message": seconds / messages * 1e6,
+                "peak_rss_mb": peak_rss_bytes() / 2**20,
+                "peak_rss_since_start": not rss_reset,
+            }
+        )
+        return result
+
+    return run
@@ -0,0 +1,35 @@
+import os
+from contextlib import contextmanager
+from typing import Iterator
+
+from src.app import app, get_moderation_client
+from src.stub_upstream import serve_in_thread
+from src.utils.openai_moderation_handler import ModerationClient
+
+API_KEY = "benchmark"
+
+
+@contextmanager
+def serve_app(moderation_client: ModerationClient) -> Iterator[str]:
+    """
+    Runs the moderation server in a background thread with the given client.
+
+    Args:
+        moderation_client (ModerationClient): The client used by the endpoints.
+
+    Yields:
+        str: The base URL of the running server.
+    """
+    os.environ["CUSTOM_API_KEY"] = API_KEY
+    app.dependency_overrides[get_moderation_client] = lambda: moderation_client
+    try:
+        with serve_in_thread(app) as url:
+            yield url
+    finally:
+        app.dependency_overrides.pop(get_moderation_client, None)
+
+
+def percentile(values: list[float], fraction: float) -> float:
+    """Returns the value below which `fraction` of the sorted `values` fall."""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
@@ -0,0 +1,98 @@
+"""
+Compares the /moderate endpoint with server-side micro-batching on and off: number of
+upstream calls and p50/p99 request latency under the same concurrent load.
+
+Run with `python -m benchmarks.micro_batching`.
+"""
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import requests
+
+from benchmarks.harness import API_KEY, percentile, serve_app
+from src.stub_upstream import StubConfig, serve_stub
+from src.utils.openai_moderation_handler import ModerationClient
+
+
+def run_load(url: str, concurrency: int, requests_per_worker: int) -> list[float]:
+    """
+    Sends requests from `concurrency` parallel clients and returns their latencies in seconds.
+    """
+    local = threading.local()
+    latencies: list[float] = []
+
+    def worker(worker_idx: int) -> None:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        for request_idx in range(requests_per_worker):
+            start = time.perf_counter()
+            response = local.session.post(
+                url,
+                json={
+                    "message_id": f"{worker_idx}-{request_idx}",
+                    "content": f"benchmark message {worker_idx}-{request_idx}",
+                    "categories": ["sexual", "hate", "violence"],
+                },
+                headers={"Authorization": f"Bearer {API_KEY}"},
+            )
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - start)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+
+    return latencies
+
+
+@click.command()
+@click.option(
+    "--latency-ms", default=50, show_default=True, help="Simulated OpenAI latency."
+)
+@click.option("--concurrency", default=32, show_default=True)
+@click.option("--requests-per-worker", default=20, show_default=True)
+@click.option(
+    "--batch-window-ms",
+    default=10.0,
+    show_default=True,
+    help="Aggregation window used for the run with micro-batching on.",
+)
+@click.option("--max-batch-size", default=32, show_default=True)
+def main(
+    latency_ms: int,
+    concurrency: int,
+    requests_per_worker: int,
+    batch_window_ms: float,
+    max_batch_size: int,
+) -> None:
+    """Benchmark upstream calls and latency of /moderate with micro-batching on and off."""
+    for label, window in [("off", 0.0), ("on", batch_window_ms)]:
+        # A fresh stub per run, so its stats only count this run's upstream calls
+        with serve_stub(StubConfig(latency_ms=latency_ms)) as upstream_url:
+            client = ModerationClient(
+                api_key="benchmark",
+                base_url=upstream_url,
+                batch_window_ms=window,
+                max_batch_size=max_batch_size,
+            )
+            with serve_app(client) as base_url:
+                start = time.perf_counter()
+                latencies = run_load(
+                    f"{base_url}/moderate", concurrency, requests_per_worker
+                )
+                elapsed = time.perf_counter() - start
+            stats = requests.get(f"{upstream_url.removesuffix('/v1')}/stats").json()
+
+        click.echo(
+            f"micro-batching {label:>3}: {len(latencies)} requests,"
+            f" {stats['requests']} upstream calls,"
+            f" p50 {percentile(latencies, 0.5) * 1000:.1f} ms,"
+            f" p99 {percentile(latencies, 0.99) * 1000:.1f} ms,"
+            f" {len(latencies) / elapsed:.1f} req/s"
+        )
+
+
+if __name__ == "__main__":
+    main()
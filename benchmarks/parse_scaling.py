@@ -0,0 +1,92 @@
+"""
+Measures how `moderator parse` scales with the number of worker processes on a synthetic
+transcript made by repeating the bundled conversations.txt (1 GB by default).
+
+Run with `python -m benchmarks.parse_scaling`.
+"""
+
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+import click
+
+from src.scripts.file_converter import convert_to_json
+
+SAMPLE_FILE = Path(__file__).parent.parent / "conversations.txt"
+
+
+def default_worker_levels() -> str:
+    """Returns 1, 2, 4, ... up to the number of CPUs, comma separated."""
+    cpus = os.cpu_count() or 1
+    levels = [1]
+    while levels[-1] * 2 < cpus:
+        levels.append(levels[-1] * 2)
+    if cpus > 1:
+        levels.append(cpus)
+    return ",".join(map(str, levels))
+
+
+def write_synthetic_transcript(path: str, size_bytes: int) -> None:
+    """
+    Writes a transcript of about `size_bytes` bytes by repeating the bundled sample.
+    """
+    sample = SAMPLE_FILE.read_bytes().strip() + b"\n\n"
+    with open(path, "wb") as file:
+        for _ in range(max(1, size_bytes // len(sample))):
+            file.write(sample)
+
+
+@click.command()
+@click.option(
+    "--size-mb", default=1024, show_default=True, help="Size of the synthetic input."
+)
+@click.option(
+    "--workers",
+    "worker_levels",
+    default=default_worker_levels(),
+    show_default=True,
+    help="Comma separated numbers of worker processes.",
+)
+@click.option(
+    "--min-speedup",
+    default=0.5,
+    show_default=True,
+    help="Fail unless the speedup at the most workers reaches this fraction of linear scaling.",
+)
+def main(size_mb: int, worker_levels: str, min_speedup: float) -> None:
+    """Benchmark parse time against the number of worker processes."""
+    levels = [int(level) for level in worker_levels.split(",")]
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        input_file = os.path.join(tmp, "conversations.txt")
+        output_file = os.path.join(tmp, "conversations.structured.json")
+        write_synthetic_transcript(input_file, size_mb << 20)
+        size = os.path.getsize(input_file) / (1 << 20)
+
+        for workers in levels:
+            start = time.perf_counter()
+            convert_to_json(input_file, output_file, workers=workers)
+            results[workers] = time.perf_counter() - start
+            click.echo(
+                f"workers: {workers:>3}  {results[workers]:>7.2f} s  {size / results[workers]:>7.1f} MB/s"
+            )
+
+    lowest, highest = levels[0], levels[-1]
+    if highest == lowest:
+        return
+    speedup = results[lowest] / results[highest]
+    expected = min_speedup * highest / lowest
+    click.echo(f"speedup {lowest} -> {highest} workers: {speedup:.1f}x")
+    if speedup < expected:
+        click.echo(
+            f"Parse time does not scale with workers (expected at least {expected:.1f}x).",
+            err=True,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
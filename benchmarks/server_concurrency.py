@@ -0,0 +1,107 @@
+"""
+Regression benchmark for the /moderate endpoint: throughput must grow with the number
+of requests in flight instead of staying flat, which is what happens when the handler
+blocks the event loop while waiting on OpenAI.
+
+Run with `python -m benchmarks.server_concurrency`.
+"""
+
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import click
+import requests
+
+from benchmarks.harness import API_KEY, serve_app
+from src.stub_upstream import StubConfig, serve_stub
+from src.utils.openai_moderation_handler import ModerationClient
+
+
+def measure_throughput(url: str, concurrency: int, requests_per_worker: int) -> float:
+    """
+    Sends requests from `concurrency` parallel clients and returns the requests per second.
+    """
+    local = threading.local()
+
+    def worker(worker_idx: int) -> None:
+        if not hasattr(local, "session"):
+            local.session = requests.Session()
+        for request_idx in range(requests_per_worker):
+            response = local.session.post(
+                url,
+                json={
+                    "message_id": f"{worker_idx}-{request_idx}",
+                    "content": f"benchmark message {worker_idx}-{request_idx}",
+                    "categories": ["sexual", "hate", "violence"],
+                },
+                headers={"Authorization": f"Bearer {API_KEY}"},
+            )
+            response.raise_for_status()
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    return concurrency * requests_per_worker / elapsed
+
+
+@click.command()
+@click.option(
+    "--latency-ms", default=50, show_default=True, help="Simulated OpenAI latency."
+)
+@click.option(
+    "--concurrency",
+    "concurrency_levels",
+    default="1,4,16,64",
+    show_default=True,
+    help="Comma separated numbers of requests kept in flight.",
+)
+@click.option("--requests-per-worker", default=10, show_default=True)
+@click.option(
+    "--min-speedup",
+    # The stub upstream shares the benchmark's cores, so scaling is CPU bound well
+    # below linear; a blocked event loop stays around 1x
+    default=0.125,
+    show_default=True,
+    help="Fail unless throughput at the highest concurrency reaches this fraction of linear scaling.",
+)
+def main(
+    latency_ms: int,
+    concurrency_levels: str,
+    requests_per_worker: int,
+    min_speedup: float,
+) -> None:
+    """Benchmark /moderate throughput against the number of requests in flight."""
+    levels = [int(level) for level in concurrency_levels.split(",")]
+    results = {}
+    with (
+        serve_stub(StubConfig(latency_ms=latency_ms)) as upstream_url,
+        serve_app(
+            ModerationClient(api_key="benchmark", base_url=upstream_url)
+        ) as base_url,
+    ):
+        for concurrency in levels:
+            results[concurrency] = measure_throughput(
+                f"{base_url}/moderate", concurrency, requests_per_worker
+            )
+            click.echo(
+                f"in flight: {concurrency:>5}  {results[concurrency]:>9.1f} req/s"
+            )
+
+    lowest, highest = levels[0], levels[-1]
+    speedup = results[highest] / results[lowest]
+    expected = min_speedup * highest / lowest
+    click.echo(f"speedup {lowest} -> {highest} in flight: {speedup:.1f}x")
+    if speedup < expected:
+        click.echo(
+            f"Throughput does not scale with requests in flight (expected at least {expected:.1f}x).",
+            err=True,
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -10,7 +10,7 @@ setup(
             "moderator=main:cli",
         ],
     },
-    install_requires=["click", "fastapi", "requests", "uvicorn", "openai"],
+    install_requires=["click", "fastapi", "requests", "uvicorn", "openai", "httpx", "numpy"],
     python_requires=">=3.11",
     description="A content moderation tool with a FastAPI server and CLI",
     long_description=open("README.md").read(),
@@ -1,41 +1,204 @@
-from fastapi import FastAPI, HTTPException, Depends
+import asyncio
+import logging
+from contextlib import asynccontextmanager
+from typing import AsyncIterator
+from fastapi import FastAPI, HTTPException, Depends, Request, Response
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 import openai
-from src.config import get_authorization_key
-from src.models import ModerationRequest, ModerationResponse
-from src.utils.openai_moderation_handler import moderate_content
+from src.config import (
+    get_authorization_key,
+    get_batch_window_ms,
+    get_budget_file,
+    get_cache_file,
+    get_cache_ttl,
+    get_max_batch_size,
+    get_max_concurrency,
+    get_max_key_concurrency,
+    get_openai_key_file,
+    get_requests_per_minute,
+    get_tokens_per_minute,
+    get_upstream_url,
+    get_warm_connections,
+)
+from src.models import (
+    BatchModerationItem,
+    BatchModerationRequest,
+    BatchModerationResponse,
+    CacheStatsResponse,
+    KeyUsage,
+    KeyUsageResponse,
+    ModerationRequest,
+    ModerationResponse,
+)
+from src.utils.openai_moderation_handler import (
+    DEFAULT_MAX_BATCH_CHARS,
+    ModerationClient,
+    get_category_scores,
+    iter_batches,
+)
+from src.utils.metrics import (
+    CONTENT_TYPE,
+    CallbackMetric,
+    Gauge,
+    Histogram,
+    Metric,
+    MetricsMiddleware,
+    MetricsRegistry,
+    StageTimer,
+    monitor_event_loop,
+)
+from src.utils.score_cache import ScoreCache
+from src.utils.shared_budget import create_shared_budget
 
+# Moderation client shared by all requests
+_moderation_client: ModerationClient | None = None
+
+# Metrics of the server, exposed on /metrics
+metrics = MetricsRegistry()
+request_duration = metrics.register(
+    Histogram(
+        "moderation_request_duration_seconds",
+        "Time to handle a request.",
+        ["endpoint", "status"],
+    )
+)
+request_stage_duration = metrics.register(
+    Histogram(
+        "moderation_request_stage_duration_seconds",
+        "Time spent by requests in each stage: auth, validation (reading and validating"
+        " the body), upstream (awaiting the moderation API, including retries and"
+        " micro-batching) and serialization (building and encoding the response).",
+        ["endpoint", "stage"],
+    )
+)
+requests_in_flight = metrics.register(
+    Gauge("moderation_requests_in_flight", "Requests being handled.")
+)
+event_loop_lag = metrics.register(
+    Histogram(
+        "moderation_event_loop_lag_seconds",
+        "How late the event loop wakes up from a sleep; high values delay every request.",
+    )
+)
+
+
+def _create_moderation_client() -> ModerationClient:
+    cache_file = get_cache_file()
+    upstream_url = get_upstream_url()
+    cache = (
+        ScoreCache(cache_file, ttl_seconds=get_cache_ttl(), upstream=upstream_url)
+        if cache_file
+        else None
+    )
+    return ModerationClient(
+        get_openai_key_file(),
+        cache=cache,
+        batch_window_ms=get_batch_window_ms(),
+        max_batch_size=get_max_batch_size(),
+        shared_budget=create_shared_budget(
+            get_budget_file(),
+            get_requests_per_minute(),
+            get_tokens_per_minute(),
+            get_max_concurrency(),
+        ),
+        base_url=upstream_url,
+        max_key_concurrency=get_max_key_concurrency(),
+    )
 
-app = FastAPI()
+
+@asynccontextmanager
+async def lifespan(_: FastAPI) -> AsyncIterator[None]:
+    """
+    Creates the shared moderation client and warms its connection pool before the
+    server reports it is ready, then closes it when the server shuts down.
+    """
+    global _moderation_client
+    _moderation_client = _create_moderation_client()
+    await _moderation_client.awarm_up(get_warm_connections())
+    loop_monitor = asyncio.create_task(monitor_event_loop(event_loop_lag))
+    yield
+    loop_monitor.cancel()
+    logging.info(
+        f"Coalesced {_moderation_client.coalesced} duplicate in-flight moderation requests."
+    )
+    await _moderation_client.aclose()
+    _moderation_client.close()
+    _moderation_client = None
+
+
+app = FastAPI(lifespan=lifespan)
+app.add_middleware(
+    MetricsMiddleware,
+    duration=request_duration,
+    stages=request_stage_duration,
+    in_flight=requests_in_flight,
+)
 
 # Security scheme
 security = HTTPBearer()
 
 
-def verify_auth(credentials: HTTPAuthorizationCredentials = Depends(security)):
+async def get_stage_timer(request: Request) -> StageTimer:
+    """
+    Returns the timer of the request's stages, started by the metrics middleware.
+    """
+    return request.state.stage_timer
+
+
+async def verify_auth(
+    credentials: HTTPAuthorizationCredentials = Depends(security),
+    timer: StageTimer = Depends(get_stage_timer),
+):
     """
     Verifies the provided Authorization header.
     """
-    if credentials.credentials != get_authorization_key():
-        raise HTTPException(status_code=401, detail="Invalid API key.")
-    return credentials.credentials
+    # The body was read before the dependencies were solved
+    timer.mark("validation")
+    try:
+        if credentials.credentials != get_authorization_key():
+            raise HTTPException(status_code=401, detail="Invalid API key.")
+        return credentials.credentials
+    finally:
+        timer.mark("auth")
+
+
+async def get_moderation_client() -> ModerationClient:
+    """
+    Returns the moderation client shared across requests so its connections are reused.
+
+    Async so that FastAPI resolves it on the event loop rather than in its threadpool.
+    """
+    global _moderation_client
+    # Created here when the app runs without its lifespan, e.g. in tests
+    if _moderation_client is None:
+        _moderation_client = _create_moderation_client()
+    return _moderation_client
 
 
 @app.post("/moderate", response_model=ModerationResponse)
 async def moderate_message(
-    request: ModerationRequest, _: HTTPAuthorizationCredentials = Depends(verify_auth)
+    request: ModerationRequest,
+    _: HTTPAuthorizationCredentials = Depends(verify_auth),
+    client: ModerationClient = Depends(get_moderation_client),
+    timer: StageTimer = Depends(get_stage_timer),
 ):
+    timer.mark("validation")
     try:
-        moderation_response = moderate_content(content=request.content)
-        if moderation_response:
-            category_scores = moderation_response.category_scores
+        # Awaited so that other requests are served while this one waits on OpenAI
+        moderation_response = await client.amoderate(request.content)
     except openai.OpenAIError as e:
         raise HTTPException(status_code=429, detail=f"OpenAI error: {str(e)}")
+    finally:
+        timer.mark("upstream")
 
-    # Filter the requested categories
+    if moderation_response is None:
+        raise HTTPException(
+            status_code=503, detail="OpenAI moderation is currently unavailable."
+        )
+    # The cache keeps the full score vector, only the response is filtered
+    all_scores = get_category_scores(moderation_response)
     selected_scores = {
-        category: float(getattr(category_scores, category))
-        for category in request.categories
+        category: all_scores[category.value] for category in request.categories
     }
 
     return ModerationResponse(
@@ -43,3 +206,177 @@ async def moderate_message(
         content=request.content,
         category_scores=selected_scores,
     )
+
+
+def _failed_items(
+    messages: list[ModerationRequest], error: str
+) -> list[BatchModerationItem]:
+    return [
+        BatchModerationItem(
+            message_id=message.message_id, content=message.content, error=error
+        )
+        for message in messages
+    ]
+
+
+async def _moderate_chunk(
+    client: ModerationClient, messages: list[ModerationRequest]
+) -> list[BatchModerationItem]:
+    """
+    Moderates a chunk of a batch with one upstream call. When OpenAI rejects the input,
+    falls back to one call per message so that a single bad message only fails its own
+    item; other failures, e.g. exhausted retries on 429s, fail the whole chunk at once
+    rather than multiplying the calls.
+    """
+    try:
+        moderations = await client.amoderate_batch([m.content for m in messages])
+    except openai.BadRequestError:
+        if len(messages) == 1:
+            return _failed_items(messages, "OpenAI rejected this message.")
+        items = await asyncio.gather(
+            *(_moderate_chunk(client, [message]) for message in messages)
+        )
+        return [item for chunk_items in items for item in chunk_items]
+    except (openai.OpenAIError, ValueError):
+        moderations = None
+
+    if moderations is None:
+        return _failed_items(messages, "OpenAI moderation failed for this message.")
+
+    items = []
+    for message, moderation in zip(messages, moderations):
+        all_scores = get_category_scores(moderation)
+        items.append(
+            BatchModerationItem(
+                message_id=message.message_id,
+                content=message.content,
+                category_scores={
+                    category: all_scores[category.value]
+                    for category in message.categories
+                },
+            )
+        )
+    return items
+
+
+@app.post("/moderate/batch", response_model=BatchModerationResponse)
+async def moderate_batch(
+    request: BatchModerationRequest,
+    _: HTTPAuthorizationCredentials = Depends(verify_auth),
+    client: ModerationClient = Depends(get_moderation_client),
+    timer: StageTimer = Depends(get_stage_timer),
+):
+    """
+    Moderates a list of messages, returning one item per message in the same order.
+    Failures are reported on the affected items instead of failing the whole batch.
+    """
+    timer.mark("validation")
+    chunks = list(
+        iter_batches(
+            request.messages,
+            get_max_batch_size(),
+            DEFAULT_MAX_BATCH_CHARS,
+            lambda message: message.content,
+        )
+    )
+    # The chunks are sent to OpenAI concurrently as multi-input calls
+    results = await asyncio.gather(
+        *(_moderate_chunk(client, chunk) for chunk in chunks)
+    )
+    timer.mark("upstream")
+
+    return BatchModerationResponse(
+        results=[item for chunk_items in results for item in chunk_items]
+    )
+
+
+@app.get("/cache/stats", response_model=CacheStatsResponse)
+async def cache_stats(
+    _: HTTPAuthorizationCredentials = Depends(verify_auth),
+    client: ModerationClient = Depends(get_moderation_client),
+):
+    """
+    Reports the hit and miss counters of the moderation result cache.
+    """
+    if client.cache is None:
+        raise HTTPException(status_code=404, detail="Caching is disabled.")
+    return CacheStatsResponse(**client.cache.stats())
+
+
+@app.get("/keys/stats", response_model=KeyUsageResponse)
+async def key_stats(
+    _: HTTPAuthorizationCredentials = Depends(verify_auth),
+    client: ModerationClient = Depends(get_moderation_client),
+):
+    """
+    Reports the requests made with each OpenAI API key of the pool.
+    """
+    return KeyUsageResponse(keys=[KeyUsage(**usage) for usage in client.key_usage()])
+
+
+def _client_metrics(client: ModerationClient) -> list[Metric]:
+    """The metrics read from the moderation client when /metrics is scraped."""
+    # The keys are only loaded by the first upstream call, not by a scrape
+    key_usage = client.key_usage() if "key_pool" in vars(client) else []
+    client_metrics: list[Metric] = [
+        CallbackMetric(
+            "moderation_upstream_requests_total",
+            "Calls made to the moderation API, per key.",
+            "counter",
+            lambda: [({"key": u["key"]}, u["requests"]) for u in key_usage],
+        ),
+        CallbackMetric(
+            "moderation_upstream_rate_limited_total",
+            "429 responses of the moderation API, per key.",
+            "counter",
+            lambda: [({"key": u["key"]}, u["rate_limited"]) for u in key_usage],
+        ),
+        CallbackMetric(
+            "moderation_upstream_retries_total",
+            "Calls to the moderation API retried after a 429 or a connection failure.",
+            "counter",
+            lambda: [({"reason": r}, n) for r, n in client.retries.items()],
+        ),
+        CallbackMetric(
+            "moderation_coalesced_requests_total",
+            "Moderations that shared an identical in-flight upstream call.",
+            "counter",
+            lambda: [({}, client.coalesced)],
+        ),
+    ]
+    if client.cache is not None:
+        stats = client.cache.stats()
+        client_metrics += [
+            CallbackMetric(
+                "moderation_cache_hits_total",
+                "Moderation results found in the cache.",
+                "counter",
+                lambda: [({}, stats["hits"])],
+            ),
+            CallbackMetric(
+                "moderation_cache_misses_total",
+                "Moderation results not found in the cache.",
+                "counter",
+                lambda: [({}, stats["misses"])],
+            ),
+            CallbackMetric(
+                "moderation_cache_hit_ratio",
+                "Fraction of cache lookups that were hits.",
+                "gauge",
+                lambda: [({}, stats["hit_rate"])],
+            ),
+        ]
+    return client_metrics
+
+
+@app.get("/metrics")
+async def get_metrics(
+    _: HTTPAuthorizationCredentials = Depends(verify_auth),
+    client: ModerationClient = Depends(get_moderation_client),
+):
+    """
+    Reports the server metrics in the Prometheus text format.
+    """
+    return Response(
+        content=metrics.render(_client_metrics(client)), media_type=CONTENT_TYPE
+    )
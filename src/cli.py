@@ -1,15 +1,68 @@
 import logging
+import os
 import platform
 import click
 import subprocess
+import uvicorn
+from contextlib import contextmanager
 from pathlib import Path
+from typing import Iterator
 from src.scripts import file_converter
 from src.scripts import content_moderator
 import src.scripts.test_client as test_client
+from src.scripts import load_tester
+from src.utils.category_validator import validate_categories
+from src.utils.columnar import OUTPUT_FORMATS
+from src.utils.micro_batcher import DEFAULT_BATCH_WINDOW_MS
+from src.utils.openai_moderation_handler import (
+    DEFAULT_BATCH_SIZE,
+    DEFAULT_MAX_BATCH_CHARS,
+    ModerationClient,
+)
+from src.utils.score_cache import DEFAULT_CACHE_FILE, DEFAULT_TTL_SECONDS, ScoreCache
+from src.utils.shared_budget import DEFAULT_BUDGET_FILE, create_shared_budget
+from src.utils.result_writers import DEFAULT_REORDER_BUFFER
 
 # Define paths to key files
 PROJECT_ROOT = Path(__file__).parent
 
+# The latency shapes of `src.stub_upstream`, which is only imported by start-stub
+STUB_LATENCY_DISTRIBUTIONS = ["fixed", "uniform", "exponential", "lognormal"]
+
+
+def budget_options(command):
+    """Adds the options of the rate budget shared by all processes on the host."""
+    options = [
+        click.option(
+            "--budget-file",
+            type=click.Path(dir_okay=False),
+            default=DEFAULT_BUDGET_FILE,
+            show_default=True,
+            help="SQLite file holding the rate budget shared by CLI runs and server workers.",
+        ),
+        click.option(
+            "--rpm",
+            type=click.FloatRange(min=0, min_open=True),
+            default=None,
+            help="Upstream requests per minute shared by all processes using --budget-file.",
+        ),
+        click.option(
+            "--tpm",
+            type=click.FloatRange(min=0, min_open=True),
+            default=None,
+            help="Upstream tokens per minute shared by all processes using --budget-file.",
+        ),
+        click.option(
+            "--max-concurrency",
+            type=click.IntRange(min=1),
+            default=None,
+            help="Upstream calls in flight shared by all processes using --budget-file.",
+        ),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
 
 @click.group()
 def cli():
@@ -20,55 +73,392 @@ def cli():
 @click.command()
 @click.argument("input_file", type=click.Path(exists=True))
 @click.argument("output_file", type=click.Path())
-def parse(input_file: str, output_file: str) -> None:
+@click.option(
+    "--workers",
+    type=click.IntRange(min=1),
+    default=1,
+    show_default=True,
+    help="Number of processes parsing parts of the input file in parallel.",
+)
+@click.option(
+    "--incremental",
+    is_flag=True,
+    default=False,
+    help="Parse only the conversations appended since the previous --incremental run and append them to the output.",
+)
+@click.option(
+    "--state-file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Where --incremental keeps the offset and message ID reached. Defaults to <output-file>.state.",
+)
+def parse(
+    input_file: str,
+    output_file: str,
+    workers: int,
+    incremental: bool,
+    state_file: str | None,
+) -> None:
     """Parse the input file."""
     click.echo(f"Parsing file {input_file}.")
+    if incremental:
+        file_converter.convert_to_json_incremental(
+            input_file, output_file, state_file=state_file, workers=workers
+        )
+        return
     # Assuming you have a parse function in one of your scripts
-    file_converter.convert_to_json(input_file, output_file)
+    file_converter.convert_to_json(input_file, output_file, workers=workers)
+
+
+def moderation_options(command):
+    """Adds the options shared by the commands that moderate a file."""
+    options = [
+        click.option("--categories", type=str, required=True),
+        click.option(
+            "--num-threads",
+            type=int,
+            default=15,
+            show_default=True,
+            help="Number of concurrent processing threads, or of in-flight requests with --engine async.",
+        ),
+        click.option(
+            "--engine",
+            type=click.Choice(content_moderator.ENGINES),
+            default="threads",
+            show_default=True,
+            help="Run requests on a thread pool or on a single asyncio event loop.",
+        ),
+        click.option(
+            "--max-key-concurrency",
+            type=click.IntRange(min=1),
+            default=None,
+            help="Upstream calls in flight per API key. Unbounded by default: only 429s lower it.",
+        ),
+        click.option(
+            "--api-key-file",
+            type=click.Path(dir_okay=False),
+            default="openai_key.txt",
+            help="File containing the OpenAI API key, or one key per line to spread requests over several keys."
+            " Only read when neither OPENAI_API_KEYS nor OPENAI_API_KEY is set.",
+        ),
+        click.option(
+            "--upstream-url",
+            envvar="MODERATION_UPSTREAM_URL",
+            default=None,
+            help="Moderation API to call instead of OpenAI's, e.g. a stub from start-stub."
+            " [env: MODERATION_UPSTREAM_URL]",
+        ),
+        click.option(
+            "--batch-size",
+            type=click.IntRange(min=1),
+            default=1,
+            show_default=True,
+            help="Number of messages sent per moderation request.",
+        ),
+        click.option(
+            "--max-batch-chars",
+            type=click.IntRange(min=1),
+            default=DEFAULT_MAX_BATCH_CHARS,
+            show_default=True,
+            help="Maximum total characters of content sent per moderation request.",
+        ),
+        click.option(
+            "--cache-file",
+            type=click.Path(dir_okay=False),
+            default=DEFAULT_CACHE_FILE,
+            show_default=True,
+            help="SQLite file caching moderation results by content, shared with the server.",
+        ),
+        click.option(
+            "--cache-ttl",
+            type=float,
+            default=DEFAULT_TTL_SECONDS,
+            show_default=True,
+            help="Seconds after which a cached moderation result is fetched again.",
+        ),
+        click.option(
+            "--no-cache", is_flag=True, help="Always call the moderation API."
+        ),
+        click.option(
+            "--output-format",
+            type=click.Choice(OUTPUT_FORMATS),
+            default="json",
+            show_default=True,
+            help="json: a JSON file, or JSON Lines when results are streamed; columnar: a directory of"
+            " memory-mappable NumPy arrays (message IDs, float32 scores, contents).",
+        ),
+        click.option(
+            "--reorder-buffer",
+            type=click.IntRange(min=1),
+            default=DEFAULT_REORDER_BUFFER,
+            show_default=True,
+            help="With --ordered, maximum number of completed batches held back to restore input order.",
+        ),
+        click.option(
+            "--journal-file",
+            type=click.Path(dir_okay=False),
+            default=None,
+            help="Journal of completed messages, kept until the run completes. [default: <output_file>.journal]",
+        ),
+        click.option(
+            "--resume",
+            is_flag=True,
+            help="Skip the messages recorded in the journal of an interrupted run and merge its results.",
+        ),
+        budget_options,
+        click.option("--debug", is_flag=True, help="Enable DEBUG mode for logging"),
+        click.option("--verbose", is_flag=True, help="Enable INFO mode for logging"),
+    ]
+    for option in reversed(options):
+        command = option(command)
+    return command
+
+
+def check_reorder_options(streamed: bool, ordered: bool) -> None:
+    """Rejects the ordering options of a run that would silently ignore them."""
+    source = click.get_current_context().get_parameter_source("reorder_buffer")
+    reorder_buffer_given = source != click.core.ParameterSource.DEFAULT
+    if not streamed and (ordered or reorder_buffer_given):
+        raise click.UsageError(
+            "--ordered and --reorder-buffer only apply to --stream runs; add --stream."
+        )
+    if reorder_buffer_given and not ordered:
+        raise click.UsageError("--reorder-buffer requires --ordered.")
+
+
+@contextmanager
+def moderation_client(
+    api_key_file: str,
+    upstream_url: str | None,
+    cache_file: str,
+    cache_ttl: float,
+    no_cache: bool,
+    budget_file: str,
+    rpm: float | None,
+    tpm: float | None,
+    max_concurrency: int | None,
+    max_key_concurrency: int | None,
+    debug: bool,
+    verbose: bool,
+) -> Iterator[ModerationClient]:
+    """Opens the client of a moderation run and reports its counters once it is done."""
+    # Set logging level based on flags
+    if debug:
+        logging.basicConfig(level=logging.DEBUG)
+    elif verbose:
+        logging.basicConfig(level=logging.INFO)
+
+    cache = (
+        None
+        if no_cache
+        else ScoreCache(cache_file, ttl_seconds=cache_ttl, upstream=upstream_url)
+    )
+
+    shared_budget = create_shared_budget(budget_file, rpm, tpm, max_concurrency)
+
+    # One client per run so the key is read once and connections are reused
+    with ModerationClient(
+        api_key_file,
+        cache=cache,
+        shared_budget=shared_budget,
+        base_url=upstream_url,
+        max_key_concurrency=max_key_concurrency,
+    ) as client:
+        yield client
+        if cache is not None:
+            stats = cache.stats()
+            click.echo(
+                f"Cache: {stats['hits']} hits, {stats['misses']} misses"
+                f" ({stats['hit_rate']:.1%} hit rate)."
+            )
+        key_usage = client.key_usage()
+        if len(key_usage) > 1:
+            for usage in key_usage:
+                click.echo(
+                    f"Key {usage['key']}: {usage['requests']} requests,"
+                    f" {usage['rate_limited']} rate limited."
+                )
+        if client.coalesced:
+            click.echo(f"Coalesced {client.coalesced} duplicate in-flight requests.")
+        retries = client.retries
+        if any(retries.values()):
+            click.echo(
+                f"Retried {retries['rate_limit']} rate-limited and"
+                f" {retries['connection']} failed upstream calls."
+            )
 
 
 @click.command()
 @click.argument("input_file", type=click.Path(exists=True))
 @click.argument("output_file", type=click.Path())
-@click.option("--categories", type=str, required=True)
+@moderation_options
 @click.option(
-    "--num-threads",
-    type=int,
-    default=15,
-    show_default=True,
-    help="Number of concurrent processing threads.",
+    "--stream",
+    is_flag=True,
+    help="Read the input incrementally and write each result to a JSON Lines output as it completes.",
 )
 @click.option(
-    "--api-key-file",
-    type=click.Path(exists=True),
-    default="openai_key.txt",
-    help="File containing the OpenAI API key.",
+    "--ordered",
+    is_flag=True,
+    help="With --stream, keep the output in input order.",
 )
-@click.option("--debug", is_flag=True, help="Enable DEBUG mode for logging")
-@click.option("--verbose", is_flag=True, help="Enable INFO mode for logging")
 def moderate(
     input_file: str,
     output_file: str,
     categories: str,
     num_threads: int,
+    engine: str,
+    max_key_concurrency: int | None,
     api_key_file: str,
+    upstream_url: str | None,
+    batch_size: int,
+    max_batch_chars: int,
+    cache_file: str,
+    cache_ttl: float,
+    no_cache: bool,
+    stream: bool,
+    ordered: bool,
+    reorder_buffer: int,
+    journal_file: str | None,
+    resume: bool,
+    output_format: str,
+    budget_file: str,
+    rpm: float | None,
+    tpm: float | None,
+    max_concurrency: int | None,
     debug: bool,
     verbose: bool,
 ) -> None:
     """Moderate a file using the specified moderation categories."""
+    check_reorder_options(stream, ordered)
+    click.echo(
+        f"Moderating file {input_file} with categories {categories} using the {engine} engine"
+        f" with {num_threads} concurrent requests and batches of up to {batch_size} messages."
+    )
+    with moderation_client(
+        api_key_file,
+        upstream_url,
+        cache_file,
+        cache_ttl,
+        no_cache,
+        budget_file,
+        rpm,
+        tpm,
+        max_concurrency,
+        max_key_concurrency,
+        debug,
+        verbose,
+    ) as client:
+        content_moderator.moderate_conversations(
+            input_file,
+            output_file,
+            categories,
+            num_threads,
+            client,
+            batch_size,
+            max_batch_chars,
+            engine,
+            stream,
+            ordered,
+            reorder_buffer,
+            journal_file,
+            resume,
+            output_format,
+        )
 
-    # Set logging level based on flags
-    if debug:
-        logging.basicConfig(level=logging.DEBUG)
-    elif verbose:
-        logging.basicConfig(level=logging.INFO)
 
+@click.command()
+@click.argument("input_file", type=click.Path(exists=True))
+@click.argument("output_file", type=click.Path())
+@moderation_options
+@click.option("--ordered", is_flag=True, help="Keep the output in input order.")
+def pipeline(
+    input_file: str,
+    output_file: str,
+    categories: str,
+    num_threads: int,
+    engine: str,
+    max_key_concurrency: int | None,
+    api_key_file: str,
+    upstream_url: str | None,
+    batch_size: int,
+    max_batch_chars: int,
+    cache_file: str,
+    cache_ttl: float,
+    no_cache: bool,
+    ordered: bool,
+    reorder_buffer: int,
+    journal_file: str | None,
+    resume: bool,
+    output_format: str,
+    budget_file: str,
+    rpm: float | None,
+    tpm: float | None,
+    max_concurrency: int | None,
+    debug: bool,
+    verbose: bool,
+) -> None:
+    """Parse a conversations file and moderate it in one pass, without a structured file."""
+    # The pipeline always streams its results
+    check_reorder_options(True, ordered)
     click.echo(
-        f"Moderating file {input_file} with categories {categories} using {num_threads} threads."
-    )
-    content_moderator.moderate_conversations(
-        input_file, output_file, categories, num_threads, api_key_file
+        f"Parsing and moderating file {input_file} with categories {categories} using the"
+        f" {engine} engine with {num_threads} concurrent requests and batches of up to"
+        f" {batch_size} messages."
     )
+    with moderation_client(
+        api_key_file,
+        upstream_url,
+        cache_file,
+        cache_ttl,
+        no_cache,
+        budget_file,
+        rpm,
+        tpm,
+        max_concurrency,
+        max_key_concurrency,
+        debug,
+        verbose,
+    ) as client:
+        content_moderator.moderate_transcript(
+            input_file,
+            output_file,
+            categories,
+            num_threads,
+            client,
+            batch_size,
+            max_batch_chars,
+            engine,
+            ordered,
+            reorder_buffer,
+            journal_file,
+            resume,
+            output_format,
+        )
+
+
+@click.command()
+@click.argument("input_file", type=click.Path(exists=True))
+@click.argument("output_file", type=click.Path())
+@click.option("--categories", type=str, required=True)
+@click.option(
+    "--cache-file",
+    type=click.Path(dir_okay=False),
+    default=DEFAULT_CACHE_FILE,
+    show_default=True,
+    help="Result cache used for entries moderated before full score vectors were stored.",
+)
+def project(
+    input_file: str, output_file: str, categories: str, cache_file: str
+) -> None:
+    """Re-select categories of a moderated file without new API calls."""
+    click.echo(f"Projecting file {input_file} onto categories {categories}.")
+    cache = ScoreCache(cache_file) if os.path.exists(cache_file) else None
+    try:
+        content_moderator.project_results(input_file, output_file, categories, cache)
+    finally:
+        if cache is not None:
+            cache.close()
 
 
 @click.command()
@@ -76,20 +466,168 @@ def moderate(
 @click.option("--port", default=8000, help="Port for FastAPI server")
 @click.option("--reload", is_flag=True, help="Enable auto-reload for FastAPI server")
 @click.option("--daemon", is_flag=True, help="Run the server as a daemon.")
-def start_server(host: str, port: int, reload: bool, daemon: bool) -> None:
+@click.option(
+    "--cache-file",
+    type=click.Path(dir_okay=False),
+    default=DEFAULT_CACHE_FILE,
+    show_default=True,
+    help="SQLite file caching moderation results by content, shared with the CLI.",
+)
+@click.option(
+    "--cache-ttl",
+    type=float,
+    default=DEFAULT_TTL_SECONDS,
+    show_default=True,
+    help="Seconds after which a cached moderation result is fetched again.",
+)
+@click.option("--no-cache", is_flag=True, help="Always call the moderation API.")
+@click.option(
+    "--batch-window-ms",
+    type=click.FloatRange(min=0),
+    default=DEFAULT_BATCH_WINDOW_MS,
+    show_default=True,
+    help="Collect concurrent /moderate requests for this long into one upstream call (0 disables).",
+)
+@click.option(
+    "--max-batch-size",
+    type=click.IntRange(min=1),
+    default=DEFAULT_BATCH_SIZE,
+    show_default=True,
+    help="Send a collected batch as soon as it holds this many requests.",
+)
+@click.option(
+    "--upstream-url",
+    default=None,
+    help="Moderation API to call instead of OpenAI's, e.g. a stub from start-stub.",
+)
+@click.option(
+    "--max-key-concurrency",
+    type=click.IntRange(min=1),
+    default=None,
+    help="Upstream calls in flight per API key. Unbounded by default: only 429s lower it.",
+)
+@budget_options
+def start_server(
+    host: str,
+    port: int,
+    reload: bool,
+    daemon: bool,
+    cache_file: str,
+    cache_ttl: float,
+    no_cache: bool,
+    batch_window_ms: float,
+    max_batch_size: int,
+    upstream_url: str | None,
+    max_key_concurrency: int | None,
+    budget_file: str,
+    rpm: float | None,
+    tpm: float | None,
+    max_concurrency: int | None,
+) -> None:
     """Start the FastAPI moderation server."""
     command = ["uvicorn", "src.app:app", f"--host={host}", f"--port={port}"]
     if reload:
         command.append("--reload")
+
+    # The server runs in a separate process and reads its settings from the environment
+    env = dict(
+        os.environ,
+        MODERATION_CACHE_FILE="" if no_cache else cache_file,
+        MODERATION_CACHE_TTL=str(cache_ttl),
+        MODERATION_BATCH_WINDOW_MS=str(batch_window_ms),
+        MODERATION_MAX_BATCH_SIZE=str(max_batch_size),
+        MODERATION_BUDGET_FILE=budget_file,
+        MODERATION_RPM=str(rpm or ""),
+        MODERATION_TPM=str(tpm or ""),
+        MODERATION_MAX_CONCURRENCY=str(max_concurrency or ""),
+        MODERATION_MAX_KEY_CONCURRENCY=str(max_key_concurrency or ""),
+    )
+    if upstream_url:
+        env["MODERATION_UPSTREAM_URL"] = upstream_url
     if daemon:
         # Run the command as a daemon
         with open("server.log", "w") as log_file:
-            subprocess.Popen(command, stdout=log_file, stderr=log_file)
+            subprocess.Popen(command, stdout=log_file, stderr=log_file, env=env)
         click.echo(
             f"Server started in daemon mode on {host}:{port}. Logs are being written to server.log"
         )
     else:
-        subprocess.run(command)
+        subprocess.run(command, env=env)
+
+
+@click.command()
+@click.option("--host", default="127.0.0.1", help="Host for the stub")
+@click.option("--port", default=8001, show_default=True, help="Port for the stub")
+@click.option(
+    "--latency-ms",
+    type=click.FloatRange(min=0),
+    default=50.0,
+    show_default=True,
+    help="Mean response latency of the stub.",
+)
+@click.option(
+    "--latency-distribution",
+    type=click.Choice(STUB_LATENCY_DISTRIBUTIONS),
+    default="lognormal",
+    show_default=True,
+    help="Shape of the latencies around their mean.",
+)
+@click.option(
+    "--latency-sigma",
+    type=click.FloatRange(min=0),
+    default=0.5,
+    show_default=True,
+    help="Spread of the lognormal latencies, in log space.",
+)
+@click.option(
+    "--rate-limit-rate",
+    type=click.FloatRange(min=0, max=1),
+    default=0.0,
+    show_default=True,
+    help="Fraction of requests answered 429.",
+)
+@click.option(
+    "--retry-after",
+    type=click.FloatRange(min=0),
+    default=1.0,
+    show_default=True,
+    help="Retry-After of the 429 responses, in seconds.",
+)
+@click.option(
+    "--failure-rate",
+    type=click.FloatRange(min=0, max=1),
+    default=0.0,
+    show_default=True,
+    help="Fraction of requests whose connection is dropped without a response.",
+)
+@click.option("--seed", type=int, default=None, help="Seed to replay the same faults.")
+def start_stub(
+    host: str,
+    port: int,
+    latency_ms: float,
+    latency_distribution: str,
+    latency_sigma: float,
+    rate_limit_rate: float,
+    retry_after: float,
+    failure_rate: float,
+    seed: int | None,
+) -> None:
+    """Start a local stub of the OpenAI moderation API with deterministic scores."""
+    from src.stub_upstream import StubConfig, create_stub_app
+
+    config = StubConfig(
+        latency_ms,
+        latency_distribution,
+        latency_sigma,
+        rate_limit_rate,
+        retry_after,
+        failure_rate,
+        seed,
+    )
+    click.echo(
+        f"Stub moderation API on http://{host}:{port}/v1; pass it as --upstream-url."
+    )
+    uvicorn.run(create_stub_app(config), host=host, port=port)
 
 
 @click.command()
@@ -118,24 +656,159 @@ def stop_server(port: int) -> None:
 
 
 @click.command()
-@click.argument("file_results", type=click.Path(exists=True, dir_okay=False))
+@click.argument("file_results", type=click.Path(exists=True))
 @click.argument("api_key", type=str)
 @click.option("--api_url", default="http://localhost:8000/moderate", type=str)
-@click.option("--categories", type=str)
+@click.option(
+    "--categories",
+    type=str,
+    help="Comma separated categories to compare. [default: the categories in the file]",
+)
 @click.option(
     "--num-threads", default=15, help="Number of threads to use for parallel requests"
 )
+@click.option(
+    "--threshold",
+    type=click.FloatRange(min=0),
+    default=test_client.DEFAULT_THRESHOLD,
+    show_default=True,
+    help="Absolute score discrepancy above which a message is counted.",
+)
+@click.option(
+    "--min-baseline",
+    type=click.FloatRange(min=0, min_open=True),
+    default=test_client.DEFAULT_MIN_BASELINE,
+    show_default=True,
+    help="File scores closer to zero are compared against this for relative discrepancies.",
+)
+@click.option(
+    "--dump",
+    "dump_file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Write the discrepancy of every message and category to this CSV (or .jsonl) file.",
+)
 def test_moderation(
-    file_results: str, api_key: str, api_url: str, categories: str, num_threads: int
+    file_results: str,
+    api_key: str,
+    api_url: str,
+    categories: str,
+    num_threads: int,
+    threshold: float,
+    min_baseline: float,
+    dump_file: str | None,
 ) -> None:
     """Test moderation API by comparing with file."""
     click.echo(f"Testing moderation using file {file_results} against API {api_url}.")
-    test_client.main(file_results, api_url, api_key, categories, num_threads)
+    test_client.main(
+        file_results,
+        api_url,
+        api_key,
+        categories,
+        num_threads,
+        threshold,
+        min_baseline,
+        dump_file,
+    )
+
+
+@click.command()
+@click.argument("input_file", type=click.Path(exists=True))
+@click.argument("api_key", type=str)
+@click.option(
+    "--url", default="http://localhost:8000", show_default=True, help="Server base URL."
+)
+@click.option("--categories", type=str)
+@click.option(
+    "--endpoint",
+    type=click.Choice([*load_tester.ENDPOINTS, "all"]),
+    default="all",
+    show_default=True,
+    help="Endpoint to load: /moderate, /moderate/batch, or each in turn.",
+)
+@click.option(
+    "--mode",
+    type=click.Choice(load_tester.MODES),
+    default="closed",
+    show_default=True,
+    help="closed: --users clients each wait for their response; open: requests start at --rps.",
+)
+@click.option(
+    "--users",
+    type=click.IntRange(min=1),
+    default=16,
+    show_default=True,
+    help="Concurrent clients, and connections, in closed-loop mode. Open-loop mode opens a connection per request in flight.",
+)
+@click.option(
+    "--rps",
+    type=click.FloatRange(min=0, min_open=True),
+    default=50.0,
+    show_default=True,
+    help="Requests started per second in open-loop mode.",
+)
+@click.option(
+    "--duration",
+    type=click.FloatRange(min=0, min_open=True),
+    default=30.0,
+    show_default=True,
+    help="Seconds of load per endpoint.",
+)
+@click.option(
+    "--batch-size",
+    type=click.IntRange(min=1),
+    default=16,
+    show_default=True,
+    help="Messages per request to /moderate/batch.",
+)
+@click.option(
+    "--output",
+    "output_file",
+    type=click.Path(dir_okay=False),
+    default=None,
+    help="Save the latency percentiles, histograms, throughput and error rates as JSON.",
+)
+def loadtest(
+    input_file: str,
+    api_key: str,
+    url: str,
+    categories: str,
+    endpoint: str,
+    mode: str,
+    users: int,
+    rps: float,
+    duration: float,
+    batch_size: int,
+    output_file: str | None,
+) -> None:
+    """Load test the moderation server with messages from a file."""
+    endpoints = list(load_tester.ENDPOINTS) if endpoint == "all" else [endpoint]
+    load = f"at {rps:g} req/s" if mode == "open" else f"with {users} users"
+    click.echo(
+        f"Load testing {url} in {mode}-loop mode {load} for {duration:g} s per endpoint."
+    )
+    load_tester.main(
+        input_file,
+        url,
+        api_key,
+        validate_categories(categories),
+        endpoints,
+        mode,
+        users,
+        rps,
+        duration,
+        batch_size,
+        output_file,
+    )
 
 
 # Add commands to the CLI group
 cli.add_command(parse)
 cli.add_command(moderate)
+cli.add_command(pipeline)
+cli.add_command(project)
 cli.add_command(start_server)
 cli.add_command(stop_server)
+cli.add_command(start_stub)
 cli.add_command(test_moderation)
+cli.add_command(loadtest)
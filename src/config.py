@@ -1,6 +1,78 @@
 import os
 
+from src.utils.micro_batcher import DEFAULT_BATCH_WINDOW_MS
+from src.utils.openai_moderation_handler import DEFAULT_BATCH_SIZE
+from src.utils.score_cache import DEFAULT_CACHE_FILE, DEFAULT_TTL_SECONDS
+from src.utils.shared_budget import DEFAULT_BUDGET_FILE
+
 
 def get_authorization_key() -> str | None:
     """Retrieve the custom authorization key for the FastAPI server."""
     return os.getenv("CUSTOM_API_KEY")
+
+
+def get_openai_key_file() -> str:
+    """Retrieve the path of the file holding the OpenAI API key used by the server."""
+    return os.getenv("OPENAI_KEY_FILE", "openai_key.txt")
+
+
+def get_upstream_url() -> str | None:
+    """Retrieve the moderation API called instead of OpenAI's, e.g. a local stub, if any."""
+    return os.getenv("MODERATION_UPSTREAM_URL") or None
+
+
+def get_warm_connections() -> int:
+    """Retrieve how many OpenAI connections the server opens before it reports ready."""
+    return int(os.getenv("MODERATION_WARM_CONNECTIONS", "4"))
+
+
+def get_cache_file() -> str | None:
+    """Retrieve the SQLite file caching moderation results, or None if caching is disabled."""
+    return os.getenv("MODERATION_CACHE_FILE", DEFAULT_CACHE_FILE) or None
+
+
+def get_cache_ttl() -> float:
+    """Retrieve how many seconds a cached moderation result stays valid."""
+    return float(os.getenv("MODERATION_CACHE_TTL", DEFAULT_TTL_SECONDS))
+
+
+def get_batch_window_ms() -> float:
+    """Retrieve how long concurrent /moderate requests are collected into one upstream call."""
+    return float(os.getenv("MODERATION_BATCH_WINDOW_MS", DEFAULT_BATCH_WINDOW_MS))
+
+
+def get_max_batch_size() -> int:
+    """Retrieve the maximum number of /moderate requests sent in one upstream call."""
+    return int(os.getenv("MODERATION_MAX_BATCH_SIZE", DEFAULT_BATCH_SIZE))
+
+
+def _get_optional_number(name: str) -> float | None:
+    value = os.getenv(name)
+    return float(value) if value else None
+
+
+def get_budget_file() -> str:
+    """Retrieve the SQLite file holding the rate budget shared by all processes on the host."""
+    return os.getenv("MODERATION_BUDGET_FILE", DEFAULT_BUDGET_FILE)
+
+
+def get_requests_per_minute() -> float | None:
+    """Retrieve the host-wide upstream requests per minute, or None for no limit."""
+    return _get_optional_number("MODERATION_RPM")
+
+
+def get_tokens_per_minute() -> float | None:
+    """Retrieve the host-wide upstream tokens per minute, or None for no limit."""
+    return _get_optional_number("MODERATION_TPM")
+
+
+def get_max_concurrency() -> int | None:
+    """Retrieve the host-wide number of upstream calls in flight, or None for no limit."""
+    value = _get_optional_number("MODERATION_MAX_CONCURRENCY")
+    return int(value) if value else None
+
+
+def get_max_key_concurrency() -> int | None:
+    """Retrieve the upstream calls in flight allowed per OpenAI key, or None for no bound."""
+    value = _get_optional_number("MODERATION_MAX_KEY_CONCURRENCY")
+    return int(value) if value else None
@@ -1,6 +1,9 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from enum import Enum
 
+# Most messages accepted by a single /moderate/batch request
+MAX_BATCH_MESSAGES = 2048
+
 
 class Category(str, Enum):
     sexual = "sexual"
@@ -20,3 +23,37 @@ class ModerationResponse(BaseModel):
     message_id: str
     content: str
     category_scores: dict[Category, float]
+
+
+class BatchModerationRequest(BaseModel):
+    messages: list[ModerationRequest] = Field(
+        min_length=1, max_length=MAX_BATCH_MESSAGES
+    )
+
+
+class BatchModerationItem(BaseModel):
+    message_id: str
+    content: str
+    category_scores: dict[Category, float] | None = None
+    error: str | None = None
+
+
+class BatchModerationResponse(BaseModel):
+    results: list[BatchModerationItem]
+
+
+class CacheStatsResponse(BaseModel):
+    hits: int
+    misses: int
+    hit_rate: float
+
+
+class KeyUsage(BaseModel):
+    key: str
+    requests: int
+    rate_limited: int
+    remaining: float | None = None
+
+
+class KeyUsageResponse(BaseModel):
+    keys: list[KeyUsage]
@@ -1,40 +1,107 @@
-from typing import Any
+import asyncio
+from contextlib import contextmanager
+from typing import Any, Iterable, Iterator
 import click
 import json
 import openai
 from openai.types.moderation import Moderation
-from concurrent.futures import ThreadPoolExecutor, as_completed
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    Future,
+    ThreadPoolExecutor,
+    wait,
+)
 
 import tqdm
 
+from src.scripts.file_converter import iter_conversations
 from src.utils.category_validator import validate_categories
-from src.utils.openai_moderation_handler import moderate_content
+from src.utils.openai_moderation_handler import (
+    DEFAULT_MAX_BATCH_CHARS,
+    ModerationClient,
+    get_category_scores,
+    iter_batches,
+)
+from src.utils.journal import Journal
+from src.utils.columnar import iter_result_records
+from src.utils.json_stream import iter_json_array
+from src.utils.result_writers import (
+    DEFAULT_REORDER_BUFFER,
+    ColumnarResultWriter,
+    JsonlResultWriter,
+    ResultCollector,
+    ResultWriter,
+)
+from src.utils.score_cache import ScoreCache
 
+# Engines available to run the moderation requests concurrently
+ENGINES = ["threads", "async"]
 
-def moderate_message(
-    content: str, openai_api_key: str = "openai_key.txt"
-) -> None | Moderation:
+
+def moderate_message(content: str, client: ModerationClient) -> None | Moderation:
     """Send a message content to the OpenAI moderation API.
 
     Args:
         content (str): The content of the message to be moderated.
+        client (ModerationClient): The shared client used to call the moderation API.
 
     Returns:
         openai.Moderation: The response from the API containing category scores.
     """
-    return moderate_content(content=content, openai_key_file=openai_api_key)
+    return client.moderate(content)
+
+
+def moderate_messages(
+    contents: list[str], client: ModerationClient
+) -> None | list[Moderation]:
+    """Send several message contents to the OpenAI moderation API in one request.
+
+    Args:
+        contents (list[str]): The contents of the messages to be moderated.
+        client (ModerationClient): The shared client used to call the moderation API.
+
+    Returns:
+        None | list[Moderation]: The moderation results, in the same order as `contents`.
+    """
+    return client.moderate_batch(contents)
+
+
+def _build_result(
+    message: dict[str, Any], moderation_response: Moderation, categories: list[str]
+) -> dict[str, Any]:
+    """Extract the category scores of a moderated message into a result entry.
+
+    Besides the selected `category_scores`, the entry keeps the full vector in
+    `all_category_scores` so that other categories can be projected later.
+    """
+    all_scores = get_category_scores(moderation_response)
+
+    return {
+        "message_id": message["message_id"],
+        "content": message["content"],
+        "category_scores": select_scores(all_scores, categories),
+        "all_category_scores": all_scores,
+    }
+
+
+def select_scores(
+    all_scores: dict[str, float], categories: list[str]
+) -> dict[str, float]:
+    """Project a full category score vector onto the given categories."""
+    return {category: all_scores[category] for category in categories}
 
 
 def process_message(
     message: dict[str, Any],
     categories: list[str],
-    openai_api_key: str = "openai_key.txt",
+    client: ModerationClient,
 ) -> dict[str, Any]:
     """Process a single message by moderating its content and extracting category scores.
 
     Args:
         message (dict[str, Any]): A dictionary containing the message data.
         categories (list[str]): The list of categories to extract from the moderation response.
+        client (ModerationClient): The shared client used to call the moderation API.
 
     Returns:
         dict[str, Any]: A dictionary containing the message_id, content, and selected category scores.
@@ -43,77 +110,550 @@ def process_message(
     message_id = message["message_id"]
 
     try:
-        moderation_response = moderate_message(content, openai_api_key)
+        moderation_response = moderate_message(content, client)
     except openai.OpenAIError as e:
         click.echo(f"Error moderating message {message_id}: {e}", err=True)
         return {}
 
     if moderation_response:
-        category_scores = moderation_response.category_scores
+        return _build_result(message, moderation_response, categories)
 
-        selected_scores = {
-            category: getattr(category_scores, category) for category in categories
-        }
+    return {}
 
-        return {
-            "message_id": message_id,
-            "content": content,
-            "category_scores": selected_scores,
-        }
 
-    return {}
+def process_batch(
+    messages: list[dict[str, Any]],
+    categories: list[str],
+    client: ModerationClient,
+) -> list[dict[str, Any]]:
+    """Process a batch of messages with a single multi-input moderation request.
+
+    Args:
+        messages (list[dict[str, Any]]): The messages to moderate together.
+        categories (list[str]): The list of categories to extract from the moderation response.
+        client (ModerationClient): The shared client used to call the moderation API.
+
+    Returns:
+        list[dict[str, Any]]: One result per message, mapped back by message_id, or an
+        empty list if the batch could not be moderated.
+    """
+    message_ids = [message["message_id"] for message in messages]
+
+    try:
+        moderation_responses = moderate_messages(
+            [message["content"] for message in messages], client
+        )
+    except openai.OpenAIError as e:
+        click.echo(f"Error moderating messages {message_ids}: {e}", err=True)
+        return []
+
+    if not moderation_responses:
+        return []
+
+    return [
+        _build_result(message, moderation_response, categories)
+        for message, moderation_response in zip(messages, moderation_responses)
+    ]
+
+
+async def aprocess_batch(
+    messages: list[dict[str, Any]],
+    categories: list[str],
+    client: ModerationClient,
+) -> list[dict[str, Any]]:
+    """Async counterpart of `process_batch` that awaits the moderation request.
+
+    Args:
+        messages (list[dict[str, Any]]): The messages to moderate together.
+        categories (list[str]): The list of categories to extract from the moderation response.
+        client (ModerationClient): The shared client used to call the moderation API.
+
+    Returns:
+        list[dict[str, Any]]: One result per message, mapped back by message_id, or an
+        empty list if the batch could not be moderated.
+    """
+    message_ids = [message["message_id"] for message in messages]
+
+    try:
+        moderation_responses = await client.amoderate_batch(
+            [message["content"] for message in messages]
+        )
+    except openai.OpenAIError as e:
+        click.echo(f"Error moderating messages {message_ids}: {e}", err=True)
+        return []
+
+    if not moderation_responses:
+        return []
+
+    return [
+        _build_result(message, moderation_response, categories)
+        for message, moderation_response in zip(messages, moderation_responses)
+    ]
+
+
+def batch_messages(
+    messages: Iterable[dict[str, Any]],
+    batch_size: int,
+    max_batch_chars: int = DEFAULT_MAX_BATCH_CHARS,
+) -> Iterator[list[dict[str, Any]]]:
+    """Group messages into batches bounded by a message count and a character budget.
+
+    A message longer than `max_batch_chars` on its own is sent as a batch of one.
+
+    Args:
+        messages (Iterable[dict[str, Any]]): The messages to group.
+        batch_size (int): The maximum number of messages per batch.
+        max_batch_chars (int): The maximum total content length per batch.
+
+    Yields:
+        list[dict[str, Any]]: The next batch of messages, in input order.
+    """
+    return iter_batches(
+        messages, batch_size, max_batch_chars, lambda message: message["content"]
+    )
 
 
 def process_conversations(
     conversations: list[dict[str, Any]],
     categories: list[str],
     num_threads: int,
-    openai_api_key: str = "openai_key.txt",
+    client: ModerationClient,
+    batch_size: int = 1,
+    max_batch_chars: int = DEFAULT_MAX_BATCH_CHARS,
+    journal: Journal | None = None,
 ) -> list[dict[str, Any]]:
     """Process all messages in the conversations concurrently using threads.
 
+    Messages are handed to the pool only as slots free up, with at most twice
+    `num_threads` batches pending, so memory scales with the concurrency rather than
+    with the number of messages.
+
     Args:
         conversations (list[dict[str, Any]]): A list of conversation dictionaries.
         categories (list[str]): The list of categories to extract from the moderation response.
         num_threads (int): The number of concurrent threads to use.
+        client (ModerationClient): The client shared by all threads.
+        batch_size (int): The number of messages sent per moderation request.
+        max_batch_chars (int): The maximum total content length per moderation request.
+        journal (Journal | None): Records each result as soon as it completes.
 
     Returns:
         list[dict[str, Any]]: A list of dictionaries containing the moderated messages.
     """
-    moderated_messages = []
-    all_messages = [
+    messages = (
         message
         for conversation in conversations
         for message in conversation["messages"]
-    ]
-    total_messages = len(all_messages)
+    )
+    total_messages = sum(
+        len(conversation["messages"]) for conversation in conversations
+    )
+    collector = ResultCollector(journal=journal)
     pbar = tqdm.tqdm(total=total_messages)
 
-    with ThreadPoolExecutor(max_workers=num_threads) as executor:
-        futures = [
-            executor.submit(process_message, message, categories, openai_api_key)
-            for message in all_messages
-        ]
+    try:
+        _process_conversations_threads(
+            messages,
+            categories,
+            num_threads,
+            client,
+            collector,
+            batch_size,
+            max_batch_chars,
+            DEFAULT_REORDER_BUFFER,
+            pbar,
+        )
+    except KeyboardInterrupt:
+        click.echo("Process interrupted. Shutting down...", err=True)
+        raise
+    finally:
+        pbar.close()
+
+    return collector.results
+
+
+def _process_chunk(
+    batch: list[dict[str, Any]],
+    categories: list[str],
+    client: ModerationClient,
+    batch_size: int,
+) -> list[dict[str, Any]]:
+    """Moderate a batch with a multi-input request, or a single message on its own."""
+    if batch_size > 1:
+        return process_batch(batch, categories, client)
+    result = process_message(batch[0], categories, client)
+    return [result] if result else []
 
+
+def _max_pending(concurrency: int, writer: ResultWriter, reorder_buffer: int) -> int:
+    """The number of batches that may be scheduled ahead of the last one written out."""
+    return concurrency + (reorder_buffer if writer.ordered else concurrency)
+
+
+def _process_conversations_threads(
+    messages: Iterable[dict[str, Any]],
+    categories: list[str],
+    num_threads: int,
+    client: ModerationClient,
+    writer: ResultWriter,
+    batch_size: int,
+    max_batch_chars: int,
+    reorder_buffer: int,
+    pbar: tqdm.tqdm,
+) -> None:
+    """Moderate the messages on a thread pool, reading more only as batches complete.
+
+    At most `max_pending` batches are submitted and not yet written out, so neither the
+    executor queue nor the futures grow with the number of messages.
+    """
+    max_pending = _max_pending(num_threads, writer, reorder_buffer)
+    in_flight: dict[Future, tuple[int, int]] = {}
+
+    def collect() -> None:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            seq, batch_length = in_flight.pop(future)
+            writer.write(seq, future.result())
+            pbar.update(n=batch_length)
+
+    with ThreadPoolExecutor(max_workers=num_threads) as executor:
         try:
-            for future in as_completed(futures):
-                result = future.result()
-                if result:
-                    moderated_messages.append(result)
-                pbar.update(n=1)
-        except KeyboardInterrupt:
-            click.echo("Process interrupted. Shutting down...", err=True)
-            # Cancel remaining futures
-            for future in futures:
-                if not future.done():
-                    future.cancel()
-            # Shutdown the executor
+            for seq, batch in enumerate(
+                batch_messages(messages, batch_size, max_batch_chars)
+            ):
+                while seq - writer.flushed >= max_pending:
+                    collect()
+                future = executor.submit(
+                    _process_chunk, batch, categories, client, batch_size
+                )
+                in_flight[future] = (seq, len(batch))
+
+            while in_flight:
+                collect()
+        except BaseException:
+            for future in in_flight:
+                future.cancel()
             executor.shutdown(wait=False)
             raise
-        finally:
-            pbar.close()
 
-    return moderated_messages
+
+async def _process_conversations_async(
+    messages: Iterable[dict[str, Any]],
+    categories: list[str],
+    concurrency: int,
+    client: ModerationClient,
+    writer: ResultWriter,
+    batch_size: int,
+    max_batch_chars: int,
+    reorder_buffer: int,
+    pbar: tqdm.tqdm,
+) -> None:
+    """Moderate the messages with at most `concurrency` requests in flight."""
+    max_pending = _max_pending(concurrency, writer, reorder_buffer)
+    semaphore = asyncio.Semaphore(concurrency)
+    pending: dict[asyncio.Task, tuple[int, int]] = {}
+    errors: list[BaseException] = []
+
+    def on_done(task: asyncio.Task) -> None:
+        semaphore.release()
+        seq, batch_length = pending.pop(task, (0, 0))
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            errors.append(task.exception())
+            return
+        writer.write(seq, task.result())
+        pbar.update(n=batch_length)
+
+    try:
+        for seq, batch in enumerate(
+            batch_messages(messages, batch_size, max_batch_chars)
+        ):
+            # Only schedule a new request once a slot is free
+            await semaphore.acquire()
+            while not errors and seq - writer.flushed >= max_pending:
+                await asyncio.wait(set(pending), return_when=asyncio.FIRST_COMPLETED)
+            if errors:
+                raise errors[0]
+            task = asyncio.create_task(aprocess_batch(batch, categories, client))
+            pending[task] = (seq, len(batch))
+            task.add_done_callback(on_done)
+
+        while pending:
+            await asyncio.wait(set(pending))
+    except BaseException:
+        for task in list(pending):
+            task.cancel()
+        raise
+    finally:
+        # The async connection pool is bound to this event loop
+        await client.aclose()
+
+    if errors:
+        raise errors[0]
+
+
+def process_conversations_async(
+    conversations: list[dict[str, Any]],
+    categories: list[str],
+    concurrency: int,
+    client: ModerationClient,
+    batch_size: int = 1,
+    max_batch_chars: int = DEFAULT_MAX_BATCH_CHARS,
+    journal: Journal | None = None,
+) -> list[dict[str, Any]]:
+    """Process all messages in the conversations concurrently on an asyncio event loop.
+
+    Unlike `process_conversations`, in-flight requests do not each hold an OS thread,
+    so `concurrency` can be raised to thousands.
+
+    Args:
+        conversations (list[dict[str, Any]]): A list of conversation dictionaries.
+        categories (list[str]): The list of categories to extract from the moderation response.
+        concurrency (int): The maximum number of moderation requests in flight.
+        client (ModerationClient): The client shared by all requests.
+        batch_size (int): The number of messages sent per moderation request.
+        max_batch_chars (int): The maximum total content length per moderation request.
+        journal (Journal | None): Records each result as soon as it completes.
+
+    Returns:
+        list[dict[str, Any]]: A list of dictionaries containing the moderated messages.
+    """
+    messages = (
+        message
+        for conversation in conversations
+        for message in conversation["messages"]
+    )
+    total_messages = sum(
+        len(conversation["messages"]) for conversation in conversations
+    )
+    collector = ResultCollector(journal=journal)
+    pbar = tqdm.tqdm(total=total_messages)
+
+    try:
+        asyncio.run(
+            _process_conversations_async(
+                messages,
+                categories,
+                concurrency,
+                client,
+                collector,
+                batch_size,
+                max_batch_chars,
+                DEFAULT_REORDER_BUFFER,
+                pbar,
+            )
+        )
+    except KeyboardInterrupt:
+        click.echo("Process interrupted. Shutting down...", err=True)
+        raise
+    finally:
+        pbar.close()
+
+    return collector.results
+
+
+def iter_messages(input_file: str) -> Iterator[dict[str, Any]]:
+    """Read the messages of a structured file one conversation at a time.
+
+    Args:
+        input_file (str): The path to the structured JSON file containing the conversations.
+
+    Yields:
+        dict[str, Any]: The next message, in file order.
+    """
+    with open(input_file, "r", encoding="utf-8") as file:
+        for conversation in iter_json_array(file):
+            yield from conversation["messages"]
+
+
+def iter_transcript_messages(input_file: str) -> Iterator[dict[str, Any]]:
+    """Parse the messages of a conversation text file one conversation at a time.
+
+    Args:
+        input_file (str): The path to the input text file containing the conversations.
+
+    Yields:
+        dict[str, Any]: The next message, with the same `message_id` as `parse` gives it.
+    """
+    with open(input_file, "r", encoding="utf-8") as file:
+        for conversation in iter_conversations(file):
+            yield from conversation["messages"]
+
+
+def stream_messages(
+    messages: Iterable[dict[str, Any]],
+    categories: list[str],
+    num_threads: int,
+    client: ModerationClient,
+    writer: ResultWriter,
+    batch_size: int = 1,
+    max_batch_chars: int = DEFAULT_MAX_BATCH_CHARS,
+    engine: str = "threads",
+    reorder_buffer: int = DEFAULT_REORDER_BUFFER,
+) -> None:
+    """Moderate messages as they are read and hand each result to `writer` as it completes.
+
+    Only a bounded number of batches is held at any time, in flight or waiting to be
+    written in order, so memory does not grow with the number of messages.
+
+    Args:
+        messages (Iterable[dict[str, Any]]): The messages to moderate, read lazily.
+        categories (list[str]): The list of categories to extract from the moderation response.
+        num_threads (int): The number of concurrent threads, or requests with the async engine.
+        client (ModerationClient): The client shared by all requests.
+        writer (ResultWriter): Receives the moderated messages of each completed batch.
+        batch_size (int): The number of messages sent per moderation request.
+        max_batch_chars (int): The maximum total content length per moderation request.
+        engine (str): Either "threads" or "async".
+        reorder_buffer (int): With an ordered writer, the maximum number of completed
+            batches held back until an earlier batch completes.
+    """
+    pbar = tqdm.tqdm()
+
+    try:
+        if engine == "async":
+            asyncio.run(
+                _process_conversations_async(
+                    messages,
+                    categories,
+                    num_threads,
+                    client,
+                    writer,
+                    batch_size,
+                    max_batch_chars,
+                    reorder_buffer,
+                    pbar,
+                )
+            )
+        else:
+            _process_conversations_threads(
+                messages,
+                categories,
+                num_threads,
+                client,
+                writer,
+                batch_size,
+                max_batch_chars,
+                reorder_buffer,
+                pbar,
+            )
+    except KeyboardInterrupt:
+        click.echo("Process interrupted. Shutting down...", err=True)
+        raise
+    finally:
+        pbar.close()
+
+
+def _resumed_results(
+    journal: Journal, categories: list[str]
+) -> Iterator[dict[str, Any]]:
+    """Read the results recorded by a previous run, projected onto `categories`.
+
+    Entries without a stored score for every category are left out, so that their
+    messages are moderated again.
+    """
+    for result in journal.iter_entries():
+        all_scores = result.get("all_category_scores")
+        if all_scores is None or any(c not in all_scores for c in categories):
+            continue
+        yield {**result, "category_scores": select_scores(all_scores, categories)}
+
+
+def _open_journal(output_file: str, journal_file: str | None, resume: bool) -> Journal:
+    """Returns the journal of a run, warning when a previous one is about to be discarded."""
+    journal = Journal(journal_file or f"{output_file}.journal")
+    if journal.exists() and not resume:
+        click.echo(
+            f"Discarding the journal {journal.path} of a previous run; use --resume to continue it.",
+            err=True,
+        )
+    return journal
+
+
+@contextmanager
+def open_result_writer(
+    output_file: str,
+    output_format: str,
+    categories: list[str],
+    ordered: bool = False,
+    journal: Journal | None = None,
+) -> Iterator[ResultWriter]:
+    """Opens the writer of an output file in a streamable format.
+
+    Args:
+        output_file (str): The output file, or directory for the columnar format.
+        output_format (str): Either "json", for JSON Lines, or "columnar".
+        categories (list[str]): The categories selected for `category_scores`.
+        ordered (bool): Whether to write the batches in input order.
+        journal (Journal | None): The open journal of the run, if any.
+
+    Yields:
+        ResultWriter: The writer, closed when the context exits.
+    """
+    if output_format == "columnar":
+        with ColumnarResultWriter(output_file, categories, ordered, journal) as writer:
+            yield writer
+    else:
+        with open(output_file, "w", encoding="utf-8") as file:
+            yield JsonlResultWriter(file, ordered, journal)
+
+
+def _stream_results(
+    messages: Iterable[dict[str, Any]],
+    output_file: str,
+    categories: list[str],
+    num_threads: int,
+    client: ModerationClient,
+    journal: Journal,
+    resume: bool,
+    batch_size: int = 1,
+    max_batch_chars: int = DEFAULT_MAX_BATCH_CHARS,
+    engine: str = "threads",
+    ordered: bool = False,
+    reorder_buffer: int = DEFAULT_REORDER_BUFFER,
+    output_format: str = "json",
+) -> None:
+    """Moderate messages as they are read and write each result as it completes.
+
+    Results go to a JSON Lines file, or to columnar files with `output_format`. With
+    `resume`, the results recorded in the journal are copied to the output first and
+    their messages are skipped.
+    """
+    done_ids: set[Any] = set()
+    pending = (message for message in messages if message["message_id"] not in done_ids)
+
+    with open_result_writer(
+        output_file, output_format, categories, ordered, journal
+    ) as writer, journal.open(resume):
+        if resume:
+            # Previous results are copied over without being held in memory
+            for result in _resumed_results(journal, categories):
+                writer.extend([result])
+                done_ids.add(result["message_id"])
+            click.echo(f"Resuming: {len(done_ids)} messages already moderated.")
+        try:
+            stream_messages(
+                pending,
+                categories,
+                num_threads,
+                client,
+                writer,
+                batch_size,
+                max_batch_chars,
+                engine,
+                reorder_buffer,
+            )
+        except KeyboardInterrupt:
+            click.echo(
+                f"Moderation process interrupted. Partial results saved to {output_file};"
+                " re-run with --resume to continue.",
+                err=True,
+            )
+            return
+
+    journal.remove()
+    click.echo(f"Moderation complete! Results saved to {output_file}")
 
 
 def moderate_conversations(
@@ -121,33 +661,236 @@ def moderate_conversations(
     output_file: str,
     categories: str,
     num_threads: int,
-    api_key_file: str = "openai_key.txt",
+    client: ModerationClient,
+    batch_size: int = 1,
+    max_batch_chars: int = DEFAULT_MAX_BATCH_CHARS,
+    engine: str = "threads",
+    stream: bool = False,
+    ordered: bool = False,
+    reorder_buffer: int = DEFAULT_REORDER_BUFFER,
+    journal_file: str | None = None,
+    resume: bool = False,
+    output_format: str = "json",
 ) -> None:
     """Moderates the content of each message in the input file using OpenAI Moderation API.
 
+    Every result is also appended to a journal as soon as it completes. The journal is
+    deleted once the output is written; after an interruption, `resume` skips the messages
+    it records and merges its results into the output.
+
     Args:
         input_file (str): The path to the input structured JSON file containing the conversations.
         output_file (str): The path to the output JSON file where the moderated data will be saved.
         categories (str): Comma seperated categories to extract from the moderation results.
         num_threads (int): The number of concurrent threads to use for processing.
-        api_key_file (str): The path to the file containing the OpenAI API key.
+        client (ModerationClient): The client used to call the moderation API.
+        batch_size (int): The number of messages sent per moderation request.
+        max_batch_chars (int): The maximum total content length per moderation request.
+        engine (str): Either "threads" or "async"; with "async", `num_threads` is the
+            number of requests kept in flight on a single event loop.
+        stream (bool): Read the input incrementally and write each result to a JSON Lines
+            output as soon as it completes, in constant memory.
+        ordered (bool): With `stream`, keep the output in input order.
+        reorder_buffer (int): With `ordered`, the maximum number of completed batches
+            held back until an earlier batch completes.
+        journal_file (str | None): The journal path, `<output_file>.journal` by default.
+        resume (bool): Continue the run recorded in the journal instead of starting over.
+        output_format (str): "json" for a JSON file, or JSON Lines with `stream`; "columnar"
+            for a directory of memory-mappable NumPy columns.
     """
 
+    # validate provided categories
+    validated_categories = validate_categories(categories)
+
+    journal = _open_journal(output_file, journal_file, resume)
+
+    if stream:
+        _stream_results(
+            iter_messages(input_file),
+            output_file,
+            validated_categories,
+            num_threads,
+            client,
+            journal,
+            resume,
+            batch_size,
+            max_batch_chars,
+            engine,
+            ordered,
+            reorder_buffer,
+            output_format,
+        )
+        return
+
+    resumed = _resumed_results(journal, validated_categories) if resume else iter(())
+    done_ids: set[Any] = set()
+
     with open(input_file, "r", encoding="utf-8") as file:
         conversations = json.load(file)
 
-    # validate provided categories
+    resumed_results = list(resumed)
+    done_ids.update(result["message_id"] for result in resumed_results)
+    if resume:
+        click.echo(f"Resuming: {len(done_ids)} messages already moderated.")
+    if done_ids:
+        conversations = [
+            {
+                **conversation,
+                "messages": [
+                    message
+                    for message in conversation["messages"]
+                    if message["message_id"] not in done_ids
+                ],
+            }
+            for conversation in conversations
+        ]
+
+    process = (
+        process_conversations_async if engine == "async" else process_conversations
+    )
+
+    with journal.open(resume):
+        try:
+            moderated_messages = process(
+                conversations,
+                validated_categories,
+                num_threads,
+                client,
+                batch_size,
+                max_batch_chars,
+                journal=journal,
+            )
+        except KeyboardInterrupt:
+            click.echo(
+                "Moderation process interrupted. Re-run with --resume to continue.",
+                err=True,
+            )
+            return
+
+    if output_format == "columnar":
+        with open_result_writer(
+            output_file, output_format, validated_categories
+        ) as writer:
+            writer.extend(resumed_results + moderated_messages)
+    else:
+        with open(output_file, "w", encoding="utf-8") as file:
+            json.dump(
+                resumed_results + moderated_messages,
+                file,
+                ensure_ascii=False,
+                indent=4,
+            )
+
+    journal.remove()
+    click.echo(f"Moderation complete! Results saved to {output_file}")
+
+
+def moderate_transcript(
+    input_file: str,
+    output_file: str,
+    categories: str,
+    num_threads: int,
+    client: ModerationClient,
+    batch_size: int = 1,
+    max_batch_chars: int = DEFAULT_MAX_BATCH_CHARS,
+    engine: str = "threads",
+    ordered: bool = False,
+    reorder_buffer: int = DEFAULT_REORDER_BUFFER,
+    journal_file: str | None = None,
+    resume: bool = False,
+    output_format: str = "json",
+) -> None:
+    """Parses a conversation text file and moderates its messages in a single pass.
+
+    Messages go from the parser straight to the moderation requests, so the first
+    upstream calls are made while the rest of the file is still being parsed and no
+    structured file is written in between. Results are appended to a JSON Lines output
+    as they complete, and journaled as with `moderate_conversations`; message IDs are
+    the same as those of `parse`, so an interrupted run can be resumed.
+
+    Args:
+        input_file (str): The path to the input text file containing the conversations.
+        output_file (str): The path to the JSON Lines file where the moderated data will be saved.
+        categories (str): Comma seperated categories to extract from the moderation results.
+        num_threads (int): The number of concurrent threads, or requests with the async engine.
+        client (ModerationClient): The client used to call the moderation API.
+        batch_size (int): The number of messages sent per moderation request.
+        max_batch_chars (int): The maximum total content length per moderation request.
+        engine (str): Either "threads" or "async".
+        ordered (bool): Keep the output in input order.
+        reorder_buffer (int): With `ordered`, the maximum number of completed batches
+            held back until an earlier batch completes.
+        journal_file (str | None): The journal path, `<output_file>.journal` by default.
+        resume (bool): Continue the run recorded in the journal instead of starting over.
+        output_format (str): "json" for JSON Lines, or "columnar" for a directory of
+            memory-mappable NumPy columns.
+    """
     validated_categories = validate_categories(categories)
 
-    try:
-        moderated_messages = process_conversations(
-            conversations, validated_categories, num_threads, api_key_file
+    _stream_results(
+        iter_transcript_messages(input_file),
+        output_file,
+        validated_categories,
+        num_threads,
+        client,
+        _open_journal(output_file, journal_file, resume),
+        resume,
+        batch_size,
+        max_batch_chars,
+        engine,
+        ordered,
+        reorder_buffer,
+        output_format,
+    )
+
+
+def project_results(
+    input_file: str,
+    output_file: str,
+    categories: str,
+    cache: ScoreCache | None = None,
+) -> None:
+    """Derives the scores of other categories from a moderated file without calling the API.
+
+    The full score vector is taken from each entry's `all_category_scores`, or, for files
+    written before it was stored, from the moderation result cache.
+
+    Args:
+        input_file (str): The path to the moderated JSON, JSON Lines or columnar output.
+        output_file (str): The path to the JSON file with the projected scores.
+        categories (str): Comma seperated categories to keep in `category_scores`.
+        cache (ScoreCache | None): Cache to look up entries without a stored score vector.
+    """
+    results = list(iter_result_records(input_file))
+
+    validated_categories = validate_categories(categories)
+
+    projected = []
+    for result in results:
+        all_scores = result.get("all_category_scores")
+        if all_scores is None and cache is not None:
+            moderation = cache.get(result["content"])
+            if moderation is not None:
+                all_scores = get_category_scores(moderation)
+
+        if all_scores is None or any(c not in all_scores for c in validated_categories):
+            continue
+
+        projected.append(
+            {
+                **result,
+                "category_scores": select_scores(all_scores, validated_categories),
+                "all_category_scores": all_scores,
+            }
         )
-    except KeyboardInterrupt:
-        click.echo("Moderation process interrupted.", err=True)
-        return
 
     with open(output_file, "w", encoding="utf-8") as file:
-        json.dump(moderated_messages, file, ensure_ascii=False, indent=4)
+        json.dump(projected, file, ensure_ascii=False, indent=4)
 
-    click.echo(f"Moderation complete! Results saved to {output_file}")
+    skipped = len(results) - len(projected)
+    if skipped:
+        click.echo(
+            f"{skipped} messages have no stored scores for {validated_categories} and were skipped.",
+            err=True,
+        )
+    click.echo(f"Projection complete! Results saved to {output_file}")
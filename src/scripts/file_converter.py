@@ -1,14 +1,125 @@
 import click
+import hashlib
 import json
+import math
+import mmap
+import os
+import re
 import uuid
-from typing import Any, Optional
+from collections import deque
+from concurrent.futures import Executor, Future, ProcessPoolExecutor
+from dataclasses import asdict, dataclass
+from itertools import accumulate
+from typing import Any, Callable, Iterable, Iterator, Optional, TextIO, TypeVar
+
+# Namespace of the conversation IDs, which are derived from the conversation content
+CONVERSATION_NAMESPACE = uuid.uuid5(uuid.NAMESPACE_URL, "moderator/conversations")
+
+# Upper bound of the part of the transcript parsed by one worker task
+MAX_CHUNK_BYTES = 32 << 20
+
+# Number of chunks per worker, so that workers given faster chunks are not left idle
+_CHUNKS_PER_WORKER = 4
+
+# Chunks submitted per worker ahead of the one being written, which bounds the memory
+# held by parsed chunks to a few of them whatever the size of the input
+_PENDING_CHUNKS_PER_WORKER = 2
+
+# Input bytes hashed before the parsed offset to notice a rewritten input
+_CHECKPOINT_BYTES = 4096
+
+_ELEMENT_SEPARATOR = ",\n    "
+
+# The end of a blank line, i.e. of a conversation
+_CONVERSATION_BREAK = re.compile(rb"\n[ \t\r\f\v]*\n")
+
+
+def conversation_id(first_message_id: int, lines: list[str]) -> str:
+    """Derives a stable ID for a conversation from its position and content.
+
+    The same transcript therefore always yields the same IDs, while a conversation
+    repeated verbatim later in the transcript still gets an ID of its own.
+
+    Args:
+        first_message_id (int): The `message_id` of the first message of the conversation.
+        lines (list[str]): The raw lines of the conversation.
+
+    Returns:
+        str: A UUID (version 5) of the conversation.
+    """
+    return str(
+        uuid.uuid5(CONVERSATION_NAMESPACE, f"{first_message_id}\n" + "\n".join(lines))
+    )
+
+
+def _parse_line(line: str) -> tuple[int, Optional[str], str]:
+    """Splits a transcript line into its role, character name and content."""
+    if line.startswith("USER:"):
+        return 0, None, line.split("USER:", 1)[1].strip()
+    character_name, content = line.split(":", 1)
+    return 1, character_name.strip().title(), content.strip()
+
+
+def _build_conversation(lines: list[str], first_message_id: int) -> dict[str, Any]:
+    """Builds a structured conversation from its raw lines."""
+    character_name: Optional[str] = None
+    messages: list[dict[str, Any]] = []
+
+    for message_id, line in enumerate(lines, first_message_id):
+        role_idx, name, content = _parse_line(line)
+        if name is not None:
+            character_name = name
+        messages.append(
+            {"message_id": message_id, "role_idx": role_idx, "content": content}
+        )
+
+    return {
+        "conversation_id": conversation_id(first_message_id, lines),
+        "character_name": character_name,
+        "messages": messages,
+    }
+
+
+def iter_conversations(
+    lines: Iterable[str], first_message_id: int = 0
+) -> Iterator[dict[str, Any]]:
+    """Parses conversations from transcript lines, one conversation at a time.
+
+    Conversations are separated by blank lines. Each one is yielded as soon as its closing
+    blank line (or the end of the input) is read, so only the current conversation is held
+    in memory.
+
+    Args:
+        lines (Iterable[str]): The lines of the transcript, e.g. an open text file.
+        first_message_id (int): The `message_id` of the first message.
+
+    Yields:
+        dict[str, Any]: The next conversation with fields `conversation_id`,
+        `character_name`, and `messages`. Each message contains `message_id`, `role_idx`,
+        and `content`.
+    """
+    message_id: int = first_message_id
+    pending: list[str] = []
+
+    for line in lines:
+        line = line.strip()
+        if line:
+            pending.append(line)
+            continue
+        if pending:
+            yield _build_conversation(pending, message_id)
+            message_id += len(pending)
+            pending = []
+
+    if pending:
+        yield _build_conversation(pending, message_id)
 
 
 def _parse_conversations(input_file: str) -> list[dict[str, Any]]:
     """Parses a conversation text file into a structured list of conversations.
 
     Each conversation consists of multiple messages between a user and a character.
-    The function identifies each conversation, assigns a unique ID to the conversation,
+    The function identifies each conversation, assigns it an ID derived from its content,
     and assigns unique IDs to each message.
 
     Args:
@@ -19,65 +130,352 @@ def _parse_conversations(input_file: str) -> list[dict[str, Any]]:
         a conversation with fields `conversation_id`, `character_name`, and `messages`.
         Each message contains `message_id`, `role_idx`, and `content`.
     """
-    conversations: list[dict[str, Any]] = []
-    message_id_counter: int = 0
-
     with open(input_file, "r", encoding="utf-8") as file:
-        file_content: str = file.read()
+        return list(iter_conversations(file))
 
-    raw_conversations: list[str] = file_content.strip().split("\n\n")
 
-    for raw_conversation in raw_conversations:
-        lines: list[str] = raw_conversation.strip().split("\n")
-        if not lines:
-            continue
+def _encode_element(conversation: dict[str, Any]) -> str:
+    """Encodes a conversation as an element of an array indented by `write_json_array`."""
+    return json.dumps(conversation, ensure_ascii=False, indent=4).replace(
+        "\n", "\n    "
+    )
 
-        character_name: Optional[str] = None
-        messages: list[dict[str, Any]] = []
-
-        for line in lines:
-            if line.startswith("USER:"):
-                role_idx: int = 0
-                content: str = line.split("USER:", 1)[1].strip()
-            else:
-                role_idx = 1
-                character_name, content = line.split(":", 1)
-                character_name = character_name.strip().title()
-                content = content.strip()
-
-            messages.append(
-                {
-                    "message_id": message_id_counter,
-                    "role_idx": role_idx,
-                    "content": content,
-                }
-            )
-            message_id_counter += 1
-
-        conversation: dict[str, Any] = {
-            "conversation_id": str(uuid.uuid4()),
-            "character_name": character_name,
-            "messages": messages,
-        }
-        conversations.append(conversation)
 
-    return conversations
+def _write_json_elements(
+    elements: Iterable[str], file: TextIO, continued: bool = False
+) -> int:
+    """Writes encoded array elements, or runs of them, as an indented JSON array.
+
+    With `continued`, the file already ends with the opening bracket and elements of the
+    array, and the new elements are added after them.
+    """
+    count = 0
+    if not continued:
+        file.write("[")
+    for element in elements:
+        file.write(_ELEMENT_SEPARATOR if count or continued else "\n    ")
+        file.write(element)
+        count += 1
+    file.write("\n]" if count or continued else "]")
+    return count
+
+
+def write_json_array(conversations: Iterable[dict[str, Any]], file: TextIO) -> int:
+    """Writes conversations as an indented JSON array, one conversation at a time.
+
+    The output is the same as `json.dump(list(conversations), file, indent=4)` without
+    holding the whole list in memory.
+
+    Args:
+        conversations (Iterable[dict[str, Any]]): The conversations to write.
+        file (TextIO): The open output file.
+
+    Returns:
+        int: The number of conversations written.
+    """
+    return _write_json_elements(map(_encode_element, conversations), file)
+
+
+def split_at_conversations(
+    input_file: str, chunks: int, start: int = 0, end: int | None = None
+) -> list[tuple[int, int]]:
+    """Splits a transcript into byte ranges that each hold whole conversations.
+
+    The file is memory-mapped and each cut is moved forward to the end of the next blank
+    line, so no conversation (nor multi-byte character) is split between two ranges.
+
+    Args:
+        input_file (str): The path to the transcript.
+        chunks (int): The number of ranges wanted; fewer are returned for small files.
+        start (int): The offset to split from, at the start of a conversation.
+        end (int | None): The offset to split up to, the end of the file by default.
+
+    Returns:
+        list[tuple[int, int]]: The `(start, end)` byte offsets of the ranges, in order.
+    """
+    end = os.path.getsize(input_file) if end is None else end
+    if start >= end:
+        return []
+
+    ranges: list[tuple[int, int]] = []
+    with open(input_file, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        origin, size = start, end - start
+        for idx in range(1, chunks):
+            cut = max(start, origin + size * idx // chunks)
+            match = _CONVERSATION_BREAK.search(data, cut, end)
+            if match is None:
+                break
+            if match.end() > start:
+                ranges.append((start, match.end()))
+                start = match.end()
+        if start < end:
+            ranges.append((start, end))
+    return ranges
+
 
+def _last_conversation_break(input_file: str, start: int) -> int:
+    """Returns the offset after the last blank line of a transcript, or `start` if none."""
+    if os.path.getsize(input_file) <= start:
+        return start
+    with open(input_file, "rb") as file, mmap.mmap(
+        file.fileno(), 0, access=mmap.ACCESS_READ
+    ) as data:
+        line_end = data.rfind(b"\n", start)
+        while line_end > start:
+            line_start = data.rfind(b"\n", start, line_end)
+            if line_start == -1:
+                break
+            if not data[line_start + 1 : line_end].strip():
+                return line_end + 1
+            line_end = line_start
+    return start
 
-def convert_to_json(input_file: str, output_file: str) -> None:
+
+def _iter_range_lines(input_file: str, start: int, end: int) -> Iterator[str]:
+    """Reads the lines of a byte range of the transcript, one at a time."""
+    with open(input_file, "rb") as file:
+        file.seek(start)
+        position = start
+        # The ranges were cut after "\n", so split on it only
+        for line in file:
+            if position >= end:
+                break
+            position += len(line)
+            yield line.decode("utf-8")
+
+
+def _count_messages(input_file: str, start: int, end: int) -> int:
+    """Counts the messages in a byte range of the transcript."""
+    return sum(1 for line in _iter_range_lines(input_file, start, end) if line.strip())
+
+
+def _encode_range(
+    input_file: str, start: int, end: int, first_message_id: int
+) -> tuple[str, int]:
+    """Parses a byte range of the transcript into a run of encoded array elements.
+
+    Returns:
+        tuple[str, int]: The run of elements and its number of conversations.
+    """
+    lines = _iter_range_lines(input_file, start, end)
+    elements = [
+        _encode_element(conversation)
+        for conversation in iter_conversations(lines, first_message_id)
+    ]
+    return _ELEMENT_SEPARATOR.join(elements), len(elements)
+
+
+T = TypeVar("T")
+
+
+def _map_bounded(
+    executor: Executor,
+    function: Callable[..., T],
+    arguments: Iterable[tuple[Any, ...]],
+    window: int,
+) -> Iterator[T]:
+    """Like `executor.map`, but submits at most `window` calls ahead of the result yielded.
+
+    `executor.map` submits every call up front, so the results that complete before the
+    consumer reads them are all held in memory at once.
+    """
+    pending: deque[Future[T]] = deque()
+    for args in arguments:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(function, *args))
+    while pending:
+        yield pending.popleft().result()
+
+
+def _iter_encoded(
+    input_file: str, start: int, end: int, first_message_id: int, workers: int
+) -> Iterator[tuple[str, int, int]]:
+    """Parses a byte range of the transcript into encoded array elements, in order.
+
+    With more than one worker, the range is split at blank lines and the parts are parsed
+    in a process pool. A first pass counts the messages of every part, so that each worker
+    knows the `message_id` its part starts at and the IDs are the same as in a sequential
+    parse. Only a few parts per worker are submitted ahead of the one being yielded, so
+    parsed parts never pile up in memory when the writer is slower than the workers.
+
+    Yields:
+        tuple[str, int, int]: An encoded conversation, or a run of them, and its numbers
+        of conversations and messages.
+    """
+    if workers <= 1:
+        lines = _iter_range_lines(input_file, start, end)
+        for conversation in iter_conversations(lines, first_message_id):
+            yield _encode_element(conversation), 1, len(conversation["messages"])
+        return
+
+    chunks = max(
+        workers * _CHUNKS_PER_WORKER, math.ceil((end - start) / MAX_CHUNK_BYTES)
+    )
+    ranges = split_at_conversations(input_file, chunks, start, end)
+    starts, ends = [start for start, _ in ranges], [end for _, end in ranges]
+    paths = [input_file] * len(ranges)
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        counts = list(executor.map(_count_messages, paths, starts, ends))
+        first_message_ids = [
+            first_message_id + offset for offset in [0, *accumulate(counts)][:-1]
+        ]
+        encoded = _map_bounded(
+            executor,
+            _encode_range,
+            zip(paths, starts, ends, first_message_ids),
+            workers * _PENDING_CHUNKS_PER_WORKER,
+        )
+        for (elements, conversations), messages in zip(encoded, counts):
+            if elements:
+                yield elements, conversations, messages
+
+
+def convert_to_json(input_file: str, output_file: str, workers: int = 1) -> None:
     """Converts a conversation text file to a structured JSON file.
 
-    This function reads the input conversation text file, processes it into a structured
-    format, and then writes the output to a JSON file. The structure includes unique IDs for
-    each conversation and each message, with character names converted to title case.
+    This function streams the input conversation text file through the parser and writes
+    each conversation to the output JSON file as soon as it is parsed, so files of any size
+    are converted in constant memory. The structure includes stable IDs for each
+    conversation and each message, with character names converted to title case.
+
+    With more than one worker, the file is split at blank lines and the parts are parsed
+    in a process pool; the output is the same as with a single worker.
 
     Args:
         input_file (str): The path to the input text file containing the conversations.
         output_file (str): The path to the output JSON file where the structured data will be saved.
+        workers (int): The number of processes parsing the file.
     """
-    conversations: list[dict[str, Any]] = _parse_conversations(input_file)
-
-    with open(output_file, "w", encoding="utf-8") as file:
-        json.dump(conversations, file, ensure_ascii=False, indent=4)
+    encoded = _iter_encoded(
+        input_file, 0, os.path.getsize(input_file), 0, workers=workers
+    )
+    with open(output_file, "w", encoding="utf-8") as target:
+        _write_json_elements((elements for elements, _, _ in encoded), target)
 
     click.echo(f"Conversion complete! Structured JSON saved to {output_file}")
+
+
+@dataclass
+class ParseState:
+    """How far an incremental parse got, kept in a sidecar file between runs."""
+
+    offset: int = 0
+    next_message_id: int = 0
+    output_size: int = 0
+    # Hash of the input bytes just before `offset`, to notice a rewritten input
+    checkpoint: str = ""
+
+    @classmethod
+    def load(cls, path: str) -> "ParseState | None":
+        """Reads the state of the previous run, or None if there was none."""
+        if not os.path.exists(path):
+            return None
+        with open(path, "r", encoding="utf-8") as file:
+            return cls(**json.load(file))
+
+    def save(self, path: str) -> None:
+        """Writes the state, replacing the previous one at once."""
+        with open(f"{path}.tmp", "w", encoding="utf-8") as file:
+            json.dump(asdict(self), file)
+        os.replace(f"{path}.tmp", path)
+
+
+def _checkpoint(input_file: str, offset: int) -> str:
+    """Hashes the input bytes just before `offset`."""
+    with open(input_file, "rb") as file:
+        file.seek(max(0, offset - _CHECKPOINT_BYTES))
+        return hashlib.sha256(file.read(offset - file.tell())).hexdigest()
+
+
+def _input_was_rewritten(input_file: str, state: ParseState) -> bool:
+    """Returns whether the input parsed by the previous run was changed, not appended to."""
+    if os.path.getsize(input_file) < state.offset:
+        return True
+    return _checkpoint(input_file, state.offset) != state.checkpoint
+
+
+def _open_for_append(output_file: str, state: ParseState) -> tuple[TextIO, bool]:
+    """Opens the output of the previous run with its closing bracket removed.
+
+    Returns:
+        tuple[TextIO, bool]: The file, positioned at its end, and whether the array
+        already holds conversations.
+    """
+    output_size = os.path.getsize(output_file) if os.path.exists(output_file) else None
+    if output_size != state.output_size:
+        raise click.ClickException(
+            f"{output_file} changed since the last incremental parse; parse the whole "
+            "input again without --incremental."
+        )
+    with open(output_file, "rb+") as file:
+        file.seek(-2, os.SEEK_END)
+        continued = file.read(2) == b"\n]"
+        file.truncate(state.output_size - 2 if continued else 0)
+    return open(output_file, "a", encoding="utf-8"), continued
+
+
+def convert_to_json_incremental(
+    input_file: str, output_file: str, state_file: str | None = None, workers: int = 1
+) -> int:
+    """Parses only the conversations appended to a transcript since the previous run.
+
+    The byte offset reached and the next `message_id` are kept in a sidecar state file,
+    and the new conversations are appended to the JSON array written by the previous run,
+    so a growing transcript is parsed in time proportional to what was added. The last
+    conversation is held back until a blank line closes it, as more of its messages may
+    still be appended. Without a state file, the whole input is parsed.
+
+    Args:
+        input_file (str): The path to the input text file containing the conversations.
+        output_file (str): The path to the output JSON file the conversations are appended to.
+        state_file (str | None): The state path, `<output_file>.state` by default.
+        workers (int): The number of processes parsing the new part of the file.
+
+    Returns:
+        int: The number of conversations appended.
+
+    Raises:
+        click.ClickException: If the input was rewritten or the output was changed since
+            the previous run.
+    """
+    state_file = state_file or f"{output_file}.state"
+    state = ParseState.load(state_file)
+    if state is not None and _input_was_rewritten(input_file, state):
+        raise click.ClickException(
+            f"{input_file} was rewritten since the last incremental parse; parse it "
+            "again without --incremental."
+        )
+
+    start = state.offset if state else 0
+    end = _last_conversation_break(input_file, start)
+    first_message_id = state.next_message_id if state else 0
+    conversations = messages = 0
+
+    def elements() -> Iterator[str]:
+        nonlocal conversations, messages
+        for encoded, encoded_conversations, encoded_messages in _iter_encoded(
+            input_file, start, end, first_message_id, workers=workers
+        ):
+            conversations += encoded_conversations
+            messages += encoded_messages
+            yield encoded
+
+    if state is None:
+        target, continued = open(output_file, "w", encoding="utf-8"), False
+    else:
+        target, continued = _open_for_append(output_file, state)
+    with target:
+        _write_json_elements(elements(), target, continued)
+
+    ParseState(
+        offset=end,
+        next_message_id=first_message_id + messages,
+        output_size=os.path.getsize(output_file),
+        checkpoint=_checkpoint(input_file, end),
+    ).save(state_file)
+    click.echo(f"Appended {conversations} new conversation(s) to {output_file}")
+    return conversations
@@ -0,0 +1,426 @@
+import asyncio
+import itertools
+import json
+import time
+from dataclasses import dataclass, field
+from typing import Any, Iterator
+
+import click
+import httpx
+import numpy as np
+
+from src.scripts.content_moderator import iter_transcript_messages
+from src.utils.columnar import iter_result_records
+
+# Ways of generating load: a fixed number of users each waiting for its previous
+# response, or requests started at a fixed rate whatever the responses
+MODES = ["closed", "open"]
+
+# Endpoints that can be load tested, by name
+ENDPOINTS = {"moderate": "/moderate", "batch": "/moderate/batch"}
+
+PERCENTILES = [50, 90, 99, 99.9]
+
+# Upper bounds of the latency histogram buckets, in milliseconds
+HISTOGRAM_BOUNDS_MS = [
+    1,
+    2,
+    5,
+    10,
+    20,
+    50,
+    100,
+    200,
+    500,
+    1000,
+    2000,
+    5000,
+    10000,
+    30000,
+]
+
+DEFAULT_TIMEOUT_SECONDS = 30.0
+
+
+def _latency_stats(latencies_ms: np.ndarray) -> dict[str, float | None]:
+    """The percentiles, mean and maximum of latencies in milliseconds, None if empty."""
+    count = len(latencies_ms)
+    percentiles = np.percentile(latencies_ms, PERCENTILES) if count else [None] * 4
+    return {
+        **{
+            f"p{p:g}": None if value is None else float(value)
+            for p, value in zip(PERCENTILES, percentiles)
+        },
+        "mean": float(latencies_ms.mean()) if count else None,
+        "max": float(latencies_ms.max()) if count else None,
+    }
+
+
+@dataclass
+class LoadTestResult:
+    """
+    Latencies and outcomes of the requests of one load test run.
+
+    The latencies of successful (2xx) requests and of the others are kept apart, so that
+    fast rejections, e.g. 401s or 503s, do not make the server look faster.
+    """
+
+    endpoint: str
+    mode: str
+    duration: float = 0.0
+    messages_per_request: int = 1
+    latencies: list[float] = field(default_factory=list)
+    error_latencies: list[float] = field(default_factory=list)
+    statuses: dict[str, int] = field(default_factory=dict)
+
+    def record(self, latency: float, status: str) -> None:
+        """
+        Records a finished request.
+
+        Args:
+            latency (float): The time from when the request was due to its response, in seconds.
+            status (str): The HTTP status code, or the name of the error.
+        """
+        if status.startswith("2"):
+            self.latencies.append(latency)
+        else:
+            self.error_latencies.append(latency)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+
+    @property
+    def errors(self) -> int:
+        """The number of requests that failed or got a non-2xx response."""
+        return sum(
+            count
+            for status, count in self.statuses.items()
+            if not status.startswith("2")
+        )
+
+    def summary(self) -> dict[str, Any]:
+        """
+        Summarises the run in a JSON-serialisable form, to compare runs.
+
+        Returns:
+            dict[str, Any]: The request count, throughput, error rate, the latency
+            percentiles and histogram (in milliseconds) of the successful requests, the
+            latency percentiles of the failed ones and the count of each status.
+        """
+        latencies_ms = np.asarray(self.latencies, dtype=float) * 1000
+        requests = len(self.latencies) + len(self.error_latencies)
+        # Each latency is counted in the first bucket whose bound it does not exceed
+        buckets = np.searchsorted(HISTOGRAM_BOUNDS_MS, latencies_ms, side="left")
+        counts = np.bincount(buckets, minlength=len(HISTOGRAM_BOUNDS_MS) + 1)
+
+        return {
+            "endpoint": self.endpoint,
+            "mode": self.mode,
+            "duration_s": self.duration,
+            "requests": requests,
+            "errors": self.errors,
+            "error_rate": self.errors / requests if requests else 0.0,
+            "requests_per_s": requests / self.duration if self.duration else 0.0,
+            "messages_per_s": (
+                requests * self.messages_per_request / self.duration
+                if self.duration
+                else 0.0
+            ),
+            "latency_ms": _latency_stats(latencies_ms),
+            "error_latency_ms": _latency_stats(
+                np.asarray(self.error_latencies, dtype=float) * 1000
+            ),
+            "histogram_ms": [
+                {"le": bound, "count": count}
+                for bound, count in zip([*HISTOGRAM_BOUNDS_MS, "inf"], counts.tolist())
+            ],
+            "statuses": dict(sorted(self.statuses.items())),
+        }
+
+
+def load_contents(input_file: str) -> list[str]:
+    """
+    Reads the message contents to send from a transcript, structured or moderated file.
+
+    Args:
+        input_file (str): A conversations text file (.txt), a structured JSON file, or a
+            moderated output in any format.
+
+    Returns:
+        list[str]: The contents of the messages.
+    """
+    if input_file.endswith(".txt"):
+        return [message["content"] for message in iter_transcript_messages(input_file)]
+
+    contents = []
+    for record in iter_result_records(input_file):
+        if "messages" in record:
+            contents.extend(message["content"] for message in record["messages"])
+        else:
+            contents.append(record["content"])
+    return contents
+
+
+def _request_bodies(
+    endpoint: str, contents: list[str], categories: list[str], batch_size: int
+) -> Iterator[dict[str, Any]]:
+    """Cycles over the contents, building the body of each request."""
+    messages = (
+        {"message_id": str(idx), "content": content, "categories": categories}
+        for idx, content in enumerate(itertools.cycle(contents))
+    )
+    if endpoint == "batch":
+        while True:
+            yield {"messages": list(itertools.islice(messages, batch_size))}
+    else:
+        yield from messages
+
+
+def create_http_client(connections: int | None) -> httpx.AsyncClient:
+    """
+    Creates the pooled async HTTP client of a load test.
+
+    Args:
+        connections (int | None): The maximum number of connections, or None to open one
+            per request in flight, so that requests never queue inside the client.
+
+    Returns:
+        httpx.AsyncClient: The client.
+    """
+    limits = httpx.Limits(
+        max_connections=connections, max_keepalive_connections=connections
+    )
+    return httpx.AsyncClient(limits=limits, timeout=DEFAULT_TIMEOUT_SECONDS)
+
+
+def _connections(mode: str, users: int) -> int | None:
+    """The connection limit of a run: one per user, unbounded in open-loop mode."""
+    # An open loop must not wait for a free connection, or the wait is billed to the server
+    return users if mode == "closed" else None
+
+
+async def _send(
+    http_client: Any,
+    url: str,
+    body: dict[str, Any],
+    headers: dict[str, str],
+    due: float,
+    result: LoadTestResult,
+) -> None:
+    """Sends one request and records its latency from `due`, its scheduled start."""
+    try:
+        response = await http_client.post(url, json=body, headers=headers)
+        status = str(response.status_code)
+    except Exception as e:
+        status = type(e).__name__
+    result.record(time.perf_counter() - due, status)
+
+
+async def run_load_test(
+    base_url: str,
+    api_key: str,
+    contents: list[str],
+    categories: list[str],
+    endpoint: str = "moderate",
+    mode: str = "closed",
+    users: int = 16,
+    rps: float = 50.0,
+    duration: float = 30.0,
+    batch_size: int = 16,
+    http_client: Any = None,
+) -> LoadTestResult:
+    """
+    Sends requests to the moderation server for `duration` seconds and records their latency.
+
+    In closed-loop mode, `users` clients each send their next request as soon as the
+    previous one is answered, so throughput is measured at a fixed concurrency. In
+    open-loop mode, requests start at `rps` per second whatever the response times, and
+    each latency is measured from when its request was due, so that a slow server is not
+    hidden by requests being sent late.
+
+    Args:
+        base_url (str): The server URL, e.g. "http://127.0.0.1:8000".
+        api_key (str): Authorization key of the server.
+        contents (list[str]): The message contents to send, cycled over.
+        categories (list[str]): The categories requested.
+        endpoint (str): "moderate" or "batch".
+        mode (str): "closed" or "open".
+        users (int): The number of concurrent clients in closed-loop mode.
+        rps (float): The request rate in open-loop mode.
+        duration (float): How long to send requests, in seconds.
+        batch_size (int): The number of messages per request to the batch endpoint.
+        http_client (Any): The async HTTP client to use instead of a new pooled one; in
+            open-loop mode, its pool should not limit the connections.
+
+    Returns:
+        LoadTestResult: The latencies and statuses of the requests.
+    """
+    url = base_url.rstrip("/") + ENDPOINTS[endpoint]
+    headers = {"Authorization": f"Bearer {api_key}"}
+    bodies = _request_bodies(endpoint, contents, categories, batch_size)
+    result = LoadTestResult(
+        endpoint, mode, messages_per_request=batch_size if endpoint == "batch" else 1
+    )
+    owns_client = http_client is None
+    if owns_client:
+        http_client = create_http_client(_connections(mode, users))
+
+    start = time.perf_counter()
+    deadline = start + duration
+    try:
+        if mode == "open":
+            in_flight = set()
+            for idx in itertools.count():
+                due = start + idx / rps
+                if due >= deadline:
+                    break
+                await asyncio.sleep(max(0.0, due - time.perf_counter()))
+                task = asyncio.create_task(
+                    _send(http_client, url, next(bodies), headers, due, result)
+                )
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
+            if in_flight:
+                await asyncio.wait(in_flight)
+        else:
+
+            async def user() -> None:
+                while time.perf_counter() < deadline:
+                    await _send(
+                        http_client,
+                        url,
+                        next(bodies),
+                        headers,
+                        time.perf_counter(),
+                        result,
+                    )
+
+            await asyncio.gather(*(user() for _ in range(users)))
+    finally:
+        result.duration = time.perf_counter() - start
+        if owns_client:
+            await http_client.aclose()
+
+    return result
+
+
+async def endpoint_exists(base_url: str, endpoint: str, http_client: Any) -> bool:
+    """
+    Checks whether the server has an endpoint, with a request it rejects as invalid.
+
+    Args:
+        base_url (str): The server URL.
+        endpoint (str): "moderate" or "batch".
+        http_client (Any): The async HTTP client.
+
+    Returns:
+        bool: False if the server answers 404 or 405.
+    """
+    response = await http_client.post(base_url.rstrip("/") + ENDPOINTS[endpoint])
+    return response.status_code not in (404, 405)
+
+
+def _format_latency(label: str, latency: dict[str, float | None]) -> str:
+    return (
+        f"  {label} ms: p50 {latency['p50']:.1f}  p90 {latency['p90']:.1f}"
+        f"  p99 {latency['p99']:.1f}  p99.9 {latency['p99.9']:.1f}"
+        f"  max {latency['max']:.1f}"
+    )
+
+
+def format_summary(summary: dict[str, Any]) -> str:
+    """Formats the summary of a run, with the latencies of successes and errors apart."""
+    if not summary["requests"]:
+        return f"{summary['endpoint']} ({summary['mode']} loop): no requests completed"
+    lines = [
+        f"{summary['endpoint']} ({summary['mode']} loop): {summary['requests']} requests,"
+        f" {summary['requests_per_s']:.1f} req/s, {summary['messages_per_s']:.1f} msg/s,"
+        f" {summary['error_rate']:.2%} errors"
+    ]
+    if summary["latency_ms"]["max"] is not None:
+        lines.append(_format_latency("latency", summary["latency_ms"]))
+    if summary["error_latency_ms"]["max"] is not None:
+        lines.append(_format_latency("error latency", summary["error_latency_ms"]))
+    return "\n".join(lines)
+
+
+def main(
+    input_file: str,
+    base_url: str,
+    api_key: str,
+    categories: list[str],
+    endpoints: list[str],
+    mode: str,
+    users: int,
+    rps: float,
+    duration: float,
+    batch_size: int,
+    output_file: str | None = None,
+) -> list[dict[str, Any]]:
+    """
+    Load tests each endpoint in turn, prints the summaries and optionally saves them.
+
+    Args:
+        input_file (str): The file the message contents are read from.
+        base_url (str): The server URL.
+        api_key (str): Authorization key of the server.
+        categories (list[str]): The categories requested.
+        endpoints (list[str]): The endpoints to test, by name.
+        mode (str): "closed" or "open".
+        users (int): The number of concurrent clients in closed-loop mode.
+        rps (float): The request rate in open-loop mode.
+        duration (float): How long to test each endpoint, in seconds.
+        batch_size (int): The number of messages per request to the batch endpoint.
+        output_file (str | None): The JSON file the run is saved to, to compare runs.
+
+    Returns:
+        list[dict[str, Any]]: The summary of each endpoint.
+    """
+    contents = load_contents(input_file)
+    if not contents:
+        raise click.ClickException(f"No messages found in {input_file}.")
+
+    async def run() -> list[dict[str, Any]]:
+        summaries = []
+        async with create_http_client(_connections(mode, users)) as http_client:
+            for endpoint in endpoints:
+                if not await endpoint_exists(base_url, endpoint, http_client):
+                    click.echo(
+                        f"Skipping {ENDPOINTS[endpoint]}: not served by {base_url}"
+                    )
+                    continue
+                result = await run_load_test(
+                    base_url,
+                    api_key,
+                    contents,
+                    categories,
+                    endpoint,
+                    mode,
+                    users,
+                    rps,
+                    duration,
+                    batch_size,
+                    http_client,
+                )
+                summaries.append(result.summary())
+                click.echo(format_summary(summaries[-1]))
+        return summaries
+
+    summaries = asyncio.run(run())
+
+    if output_file:
+        report = {
+            "config": {
+                "base_url": base_url,
+                "mode": mode,
+                "users": users,
+                "rps": rps if mode == "open" else None,
+                "duration_s": duration,
+                "batch_size": batch_size,
+                "categories": categories,
+            },
+            "results": summaries,
+        }
+        with open(output_file, "w", encoding="utf-8") as file:
+            json.dump(report, file, indent=4)
+        click.echo(f"Load test results saved to {output_file}")
+
+    return summaries
@@ -1,33 +1,79 @@
+import csv
 import json
 import signal
 import sys
 import requests
-from typing import Any
+from typing import Any, Iterable, Iterator
 from concurrent.futures import ThreadPoolExecutor, as_completed
-from src.utils.category_validator import validate_categories
 
+import numpy as np
+
+from src.models import Category
+from src.utils.category_validator import validate_categories
+from src.utils.columnar import iter_result_records
 
 stop_event = False
 
+# Absolute score discrepancy above which a message is counted in the summary
+DEFAULT_THRESHOLD = 0.01
+
+# File scores closer to zero are compared against this for relative discrepancies
+DEFAULT_MIN_BASELINE = 1e-3
+
 
 def load_results(file_path: str) -> dict[int, dict[str, Any]]:
     """
-    Load moderation results from a JSON file and index by message_id.
+    Load moderation results from a JSON, JSON Lines or columnar output and index by message_id.
 
     Args:
-        file_path (str): Path to the JSON file with CLI moderation results.
+        file_path (str): Path to the file (or columnar directory) with CLI moderation results.
 
     Returns:
         dict[int, dict[str, Any]]: dictionary of results indexed by message_id.
     """
-    with open(file_path, "r", encoding="utf-8") as file:
-        results_list = json.load(file)
-
     # Convert list of results into a dictionary indexed by message_id
-    results_dict = {result["message_id"]: result for result in results_list}
+    results_dict = {
+        result["message_id"]: result for result in iter_result_records(file_path)
+    }
     return results_dict
 
 
+def file_score(result: dict[str, Any], category: str) -> float:
+    """
+    Returns the score of a category in a moderated result, or NaN if it has none.
+
+    Categories outside the selection of the moderation run are read from the full
+    `all_category_scores` vector, when the result was saved with it.
+
+    Args:
+        result (dict[str, Any]): A result of the moderated file.
+        category (str): The category.
+
+    Returns:
+        float: The score of the category.
+    """
+    score = result["category_scores"].get(category)
+    if score is None:
+        score = (result.get("all_category_scores") or {}).get(category, np.nan)
+    return score
+
+
+def file_categories(results: Iterable[dict[str, Any]]) -> list[str]:
+    """
+    Returns the categories scored in a moderated file, in the order of `Category`.
+
+    Args:
+        results (Iterable[dict[str, Any]]): The results of the moderated file.
+
+    Returns:
+        list[str]: The categories found in the `category_scores` of any result.
+    """
+    found = set()
+    for result in results:
+        found.update(result["category_scores"])
+    return [category.value for category in Category if category.value in found]
+
+
 def fetch_moderation_from_api(
     api_url: str, api_key: str, content: dict[str, Any], categories: list[str]
 ) -> dict[str, Any]:
@@ -71,51 +117,142 @@ def fetch_moderation_from_api(
 
 
 def compare_results(
-    file_results: dict[int, dict[str, Any]], api_result: dict[str, Any]
+    file_scores: np.ndarray,
+    api_scores: np.ndarray,
+    categories: list[str],
+    threshold: float = DEFAULT_THRESHOLD,
+    min_baseline: float = DEFAULT_MIN_BASELINE,
+) -> dict[str, dict[str, float]]:
+    """
+    Compute discrepancy statistics between file and API scores, per category.
+
+    NaN scores, i.e. failed API requests or categories missing from a moderated result,
+    are left out of their category only; categories without any pair of scores are left
+    out of the statistics. Relative errors are taken
+    against the file score, or against `min_baseline` when the file score is closer to zero,
+    so that tiny baselines neither hide discrepancies nor blow them up.
+
+    Args:
+        file_scores (np.ndarray): Scores from the moderated file, one row per message and
+            one column per category.
+        api_scores (np.ndarray): Scores from the API, in the same layout.
+        categories (list[str]): The category of each column.
+        threshold (float): Absolute discrepancy above which a score is counted.
+        min_baseline (float): The smallest baseline used for relative errors.
+
+    Returns:
+        dict[str, dict[str, float]]: For each category, the number of messages `n`, the
+        `mean`, `p50`, `p95`, `p99` and `max` absolute discrepancy, the `max_relative`
+        discrepancy and the number of messages `above_threshold`.
+    """
+    stats = {}
+    for idx, category in enumerate(categories):
+        # Each column keeps its own messages: a category missing from some results
+        # must not drop the other categories of those messages
+        file_column, api_column = file_scores[:, idx], api_scores[:, idx]
+        valid = ~(np.isnan(file_column) | np.isnan(api_column))
+        if not valid.any():
+            continue
+        file_column, api_column = file_column[valid], api_column[valid]
+
+        absolute = np.abs(api_column - file_column)
+        relative = absolute / np.maximum(np.abs(file_column), min_baseline)
+        p50, p95, p99 = np.percentile(absolute, [50, 95, 99])
+        stats[category] = {
+            "n": len(absolute),
+            "mean": absolute.mean().item(),
+            "p50": p50.item(),
+            "p95": p95.item(),
+            "p99": p99.item(),
+            "max": absolute.max().item(),
+            "max_relative": relative.max().item(),
+            "above_threshold": (absolute > threshold).sum().item(),
+        }
+    return stats
+
+
+def format_summary(stats: dict[str, dict[str, float]], threshold: float) -> str:
+    """
+    Format discrepancy statistics as a table with one row per category.
+
+    Args:
+        stats (dict[str, dict[str, float]]): The statistics from `compare_results`.
+        threshold (float): The threshold the statistics were computed with.
+
+    Returns:
+        str: The table.
+    """
+    lines = [
+        f"{'category':<24}{'n':>8}{'mean':>10}{'p50':>10}{'p95':>10}{'p99':>10}"
+        f"{'max':>10}{'max rel':>10}{f'> {threshold:g}':>10}"
+    ]
+    for category, row in stats.items():
+        lines.append(
+            f"{category:<24}{row['n']:>8}{row['mean']:>10.4f}{row['p50']:>10.4f}"
+            f"{row['p95']:>10.4f}{row['p99']:>10.4f}{row['max']:>10.4f}"
+            f"{row['max_relative']:>10.1%}{row['above_threshold']:>10}"
+        )
+    return "\n".join(lines)
+
+
+def dump_discrepancies(
+    file_path: str,
+    message_ids: list[Any],
+    file_scores: np.ndarray,
+    api_scores: np.ndarray,
+    categories: list[str],
+    min_baseline: float = DEFAULT_MIN_BASELINE,
 ) -> None:
     """
-    Compare the result from the API with the corresponding result from the file.
+    Write the discrepancy of every message and category to a CSV or JSON Lines file.
 
     Args:
-        file_results (dict[int, dict[str, Any]]): Results from the JSON file.
-        api_result (dict[str, Any]): Result from the API for a single content.
-    """
-    message_id = api_result["message_id"]
-    file_result = file_results.get(int(message_id), {})
-
-    if file_result:
-        discrepancies = []
-        file_scores = file_result.get("category_scores", {})
-        api_scores = api_result.get("category_scores", {})
-
-        for category in file_scores:
-            file_score = file_scores.get(category, 0.0)
-            api_score = api_scores.get(category, 0.0)
-
-            if file_score != 0:
-                percentage_discrepancy = abs(api_score - file_score) / file_score * 100
-            else:
-                percentage_discrepancy = 0.0
-
-            discrepancies.append(
-                {
-                    "category": category,
-                    "file_score": file_score,
-                    "api_score": api_score,
-                    "percentage_discrepancy": percentage_discrepancy,
-                }
-            )
-
-        if discrepancies:
-            print(f"Message ID: {message_id}")
-            print(f"File Result: {file_result['category_scores']}")
-            print(f"API Result: {api_result['category_scores']}")
-            print("Discrepancies:")
-            for discrepancy in discrepancies:
-                print(
-                    f"  Category: {discrepancy['category']} -> Discrepancy: {discrepancy['percentage_discrepancy']:.2f}%"
+        file_path (str): The output file; JSON Lines if it ends with `.jsonl`, CSV otherwise.
+        message_ids (list[Any]): The message ID of each row.
+        file_scores (np.ndarray): Scores from the moderated file.
+        api_scores (np.ndarray): Scores from the API, NaN where the request failed.
+        categories (list[str]): The category of each column.
+        min_baseline (float): The smallest baseline used for relative errors.
+    """
+    absolute = np.abs(api_scores - file_scores)
+    relative = absolute / np.maximum(np.abs(file_scores), min_baseline)
+    fields = [
+        "message_id",
+        "category",
+        "file_score",
+        "api_score",
+        "absolute",
+        "relative",
+    ]
+
+    def rows() -> Iterator[dict[str, Any]]:
+        for row, message_id in enumerate(message_ids):
+            for col, category in enumerate(categories):
+                yield dict(
+                    zip(
+                        fields,
+                        (
+                            message_id,
+                            category,
+                            file_scores[row, col].item(),
+                            api_scores[row, col].item(),
+                            absolute[row, col].item(),
+                            relative[row, col].item(),
+                        ),
+                    )
                 )
-            print()
+
+    with open(file_path, "w", encoding="utf-8", newline="") as file:
+        if file_path.endswith(".jsonl"):
+            for row in rows():
+                # NaN is not valid JSON: a failed request has no API score
+                record = {k: None if v != v else v for k, v in row.items()}
+                file.write(json.dumps(record, ensure_ascii=False))
+                file.write("\n")
+        else:
+            writer = csv.DictWriter(file, fieldnames=fields)
+            writer.writeheader()
+            writer.writerows(rows())
 
 
 def fetch_all_moderations(
@@ -124,10 +261,9 @@ def fetch_all_moderations(
     contents: list[dict[str, Any]],
     categories: list[str],
     num_threads: int,
-    file_results: dict[int, dict[str, Any]],
-) -> None:
+) -> np.ndarray:
     """
-    Fetch moderation results for all contents using a thread pool and compare as results come in.
+    Fetch moderation results for all contents using a thread pool.
 
     Args:
         api_url (str): URL of the FastAPI moderation endpoint.
@@ -135,14 +271,20 @@ def fetch_all_moderations(
         contents (list[dict[str, Any]]): list of content strings to be moderated.
         categories (list[str]): list of categories to check.
         num_threads (int): Number of threads to use for parallel requests.
-        file_results (dict[int, dict[str, Any]]): Results from the JSON file.
+
+    Returns:
+        np.ndarray: The API scores, one row per content in the same order and one column
+        per category; NaN where the request failed.
     """
+    api_scores = np.full((len(contents), len(categories)), np.nan)
+    errors = 0
+
     with ThreadPoolExecutor(max_workers=num_threads) as executor:
         futures = {
             executor.submit(
                 fetch_moderation_from_api, api_url, api_key, content, categories
-            ): content
-            for content in contents
+            ): row
+            for row, content in enumerate(contents)
         }
 
         for future in as_completed(futures):
@@ -151,9 +293,17 @@ def fetch_all_moderations(
                     print("Stopping early due to user interruption.")
                     break
                 api_result = future.result()
-                compare_results(file_results, api_result)
+                api_scores[futures[future]] = [
+                    api_result["category_scores"][category] for category in categories
+                ]
             except Exception as exc:
-                print(f"An error occurred while processing content: {exc}")
+                errors += 1
+                if errors == 1:
+                    print(f"An error occurred while processing content: {exc}")
+
+    if errors:
+        print(f"{errors} of {len(contents)} requests failed and were left out.")
+    return api_scores
 
 
 def signal_handler(sig, frame):
@@ -168,39 +318,75 @@ def signal_handler(sig, frame):
 
 
 def main(
-    file_results: str, api_url: str, api_key: str, categories: str, num_threads: int
+    file_results: str,
+    api_url: str,
+    api_key: str,
+    categories: str,
+    num_threads: int,
+    threshold: float = DEFAULT_THRESHOLD,
+    min_baseline: float = DEFAULT_MIN_BASELINE,
+    dump_file: str | None = None,
 ) -> None:
     """
-    Compare moderation results from CLI and API in real-time.
+    Compare moderation results from CLI and API and print a summary per category.
 
     Args:
         file_results (str): Path to the JSON file with CLI moderation results.
         api_url (str): URL of the FastAPI moderation endpoint.
         api_key (str): Authorization key for the FastAPI endpoint.
-        categories (str): Comma-separated list of categories to check.
+        categories (str): Comma-separated list of categories to check, by default the
+            categories scored in the file.
         num_threads (int): Number of threads to use for parallel requests.
+        threshold (float): Absolute discrepancy above which a score is counted.
+        min_baseline (float): The smallest baseline used for relative errors.
+        dump_file (str | None): CSV or JSON Lines file receiving every discrepancy.
     """
 
-    global stop_event
-
     # Set up signal handler for graceful shutdown
     signal.signal(signal.SIGINT, signal_handler)
 
-    # validate provided categories
-    validated_categories = validate_categories(categories)
-
     # Load CLI results
     file_results_data = load_results(file_results)
 
     # Extract contents for moderation
     contents = [result for result in file_results_data.values()]
 
-    # Fetch API results and compare in real-time
-    fetch_all_moderations(
+    # validate provided categories, by default the ones the file was moderated with
+    if categories:
+        validated_categories = validate_categories(categories)
+    else:
+        validated_categories = file_categories(contents)
+    file_scores = np.array(
+        [
+            [file_score(result, category) for category in validated_categories]
+            for result in contents
+        ],
+        dtype=float,
+    ).reshape(len(contents), len(validated_categories))
+
+    api_scores = fetch_all_moderations(
         api_url,
         api_key,
         contents,
         validated_categories,
         num_threads,
-        file_results_data,
     )
+
+    stats = compare_results(
+        file_scores, api_scores, validated_categories, threshold, min_baseline
+    )
+    if stats:
+        print(format_summary(stats, threshold))
+    else:
+        print("No results to compare.")
+
+    if dump_file:
+        dump_discrepancies(
+            dump_file,
+            [result["message_id"] for result in contents],
+            file_scores,
+            api_scores,
+            validated_categories,
+            min_baseline,
+        )
+        print(f"Discrepancies per message saved to {dump_file}")
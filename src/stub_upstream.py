@@ -0,0 +1,264 @@
+import asyncio
+import hashlib
+import math
+import random
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Iterator
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse
+from openai.types.moderation import CategoryScores
+
+# Shapes of the simulated upstream latency, all with a mean of `latency_ms`
+LATENCY_DISTRIBUTIONS = ["fixed", "uniform", "exponential", "lognormal"]
+
+STUB_MODEL = "omni-moderation-stub"
+
+# The API names of the categories, e.g. "self-harm", in the order of the score fields
+CATEGORIES = [
+    field.alias or name for name, field in CategoryScores.model_fields.items()
+]
+
+
+@dataclass
+class StubConfig:
+    """
+    How the stub moderation upstream behaves.
+
+    Attributes:
+        latency_ms (float): The mean response latency, in milliseconds.
+        latency_distribution (str): One of `LATENCY_DISTRIBUTIONS`.
+        latency_sigma (float): The spread of the lognormal distribution, in log space.
+        rate_limit_rate (float): The fraction of requests answered 429 at once.
+        retry_after (float): The `Retry-After` of the 429 responses, in seconds.
+        failure_rate (float): The fraction of requests whose connection is dropped
+            after the latency, without a complete response.
+        seed (int | None): Seeds the latencies and faults, to replay the same run.
+    """
+
+    latency_ms: float = 0.0
+    latency_distribution: str = "fixed"
+    latency_sigma: float = 0.5
+    rate_limit_rate: float = 0.0
+    retry_after: float = 1.0
+    failure_rate: float = 0.0
+    seed: int | None = None
+
+
+def stub_scores(content: str) -> dict[str, float]:
+    """
+    Derives category scores from a content, the same on every run and host.
+
+    Args:
+        content (str): The moderated content.
+
+    Returns:
+        dict[str, float]: A score between 0 and 1 for every category, keyed by API name.
+    """
+    digest = hashlib.sha256(content.encode("utf-8")).digest()
+    return {category: digest[idx] / 255 for idx, category in enumerate(CATEGORIES)}
+
+
+def stub_moderation(content: str) -> dict[str, Any]:
+    """
+    Builds the moderation result of a content as the OpenAI API returns it.
+
+    Args:
+        content (str): The moderated content.
+
+    Returns:
+        dict[str, Any]: The `flagged`, `categories`, `category_scores` and
+        `category_applied_input_types` of the content.
+    """
+    scores = stub_scores(content)
+    return {
+        "flagged": any(score > 0.5 for score in scores.values()),
+        "categories": {category: score > 0.5 for category, score in scores.items()},
+        "category_scores": scores,
+        "category_applied_input_types": {category: ["text"] for category in scores},
+    }
+
+
+class LatencySampler:
+    """Draws simulated latencies and faults from a `StubConfig`."""
+
+    def __init__(self, config: StubConfig) -> None:
+        """
+        Args:
+            config (StubConfig): The latency distribution and fault rates.
+
+        Raises:
+            ValueError: If the latency distribution is unknown.
+        """
+        if config.latency_distribution not in LATENCY_DISTRIBUTIONS:
+            raise ValueError(
+                f"Unknown latency distribution: {config.latency_distribution}"
+            )
+        self.config = config
+        self._random = random.Random(config.seed)
+
+    def latency(self) -> float:
+        """Returns the latency of the next response, in seconds."""
+        mean = self.config.latency_ms / 1000
+        distribution = self.config.latency_distribution
+        if mean <= 0 or distribution == "fixed":
+            return max(mean, 0.0)
+        if distribution == "uniform":
+            return self._random.uniform(0, 2 * mean)
+        if distribution == "exponential":
+            return self._random.expovariate(1 / mean)
+        sigma = self.config.latency_sigma
+        # Shifted so that the mean stays `mean` whatever the spread
+        return self._random.lognormvariate(math.log(mean) - sigma**2 / 2, sigma)
+
+    def fault(self) -> str | None:
+        """Returns "rate_limit", "failure" or None for the next request."""
+        roll = self._random.random()
+        if roll < self.config.rate_limit_rate:
+            return "rate_limit"
+        if roll < self.config.rate_limit_rate + self.config.failure_rate:
+            return "failure"
+        return None
+
+
+class _DroppedConnection(Response):
+    """Starts a response and never finishes it, so the server closes the connection."""
+
+    def __init__(self) -> None:
+        super().__init__(status_code=200)
+
+    async def __call__(self, scope, receive, send) -> None:
+        await send(
+            {
+                "type": "http.response.start",
+                "status": 200,
+                "headers": [(b"content-length", b"1")],
+            }
+        )
+
+
+def create_stub_app(config: StubConfig | None = None) -> FastAPI:
+    """
+    Creates a local stand-in for OpenAI's moderation API, for benchmarks and tests.
+
+    It serves `POST /v1/moderations` and `GET /v1/models` like the real API, accepts any
+    key, and reports what it served on `GET /stats`.
+
+    Args:
+        config (StubConfig | None): The latencies and faults to simulate, none by default.
+
+    Returns:
+        FastAPI: The app, to run with uvicorn or `serve_stub`.
+    """
+    config = config or StubConfig()
+    sampler = LatencySampler(config)
+    stats = {"requests": 0, "inputs": 0, "rate_limited": 0, "failed": 0}
+    app = FastAPI()
+    app.state.stats = stats
+
+    @app.post("/v1/moderations")
+    async def moderations(request: Request) -> Response:
+        stats["requests"] += 1
+        fault = sampler.fault()
+        if fault == "rate_limit":
+            stats["rate_limited"] += 1
+            return JSONResponse(
+                status_code=429,
+                headers={"retry-after": f"{config.retry_after:g}"},
+                content={
+                    "error": {
+                        "message": "Rate limit reached (simulated).",
+                        "type": "requests",
+                        "code": "rate_limit_exceeded",
+                    }
+                },
+            )
+
+        body = await request.json()
+        await asyncio.sleep(sampler.latency())
+        if fault == "failure":
+            stats["failed"] += 1
+            return _DroppedConnection()
+
+        contents = body["input"]
+        contents = [contents] if isinstance(contents, str) else contents
+        stats["inputs"] += len(contents)
+        return JSONResponse(
+            {
+                "id": f"modr-{stats['requests']}",
+                "model": body.get("model", STUB_MODEL),
+                "results": [stub_moderation(content) for content in contents],
+            }
+        )
+
+    @app.get("/v1/models")
+    async def models() -> dict[str, Any]:
+        return {
+            "object": "list",
+            "data": [{"id": STUB_MODEL, "object": "model", "owned_by": "stub"}],
+        }
+
+    @app.get("/stats")
+    async def get_stats() -> dict[str, int]:
+        return stats
+
+    return app
+
+
+def free_port() -> int:
+    """Returns a local TCP port that is currently unused."""
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+@contextmanager
+def serve_in_thread(app: Any, log_level: str = "warning") -> Iterator[str]:
+    """
+    Runs an ASGI app with uvicorn in a background thread.
+
+    Args:
+        app (Any): The app.
+        log_level (str): The uvicorn log level.
+
+    Yields:
+        str: The base URL of the running server, e.g. "http://127.0.0.1:8001".
+    """
+    port = free_port()
+    server = uvicorn.Server(
+        # A lifespan, e.g. of the moderation server, would create a real OpenAI client
+        uvicorn.Config(
+            app, host="127.0.0.1", port=port, log_level=log_level, lifespan="off"
+        )
+    )
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+
+    try:
+        yield f"http://127.0.0.1:{port}"
+    finally:
+        server.should_exit = True
+        thread.join()
+
+
+@contextmanager
+def serve_stub(config: StubConfig | None = None) -> Iterator[str]:
+    """
+    Runs the stub moderation upstream in a background thread.
+
+    Args:
+        config (StubConfig | None): The latencies and faults to simulate.
+
+    Yields:
+        str: The base URL to give the OpenAI clients, ending with "/v1".
+    """
+    # Uvicorn logs every simulated dropped connection as an error
+    with serve_in_thread(create_stub_app(config), log_level="critical") as url:
+        yield f"{url}/v1"
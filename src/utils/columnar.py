@@ -0,0 +1,179 @@
+import json
+import os
+from dataclasses import dataclass
+from typing import Any, BinaryIO, Iterator
+
+import numpy as np
+
+from src.utils.json_stream import iter_json_records
+
+# Output formats of the moderated results
+OUTPUT_FORMATS = ["json", "columnar"]
+
+META_FILE = "meta.json"
+FORMAT_NAME = "moderator-columnar"
+FORMAT_VERSION = 1
+
+# Bytes reserved for the header of a .npy file written before its length is known
+_NPY_HEADER_SIZE = 128
+
+
+class NpyAppender:
+    """
+    Writes a .npy file row by row, without knowing the number of rows up front.
+
+    A header with room to spare is written first and rewritten with the final shape on
+    `close`, so the data never has to be copied.
+    """
+
+    def __init__(self, path: str, dtype: np.dtype, row_shape: tuple[int, ...] = ()):
+        """
+        Args:
+            path (str): The .npy file.
+            dtype (np.dtype): The type of the elements.
+            row_shape (tuple[int, ...]): The shape of one row, e.g. `(columns,)`.
+        """
+        self.dtype = np.dtype(dtype)
+        self.row_shape = row_shape
+        self.rows = 0
+        self._file: BinaryIO = open(path, "wb")
+        self._write_header()
+
+    def append(self, rows: Any) -> None:
+        """
+        Appends rows to the array.
+
+        Args:
+            rows (Any): An array-like of shape `(n, *row_shape)`.
+        """
+        array = np.asarray(rows, dtype=self.dtype).reshape((-1, *self.row_shape))
+        self._file.write(array.tobytes())
+        self.rows += len(array)
+
+    def close(self) -> None:
+        """Writes the final shape into the header and closes the file."""
+        if self._file.closed:
+            return
+        self._file.seek(0)
+        self._write_header()
+        self._file.close()
+
+    def _write_header(self) -> None:
+        header = {
+            "descr": np.lib.format.dtype_to_descr(self.dtype),
+            "fortran_order": False,
+            "shape": (self.rows, *self.row_shape),
+        }
+        # Magic string, version 1.0 and the header length take 10 bytes
+        text = repr(header).ljust(_NPY_HEADER_SIZE - 11) + "\n"
+        self._file.write(b"\x93NUMPY\x01\x00")
+        self._file.write(len(text).to_bytes(2, "little"))
+        self._file.write(text.encode("latin1"))
+
+
+def is_columnar(path: str) -> bool:
+    """Returns whether `path` holds moderated results in the columnar format."""
+    return os.path.isfile(os.path.join(path, META_FILE))
+
+
+@dataclass
+class ColumnarResults:
+    """
+    Moderated results loaded from the columnar format, as memory-mapped arrays.
+
+    Loading takes the same time whatever the number of results, since the data is only
+    read from disk when it is accessed.
+    """
+
+    message_ids: np.ndarray
+    scores: np.ndarray
+    content_offsets: np.ndarray
+    content: np.ndarray
+    columns: list[str]
+    categories: list[str]
+
+    def __len__(self) -> int:
+        return len(self.message_ids)
+
+    def category_scores(self, categories: list[str] | None = None) -> np.ndarray:
+        """
+        Returns the score matrix of some categories.
+
+        Args:
+            categories (list[str] | None): The categories, the selected ones by default.
+
+        Returns:
+            np.ndarray: A float32 matrix with one row per message and one column per category.
+        """
+        categories = self.categories if categories is None else categories
+        return self.scores[:, [self.columns.index(c) for c in categories]]
+
+    def content_at(self, idx: int) -> str:
+        """Returns the content of the message in row `idx`."""
+        start, end = self.content_offsets[idx], self.content_offsets[idx + 1]
+        return self.content[start:end].tobytes().decode("utf-8")
+
+    def iter_records(self) -> Iterator[dict[str, Any]]:
+        """
+        Yields the results in the same form as the JSON outputs.
+
+        Yields:
+            dict[str, Any]: The `message_id`, `content`, `category_scores` and
+            `all_category_scores` of the next message.
+        """
+        selected = [self.columns.index(c) for c in self.categories]
+        for idx in range(len(self)):
+            scores = self.scores[idx].tolist()
+            yield {
+                "message_id": int(self.message_ids[idx]),
+                "content": self.content_at(idx),
+                "category_scores": {self.columns[col]: scores[col] for col in selected},
+                "all_category_scores": dict(zip(self.columns, scores)),
+            }
+
+
+def load_columnar(path: str) -> ColumnarResults:
+    """
+    Memory-maps moderated results written in the columnar format.
+
+    Args:
+        path (str): The directory of the results.
+
+    Returns:
+        ColumnarResults: The results.
+
+    Raises:
+        ValueError: If the directory does not hold results in a supported version.
+    """
+    with open(os.path.join(path, META_FILE), "r", encoding="utf-8") as file:
+        meta = json.load(file)
+    if meta.get("format") != FORMAT_NAME or meta.get("version") != FORMAT_VERSION:
+        raise ValueError(f"{path} does not hold columnar results of a known version.")
+
+    def column(name: str) -> np.ndarray:
+        return np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r")
+
+    return ColumnarResults(
+        message_ids=column("message_id"),
+        scores=column("scores"),
+        content_offsets=column("content_offsets"),
+        content=column("content"),
+        columns=meta["columns"],
+        categories=meta["categories"],
+    )
+
+
+def iter_result_records(path: str) -> Iterator[dict[str, Any]]:
+    """
+    Reads moderated results in any output format: JSON, JSON Lines or columnar.
+
+    Args:
+        path (str): The moderated file, or directory for the columnar format.
+
+    Yields:
+        dict[str, Any]: The next result.
+    """
+    if is_columnar(path):
+        yield from load_columnar(path).iter_records()
+    else:
+        yield from iter_json_records(path)
@@ -0,0 +1,97 @@
+import json
+import logging
+import os
+import threading
+from typing import Any, Iterator, TextIO
+
+
+class Journal:
+    """
+    Append-only JSON Lines record of the messages moderated so far in a run.
+
+    Results are appended and flushed as soon as their batch completes, so an interrupted
+    run can be resumed without moderating the same messages again.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Args:
+            path (str): The journal file.
+        """
+        self.path = path
+        self._file: TextIO | None = None
+        self._lock = threading.Lock()
+
+    def exists(self) -> bool:
+        """Returns whether a journal was left behind by a previous run."""
+        return os.path.exists(self.path)
+
+    def iter_entries(self) -> Iterator[dict[str, Any]]:
+        """
+        Reads the results recorded by previous runs.
+
+        A line cut short by a crash is skipped.
+
+        Yields:
+            dict[str, Any]: The next recorded result.
+        """
+        if not self.exists():
+            return
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                if not line.strip():
+                    continue
+                try:
+                    yield json.loads(line)
+                except json.JSONDecodeError:
+                    logging.warning(f"Skipping truncated journal entry in {self.path}")
+
+    def open(self, resume: bool = False) -> "Journal":
+        """
+        Opens the journal for appending, discarding previous entries unless resuming.
+
+        Args:
+            resume (bool): Whether to keep the entries of previous runs.
+        """
+        self._file = open(self.path, "a" if resume else "w", encoding="utf-8")
+        if resume and self._file.tell() > 0 and not self._ends_with_newline():
+            # Keep a line cut short by a crash apart from the next entry
+            self._file.write("\n")
+        return self
+
+    def _ends_with_newline(self) -> bool:
+        with open(self.path, "rb") as file:
+            file.seek(-1, os.SEEK_END)
+            return file.read(1) == b"\n"
+
+    def append(self, results: list[dict[str, Any]]) -> None:
+        """
+        Records the results of a completed batch.
+
+        Args:
+            results (list[dict[str, Any]]): The moderated messages of the batch.
+        """
+        if not results:
+            return
+        lines = "".join(json.dumps(r, ensure_ascii=False) + "\n" for r in results)
+        with self._lock:
+            self._file.write(lines)
+            self._file.flush()
+
+    def close(self) -> None:
+        """Closes the journal, keeping it on disk for a later resume."""
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+    def remove(self) -> None:
+        """Closes and deletes the journal once its results are in the final output."""
+        self.close()
+        if self.exists():
+            os.remove(self.path)
+
+    def __enter__(self) -> "Journal":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,118 @@
+import json
+import re
+from typing import Any, Iterator, TextIO
+
+DEFAULT_CHUNK_SIZE = 1 << 16
+
+_WHITESPACE = re.compile(r"\s*")
+_NUMBER = re.compile(r"[-+0-9.eE]*")
+
+
+def iter_json_array(
+    file: TextIO, chunk_size: int = DEFAULT_CHUNK_SIZE
+) -> Iterator[Any]:
+    """
+    Decodes the elements of a top-level JSON array one at a time.
+
+    Only the element being decoded and one chunk of the file are held in memory, so
+    arrays larger than the available memory can be processed.
+
+    Args:
+        file (TextIO): A file whose content is a JSON array.
+        chunk_size (int): The number of characters read from the file at a time.
+
+    Yields:
+        Any: The next decoded element of the array.
+
+    Raises:
+        ValueError: If the file does not hold a well-formed JSON array.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ""
+    pos = 0
+    eof = False
+
+    def read_more() -> None:
+        nonlocal buffer, pos, eof
+        chunk = file.read(chunk_size)
+        eof = not chunk
+        buffer = buffer[pos:] + chunk
+        pos = 0
+
+    def next_char() -> str:
+        nonlocal pos
+        while True:
+            pos = _WHITESPACE.match(buffer, pos).end()
+            if pos < len(buffer):
+                return buffer[pos]
+            if eof:
+                raise ValueError("Unexpected end of JSON array.")
+            read_more()
+
+    if next_char() != "[":
+        raise ValueError("Expected a JSON array.")
+    pos += 1
+    if next_char() == "]":
+        return
+
+    while True:
+        next_char()
+        while True:
+            # A number reaching the end of the buffer may continue in the next chunk
+            if not eof and _NUMBER.match(buffer, pos).end() == len(buffer):
+                read_more()
+                continue
+            try:
+                value, end = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                if eof:
+                    raise
+                read_more()
+                continue
+            break
+
+        yield value
+        pos = end
+
+        separator = next_char()
+        pos += 1
+        if separator == "]":
+            return
+        if separator != ",":
+            raise ValueError(f"Expected ',' or ']' in JSON array, got {separator!r}.")
+
+
+def iter_json_lines(file: TextIO) -> Iterator[Any]:
+    """
+    Decodes a JSON Lines file one line at a time, skipping blank lines.
+
+    Args:
+        file (TextIO): A file with one JSON value per line.
+
+    Yields:
+        Any: The next decoded value.
+    """
+    for line in file:
+        if line.strip():
+            yield json.loads(line)
+
+
+def iter_json_records(file_path: str) -> Iterator[Any]:
+    """
+    Decodes the records of a JSON array file or of a JSON Lines file, one at a time.
+
+    Args:
+        file_path (str): The path to the file; its format is detected from its first character.
+
+    Yields:
+        Any: The next record.
+    """
+    with open(file_path, "r", encoding="utf-8") as file:
+        first = file.read(1)
+        while first.isspace():
+            first = file.read(1)
+        file.seek(0)
+        if first == "[":
+            yield from iter_json_array(file)
+        else:
+            yield from iter_json_lines(file)
@@ -0,0 +1,167 @@
+import math
+import threading
+import time
+from dataclasses import dataclass, field
+from typing import Mapping
+
+from src.utils.rate_limiter import AdaptiveRateLimiter
+
+
+def mask_key(api_key: str) -> str:
+    """
+    Shortens an API key to a label that can be logged and reported.
+
+    Args:
+        api_key (str): The API key.
+
+    Returns:
+        str: The key prefix and its last four characters, e.g. "sk-...abcd".
+    """
+    return f"{api_key[:3]}...{api_key[-4:]}"
+
+
+@dataclass
+class PooledKey:
+    """An API key of a `KeyPool`, with its own rate limiter and usage counters."""
+
+    api_key: str
+    limiter: AdaptiveRateLimiter
+    remaining: float | None = None
+    cooldown_until: float = 0.0
+    requests: int = 0
+    rate_limited: int = 0
+    label: str = field(init=False)
+
+    def __post_init__(self) -> None:
+        self.label = mask_key(self.api_key)
+
+
+class KeyPool:
+    """
+    Spreads upstream calls over several API keys to add up their rate limits.
+
+    Each call goes to the available key with the most remaining requests, as reported by
+    its latest `x-ratelimit-remaining-requests` header; keys not used yet are tried first.
+    A key that receives a 429 is taken out of rotation until its cooldown ends, unless
+    every key is cooling down.
+    """
+
+    def __init__(
+        self,
+        api_keys: list[str],
+        base_delay: float = 1.0,
+        rate_limiter: AdaptiveRateLimiter | None = None,
+        max_concurrency: int | None = None,
+    ) -> None:
+        """
+        Args:
+            api_keys (list[str]): The API keys, at least one.
+            base_delay (float): The backoff delay in seconds of the first retry of a call.
+            rate_limiter (AdaptiveRateLimiter | None): The limiter of the first key; the
+                other keys get their own.
+            max_concurrency (int | None): The upper bound of the calls in flight per key of
+                the limiters created here, or None to leave them unbounded until a 429.
+        """
+        if not api_keys:
+            raise ValueError("The key pool needs at least one API key.")
+        first, *others = dict.fromkeys(api_keys)
+
+        def create_limiter() -> AdaptiveRateLimiter:
+            return AdaptiveRateLimiter(max_concurrency, base_delay=base_delay)
+
+        self.keys = [PooledKey(first, rate_limiter or create_limiter())] + [
+            PooledKey(api_key, create_limiter()) for api_key in others
+        ]
+        self._by_key = {key.api_key: key for key in self.keys}
+        self._lock = threading.Lock()
+
+    def choose(self) -> PooledKey:
+        """
+        Picks the key for the next call and counts the call against it.
+
+        Returns:
+            PooledKey: The available key with the most remaining requests, or the key whose
+            cooldown ends first if none is available.
+        """
+        now = time.monotonic()
+        with self._lock:
+            available = [key for key in self.keys if key.cooldown_until <= now]
+            if available:
+                key = max(
+                    available,
+                    key=lambda k: (
+                        math.inf if k.remaining is None else k.remaining,
+                        -k.limiter.in_flight,
+                    ),
+                )
+            else:
+                key = min(self.keys, key=lambda k: k.cooldown_until)
+            key.requests += 1
+            if key.remaining:
+                # Until the next response updates it
+                key.remaining -= 1
+            return key
+
+    def available(self) -> bool:
+        """Returns whether any key is in rotation, i.e. not cooling down."""
+        now = time.monotonic()
+        return any(key.cooldown_until <= now for key in self.keys)
+
+    def find(self, authorization: str | None) -> PooledKey | None:
+        """
+        Finds the key a request was authorized with.
+
+        Args:
+            authorization (str | None): The `Authorization` header of the request.
+
+        Returns:
+            PooledKey | None: The key, or None if it is not in the pool.
+        """
+        if not authorization:
+            return None
+        return self._by_key.get(authorization.removeprefix("Bearer ").strip())
+
+    def update_from_headers(self, key: PooledKey, headers: Mapping[str, str]) -> None:
+        """
+        Records the remaining quota of a key and tunes its limiter from a response.
+
+        Args:
+            key (PooledKey): The key the request was made with.
+            headers (Mapping[str, str]): The response headers.
+        """
+        key.limiter.update_from_headers(headers)
+        remaining = headers.get("x-ratelimit-remaining-requests")
+        try:
+            key.remaining = float(remaining) if remaining is not None else key.remaining
+        except (TypeError, ValueError):
+            pass
+
+    def cooldown(self, key: PooledKey, seconds: float) -> None:
+        """
+        Takes a rate-limited key out of rotation.
+
+        Args:
+            key (PooledKey): The key that received a 429.
+            seconds (float): How long to leave it out.
+        """
+        with self._lock:
+            key.rate_limited += 1
+            key.cooldown_until = max(key.cooldown_until, time.monotonic() + seconds)
+
+    def usage(self) -> list[dict[str, object]]:
+        """
+        Reports how each key was used.
+
+        Returns:
+            list[dict[str, object]]: Per key, its masked `key`, the `requests` made with it,
+            how often it was `rate_limited` and its last known `remaining` requests.
+        """
+        return [
+            {
+                "key": key.label,
+                "requests": key.requests,
+                "rate_limited": key.rate_limited,
+                "remaining": key.remaining,
+            }
+            for key in self.keys
+        ]
@@ -0,0 +1,315 @@
+import asyncio
+import bisect
+import math
+import time
+from typing import Callable, Iterable, TypeVar
+
+# Upper bounds of the latency buckets, in seconds: from 0.5 ms to a minute of retries
+DEFAULT_BUCKETS = (
+    0.0005,
+    0.001,
+    0.0025,
+    0.005,
+    0.01,
+    0.025,
+    0.05,
+    0.1,
+    0.25,
+    0.5,
+    1.0,
+    2.5,
+    5.0,
+    10.0,
+    30.0,
+    60.0,
+)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+Labels = tuple[str, ...]
+Sample = tuple[str, dict[str, str], float]
+
+
+def _format_labels(labels: dict[str, str]) -> str:
+    if not labels:
+        return ""
+    pairs = ",".join(f'{name}="{_escape(value)}"' for name, value in labels.items())
+    return f"{{{pairs}}}"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", r"\\").replace('"', r"\"").replace("\n", r"\n")
+
+
+def _format_value(value: float) -> str:
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+class Metric:
+    """
+    A metric in the Prometheus text format, with one series per combination of labels.
+
+    Metrics are updated without locks: the server updates them from its event loop only.
+    """
+
+    type_name = "untyped"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+        """
+        Args:
+            name (str): The metric name, e.g. "moderation_requests_in_flight".
+            help (str): The description shown by Prometheus.
+            labelnames (Iterable[str]): The names of the labels of each series.
+        """
+        self.name = name
+        self.help = help
+        self.labelnames = tuple(labelnames)
+
+    def samples(self) -> Iterable[Sample]:
+        """Yields the (name, labels, value) of each sample of the metric."""
+        return []
+
+    def _labels(self, values: Labels) -> dict[str, str]:
+        return dict(zip(self.labelnames, values))
+
+    def render(self) -> str:
+        """Returns the metric in the Prometheus text format."""
+        lines = [
+            f"# HELP {self.name} {self.help}",
+            f"# TYPE {self.name} {self.type_name}",
+        ]
+        lines.extend(
+            f"{name}{_format_labels(labels)} {_format_value(value)}"
+            for name, labels, value in self.samples()
+        )
+        return "\n".join(lines)
+
+
+class Counter(Metric):
+    """A count that only goes up, e.g. of requests."""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, help: str, labelnames: Iterable[str] = ()) -> None:
+        super().__init__(name, help, labelnames)
+        self._values: dict[Labels, float] = {}
+
+    def inc(self, *labels: str, amount: float = 1) -> None:
+        """Adds `amount` to the series of the given label values."""
+        self._values[labels] = self._values.get(labels, 0) + amount
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self._values.items():
+            yield self.name, self._labels(labels), value
+
+
+class Gauge(Counter):
+    """A value that goes up and down, e.g. of requests in flight."""
+
+    type_name = "gauge"
+
+    def dec(self, *labels: str, amount: float = 1) -> None:
+        """Subtracts `amount` from the series of the given label values."""
+        self.inc(*labels, amount=-amount)
+
+
+class Histogram(Metric):
+    """Counts observations, e.g. latencies, in cumulative buckets."""
+
+    type_name = "histogram"
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        labelnames: Iterable[str] = (),
+        buckets: Iterable[float] = DEFAULT_BUCKETS,
+    ) -> None:
+        """
+        Args:
+            name (str): The metric name.
+            help (str): The description shown by Prometheus.
+            labelnames (Iterable[str]): The names of the labels of each series.
+            buckets (Iterable[float]): The increasing upper bounds of the buckets.
+        """
+        super().__init__(name, help, labelnames)
+        self.buckets = tuple(buckets)
+        # Per series, the count of each bucket (not cumulative), the +Inf one last, and the sum
+        self._counts: dict[Labels, list[int]] = {}
+        self._sums: dict[Labels, float] = {}
+
+    def observe(self, value: float, *labels: str) -> None:
+        """Records an observation in the series of the given label values."""
+        counts = self._counts.get(labels)
+        if counts is None:
+            counts = self._counts[labels] = [0] * (len(self.buckets) + 1)
+            self._sums[labels] = 0.0
+        counts[bisect.bisect_left(self.buckets, value)] += 1
+        self._sums[labels] += value
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, counts in self._counts.items():
+            label_dict = self._labels(labels)
+            cumulative = 0
+            for bound, count in zip((*self.buckets, math.inf), counts):
+                cumulative += count
+                bucket_labels = {**label_dict, "le": _format_value(bound)}
+                yield f"{self.name}_bucket", bucket_labels, cumulative
+            yield f"{self.name}_sum", label_dict, self._sums[labels]
+            yield f"{self.name}_count", label_dict, cumulative
+
+
+class CallbackMetric(Metric):
+    """A metric read at scrape time from state kept elsewhere, e.g. cache counters."""
+
+    def __init__(
+        self,
+        name: str,
+        help: str,
+        type_name: str,
+        callback: Callable[[], Iterable[tuple[dict[str, str], float]]],
+    ) -> None:
+        """
+        Args:
+            name (str): The metric name.
+            help (str): The description shown by Prometheus.
+            type_name (str): "counter" or "gauge".
+            callback (Callable[[], Iterable[tuple[dict[str, str], float]]]): Returns the
+                labels and value of each series.
+        """
+        super().__init__(name, help)
+        self.type_name = type_name
+        self.callback = callback
+
+    def samples(self) -> Iterable[Sample]:
+        for labels, value in self.callback():
+            yield self.name, labels, value
+
+
+M = TypeVar("M", bound=Metric)
+
+
+class MetricsRegistry:
+    """The metrics exposed on one endpoint."""
+
+    def __init__(self) -> None:
+        self.metrics: list[Metric] = []
+
+    def register(self, metric: M) -> M:
+        """Adds a metric and returns it."""
+        self.metrics.append(metric)
+        return metric
+
+    def render(self, extra: Iterable[Metric] = ()) -> str:
+        """
+        Returns every metric in the Prometheus text format.
+
+        Args:
+            extra (Iterable[Metric]): Metrics rendered after the registered ones, e.g.
+                read from objects only known at scrape time.
+
+        Returns:
+            str: The metrics, one sample per line.
+        """
+        metrics = [*self.metrics, *extra]
+        return "\n".join(metric.render() for metric in metrics) + "\n"
+
+
+class StageTimer:
+    """
+    Splits the time spent on a request into stages, each ending at a `mark`.
+
+    A stage marked several times, e.g. before and after another one, adds up.
+    """
+
+    __slots__ = ("start", "last", "stages")
+
+    def __init__(self) -> None:
+        self.start = self.last = time.perf_counter()
+        self.stages: dict[str, float] = {}
+
+    def mark(self, stage: str) -> None:
+        """Attributes the time since the previous mark, or the start, to `stage`."""
+        now = time.perf_counter()
+        self.stages[stage] = self.stages.get(stage, 0.0) + now - self.last
+        self.last = now
+
+    def elapsed(self) -> float:
+        """Returns the time since the start, in seconds."""
+        return time.perf_counter() - self.start
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware timing every HTTP request and counting the requests in flight.
+
+    Each request gets a `StageTimer` in `request.state.stage_timer` for the handlers to
+    mark their stages; the time from the last mark to the start of the response is
+    attributed to "serialization". Series are labelled with the route template, e.g.
+    "/moderate", so that their number stays bounded.
+    """
+
+    def __init__(
+        self, app, duration: Histogram, stages: Histogram, in_flight: Gauge
+    ) -> None:
+        """
+        Args:
+            app: The ASGI app.
+            duration (Histogram): Receives the total time of each request, labelled by
+                endpoint and status code.
+            stages (Histogram): Receives the time of each marked stage, labelled by
+                endpoint and stage.
+            in_flight (Gauge): The number of requests being handled.
+        """
+        self.app = app
+        self.duration = duration
+        self.stages = stages
+        self.in_flight = in_flight
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        timer = StageTimer()
+        scope.setdefault("state", {})["stage_timer"] = timer
+        status = "500"
+
+        async def send_timed(message) -> None:
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = str(message["status"])
+                if timer.stages:
+                    timer.mark("serialization")
+            await send(message)
+
+        self.in_flight.inc()
+        try:
+            await self.app(scope, receive, send_timed)
+        finally:
+            self.in_flight.dec()
+            endpoint = getattr(scope.get("route"), "path", "unmatched")
+            self.duration.observe(timer.elapsed(), endpoint, status)
+            for stage, seconds in timer.stages.items():
+                self.stages.observe(seconds, endpoint, stage)
+
+
+async def monitor_event_loop(histogram: Histogram, interval: float = 0.25) -> None:
+    """
+    Records how late the event loop wakes up from a sleep of `interval`, until cancelled.
+
+    A lag well above zero means that something blocks the loop, so every request in
+    flight is delayed by as much.
+
+    Args:
+        histogram (Histogram): Receives the lag of each wake-up, in seconds.
+        interval (float): The time between two measurements, in seconds.
+    """
+    while True:
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        histogram.observe(max(0.0, time.perf_counter() - start - interval))
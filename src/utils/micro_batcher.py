@@ -0,0 +1,114 @@
+import asyncio
+import logging
+from typing import Awaitable, Callable
+
+import openai
+from openai.types.moderation import Moderation
+
+DEFAULT_BATCH_WINDOW_MS = 0.0
+
+
+class MicroBatcher:
+    """
+    Aggregates concurrent single-content moderation requests into multi-input calls.
+
+    The first request of a batch opens a window of `window_ms` milliseconds; the batch
+    is sent when the window closes or as soon as it holds `max_batch_size` contents or
+    `max_batch_chars` characters. Each waiting request then receives its own result.
+    When OpenAI rejects a batch's input, its contents are sent one by one so that only
+    the bad content fails; any other failure is raised to every waiting request.
+    """
+
+    def __init__(
+        self,
+        moderate_batch: Callable[[list[str]], Awaitable[None | list[Moderation]]],
+        window_ms: float,
+        max_batch_size: int,
+        max_batch_chars: int,
+    ) -> None:
+        """
+        Args:
+            moderate_batch (Callable): Sends a list of contents in one upstream call.
+            window_ms (float): How long the first request of a batch waits for others.
+            max_batch_size (int): The maximum number of contents per upstream call.
+            max_batch_chars (int): The maximum total content length per upstream call.
+        """
+        self.moderate_batch = moderate_batch
+        self.window_ms = window_ms
+        self.max_batch_size = max_batch_size
+        self.max_batch_chars = max_batch_chars
+        self.requests = 0
+        self.upstream_calls = 0
+
+        self._pending: list[tuple[str, asyncio.Future]] = []
+        self._pending_chars = 0
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: set[asyncio.Task] = set()
+
+    async def submit(self, content: str) -> None | Moderation:
+        """
+        Queues a content for the next upstream batch and waits for its result.
+
+        Args:
+            content (str): The content to moderate.
+
+        Returns:
+            None | Moderation: The moderation result or None if a failure occurred.
+        """
+        loop = asyncio.get_running_loop()
+        self.requests += 1
+        if self._pending and self._pending_chars + len(content) > self.max_batch_chars:
+            self._flush()
+
+        future: asyncio.Future = loop.create_future()
+        self._pending.append((content, future))
+        self._pending_chars += len(content)
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._timer is None:
+            self._timer = loop.call_later(self.window_ms / 1000, self._flush)
+
+        return await future
+
+    def _flush(self) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        if not self._pending:
+            return
+
+        batch, self._pending, self._pending_chars = self._pending, [], 0
+        task = asyncio.get_running_loop().create_task(self._send(batch))
+        # Keep a reference so the task is not garbage collected while running
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: list[tuple[str, asyncio.Future]]) -> None:
+        self.upstream_calls += 1
+        try:
+            results = await self.moderate_batch([content for content, _ in batch])
+        except openai.BadRequestError as e:
+            if len(batch) > 1:
+                # Isolate the rejected content instead of failing every waiting request
+                logging.warning(
+                    f"Batched moderation rejected, retrying one by one: {e}"
+                )
+                await asyncio.gather(*(self._send([item]) for item in batch))
+                return
+            self._fail(batch, e)
+            return
+        except Exception as e:
+            # Splitting would multiply the calls to an upstream that is already failing
+            self._fail(batch, e)
+            return
+
+        for idx, (_, future) in enumerate(batch):
+            if not future.done():
+                future.set_result(None if results is None else results[idx])
+
+    @staticmethod
+    def _fail(batch: list[tuple[str, asyncio.Future]], error: Exception) -> None:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(error)
@@ -1,67 +1,628 @@
+import asyncio
+import functools
 import os
 import openai
-from openai.types.moderation import Moderation
+from openai.types.moderation import CategoryScores, Moderation
 import time
 import logging
+from typing import Callable, Iterable, Iterator, TypeVar
 
+from src.utils.key_pool import KeyPool, PooledKey
+from src.utils.micro_batcher import MicroBatcher
+from src.utils.rate_limiter import AdaptiveRateLimiter, retry_after_seconds
+from src.utils.score_cache import ScoreCache, content_key
+from src.utils.shared_budget import SharedBudget, estimate_tokens
+from src.utils.single_flight import AsyncSingleFlight, SingleFlight
 
-def moderate_content(
-    content: str,
-    openai_key_file: str = "openai_key.txt",
-    max_retries: int = 3,
-    retry_delay: int = 1,
-) -> None | Moderation:
+# Upper bounds for a single multi-input moderation request
+DEFAULT_BATCH_SIZE = 32
+DEFAULT_MAX_BATCH_CHARS = 32_000
+
+# With exponential backoff, the last retry comes about a minute after the first attempt
+DEFAULT_MAX_RETRIES = 7
+
+
+def load_api_keys(openai_key_file: str = "openai_key.txt") -> list[str]:
+    """
+    Loads the OpenAI API keys from the OPENAI_API_KEYS or OPENAI_API_KEY env var or from a key file.
+
+    Args:
+        openai_key_file (str): The path to the file containing the OpenAI API keys, one per line.
+
+    Returns:
+        list[str]: The OpenAI API keys.
+    """
+    # Give the option to define the openai keys with env vars instead
+    api_keys = os.getenv("OPENAI_API_KEYS")
+    if api_keys:
+        return [key.strip() for key in api_keys.split(",") if key.strip()]
+    api_key = os.getenv("OPENAI_API_KEY")
+    if api_key:
+        return [api_key]
+
+    with open(openai_key_file, "r") as key_file:
+        return [line.strip() for line in key_file if line.strip()]
+
+
+def load_api_key(openai_key_file: str = "openai_key.txt") -> str:
+    """
+    Loads the OpenAI API key from the OPENAI_API_KEY env var or from a key file.
+
+    Args:
+        openai_key_file (str): The path to the file containing the OpenAI API key.
+
+    Returns:
+        str: The OpenAI API key, the first one if several are configured.
+    """
+    return load_api_keys(openai_key_file)[0]
+
+
+T = TypeVar("T")
+
+
+def iter_batches(
+    items: Iterable[T],
+    batch_size: int,
+    max_batch_chars: int,
+    get_content: Callable[[T], str],
+) -> Iterator[list[T]]:
+    """
+    Groups items into batches bounded by an item count and a character budget.
+
+    An item whose content is longer than `max_batch_chars` is sent as a batch of one.
+
+    Args:
+        items (Iterable[T]): The items to group.
+        batch_size (int): The maximum number of items per batch.
+        max_batch_chars (int): The maximum total content length per batch.
+        get_content (Callable[[T], str]): Returns the content of an item.
+
+    Yields:
+        list[T]: The next batch of items, in input order.
+    """
+    batch: list[T] = []
+    batch_chars = 0
+
+    for item in items:
+        item_chars = len(get_content(item))
+        if batch and (
+            len(batch) >= batch_size or batch_chars + item_chars > max_batch_chars
+        ):
+            yield batch
+            batch = []
+            batch_chars = 0
+
+        batch.append(item)
+        batch_chars += item_chars
+
+    if batch:
+        yield batch
+
+
+def get_category_scores(moderation: Moderation) -> dict[str, float]:
     """
-    Moderates the given content using OpenAI's moderation API with graceful error handling.
+    Returns every category score of a moderation result, keyed by the API category names.
 
     Args:
-        content (str): The content to moderate.
-        max_retries (int): The maximum number of retry attempts in case of transient failures.
-        retry_delay (int): Delay in seconds between retries.
+        moderation (Moderation): The moderation result.
 
     Returns:
-        Dict[str, Any]: The moderation response or an empty dictionary if a failure occurred.
+        dict[str, float]: The scores keyed like the `Category` values, e.g. "self-harm".
+    """
+    scores = {}
+    for name, field in CategoryScores.model_fields.items():
+        score = getattr(moderation.category_scores, name, None)
+        if score is not None:
+            scores[field.alias or name] = float(score)
+    return scores
+
+
+class ModerationClient:
+    """
+    Long-lived client for OpenAI's moderation API with graceful error handling.
+
+    The API key is loaded once, on first use, and each underlying OpenAI client keeps
+    its own pool of keep-alive connections, so one instance should be created per process
+    and shared between threads or requests instead of configuring the global `openai` module.
+
+    Concurrent `moderate` or `amoderate` calls for the same content share a single
+    in-flight upstream call; `coalesced` counts the calls that did not make their own.
+    `retries` counts the upstream calls retried after a 429 ("rate_limit") or a
+    connection failure ("connection").
     """
 
-    retries = 0
-    # Give the option to define the openai key with env var instead
-    if os.getenv("OPENAI_API_KEY"):
-        api_key = os.getenv("OPENAI_API_KEY")
-    else:
-        with open(openai_key_file, "r") as key_file:
-            api_key = key_file.read().strip()
+    def __init__(
+        self,
+        openai_key_file: str = "openai_key.txt",
+        max_retries: int = DEFAULT_MAX_RETRIES,
+        retry_delay: float = 1,
+        api_key: str | None = None,
+        cache: ScoreCache | None = None,
+        batch_window_ms: float = 0,
+        max_batch_size: int = DEFAULT_BATCH_SIZE,
+        max_batch_chars: int = DEFAULT_MAX_BATCH_CHARS,
+        rate_limiter: AdaptiveRateLimiter | None = None,
+        shared_budget: SharedBudget | None = None,
+        api_keys: list[str] | None = None,
+        base_url: str | None = None,
+        max_key_concurrency: int | None = None,
+    ) -> None:
+        """
+        Args:
+            openai_key_file (str): The path to the file containing the OpenAI API key.
+            max_retries (int): The maximum number of attempts in case of transient failures.
+            retry_delay (float): The backoff delay in seconds of the first retry, doubled
+                on each further retry unless the server sends `Retry-After`.
+            api_key (str | None): The OpenAI API key, read from `openai_key_file` if not given.
+            cache (ScoreCache | None): Cache consulted before calling the moderation API.
+            batch_window_ms (float): When positive, concurrent `amoderate` calls arriving
+                within this window are sent together in one multi-input call.
+            max_batch_size (int): The maximum number of contents per micro-batched call.
+            max_batch_chars (int): The maximum total content length per micro-batched call.
+            rate_limiter (AdaptiveRateLimiter | None): Paces the upstream calls made with the
+                first key; by default one is created per key from `retry_delay`.
+            shared_budget (SharedBudget | None): Host-wide budget that every upstream call
+                is charged against, shared with the other processes using it.
+            api_keys (list[str] | None): Several OpenAI API keys to spread the calls over,
+                read from `openai_key_file` if neither they nor `api_key` are given.
+            base_url (str | None): The moderation API to call instead of OpenAI's, e.g. a
+                local stub (see `src.stub_upstream`) for benchmarks and tests.
+            max_key_concurrency (int | None): The upper bound of the upstream calls in
+                flight per key; by default only the callers' concurrency and 429s bound it.
+        """
+        self.openai_key_file = openai_key_file
+        self.cache = cache
+        self.batcher = (
+            MicroBatcher(
+                self._acreate_batch, batch_window_ms, max_batch_size, max_batch_chars
+            )
+            if batch_window_ms > 0
+            else None
+        )
+        self.max_retries = max_retries
+        self.retry_delay = retry_delay
+        self.shared_budget = shared_budget
+        self.base_url = base_url
+        self.max_key_concurrency = max_key_concurrency
+        self.retries = {"rate_limit": 0, "connection": 0}
+        self._api_keys = api_keys or ([api_key] if api_key else None)
+        self._rate_limiter = rate_limiter
+        self._async_client: openai.AsyncOpenAI | None = None
+        self._key_clients: dict[str, openai.OpenAI] = {}
+        self._async_key_clients: dict[str, openai.AsyncOpenAI] = {}
+        self._single_flight = SingleFlight()
+        self._async_single_flight = AsyncSingleFlight()
+
+    @property
+    def coalesced(self) -> int:
+        """The number of calls that shared an identical in-flight upstream call."""
+        return self._single_flight.coalesced + self._async_single_flight.coalesced
+
+    @functools.cached_property
+    def key_pool(self) -> KeyPool:
+        """The pool of OpenAI API keys, read from the env vars or key file only once."""
+        return KeyPool(
+            self._api_keys or load_api_keys(self.openai_key_file),
+            self.retry_delay,
+            self._rate_limiter,
+            self.max_key_concurrency,
+        )
+
+    @property
+    def api_key(self) -> str:
+        """The first OpenAI API key of the pool."""
+        return self.key_pool.keys[0].api_key
+
+    @property
+    def rate_limiter(self) -> AdaptiveRateLimiter:
+        """The rate limiter of the first OpenAI API key of the pool."""
+        return self.key_pool.keys[0].limiter
+
+    def key_usage(self) -> list[dict[str, object]]:
+        """Reports the requests made with each API key of the pool, see `KeyPool.usage`."""
+        return self.key_pool.usage()
+
+    @functools.cached_property
+    def sync_client(self) -> openai.OpenAI:
+        """The sync OpenAI client shared by all threads."""
+        # Retries are handled here rather than by the SDK
+        return openai.OpenAI(
+            api_key=self.api_key,
+            base_url=self.base_url,
+            max_retries=0,
+            http_client=openai.DefaultHttpxClient(
+                event_hooks={"response": [self._observe_response]}
+            ),
+        )
+
+    @property
+    def async_client(self) -> openai.AsyncOpenAI:
+        """The async OpenAI client, created on first use so it binds to the running loop."""
+        if self._async_client is None:
+            self._async_client = openai.AsyncOpenAI(
+                api_key=self.api_key,
+                base_url=self.base_url,
+                max_retries=0,
+                http_client=openai.DefaultAsyncHttpxClient(
+                    event_hooks={"response": [self._aobserve_response]}
+                ),
+            )
+        return self._async_client
+
+    def _observe_response(self, response) -> None:
+        """Tunes the rate limiter of the key used from the headers of every upstream response."""
+        key = self.key_pool.find(response.request.headers.get("authorization"))
+        self.key_pool.update_from_headers(
+            key or self.key_pool.keys[0], response.headers
+        )
+
+    async def _aobserve_response(self, response) -> None:
+        self._observe_response(response)
+
+    def close(self) -> None:
+        """Closes the connection pool of the sync client, if it was created, the cache and the budget."""
+        if "sync_client" in self.__dict__:
+            self.sync_client.close()
+        if self.cache is not None:
+            self.cache.close()
+        if self.shared_budget is not None:
+            self.shared_budget.close()
+
+    async def aclose(self) -> None:
+        """Closes the connection pool of the async client, if it was created."""
+        if self._async_client is not None:
+            await self._async_client.close()
+            self._async_client = None
+            self._async_key_clients.clear()
+
+    def _sync_client_for(self, key: PooledKey) -> openai.OpenAI:
+        """The sync client authorized with `key`, sharing the connection pool of the first one."""
+        if key is self.key_pool.keys[0]:
+            return self.sync_client
+        if key.api_key not in self._key_clients:
+            self._key_clients[key.api_key] = self.sync_client.with_options(
+                api_key=key.api_key
+            )
+        return self._key_clients[key.api_key]
+
+    def _async_client_for(self, key: PooledKey) -> openai.AsyncOpenAI:
+        """Async counterpart of `_sync_client_for`."""
+        if key is self.key_pool.keys[0]:
+            return self.async_client
+        if key.api_key not in self._async_key_clients:
+            self._async_key_clients[key.api_key] = self.async_client.with_options(
+                api_key=key.api_key
+            )
+        return self._async_key_clients[key.api_key]
+
+    def __enter__(self) -> "ModerationClient":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
 
-    openai.api_key = api_key
+    async def awarm_up(self, connections: int = 1) -> None:
+        """
+        Opens `connections` pooled connections ahead of the first moderation request.
 
-    while retries < max_retries:
+        A missing API key is only logged, so that a server can start, and serve the
+        requests that do not reach OpenAI, before its key is configured.
+
+        Args:
+            connections (int): The number of concurrent connections to establish.
+        """
         try:
-            # Call OpenAI's moderation API
-            response = openai.moderations.create(input=content)
+            await asyncio.gather(
+                *(self.async_client.models.list() for _ in range(connections))
+            )
+        except (openai.OpenAIError, OSError, ValueError) as e:
+            logging.warning(f"Could not warm up the OpenAI connection pool: {e}")
 
-            # Return the response if successful
-            return response.results[0]
+    def _lookup(self, contents: list[str]) -> tuple[list[Moderation | None], list[int]]:
+        """Returns the cached results of `contents` and the indices of the misses."""
+        if self.cache is None:
+            return [None] * len(contents), list(range(len(contents)))
 
-        except openai.RateLimitError as e:
-            logging.warning(
-                f"Rate limit exceeded: {e}. Retrying in {retry_delay} seconds..."
+        cached = [self.cache.get(content) for content in contents]
+        return cached, [idx for idx, result in enumerate(cached) if result is None]
+
+    @staticmethod
+    def _merge(
+        cached: list[Moderation | None],
+        missing: list[int],
+        fetched: list[None | Moderation],
+    ) -> None | list[Moderation]:
+        """Merges freshly fetched results into the cached ones; None if any failed."""
+        if any(moderation is None for moderation in fetched):
+            return None
+        for idx, moderation in zip(missing, fetched):
+            cached[idx] = moderation
+        return cached  # type: ignore[return-value]
+
+    async def _alookup(
+        self, contents: list[str]
+    ) -> tuple[list[Moderation | None], list[int]]:
+        """Async counterpart of `_lookup` that reads the disk cache off the event loop."""
+        if self.cache is None:
+            return [None] * len(contents), list(range(len(contents)))
+
+        cached = await self.cache.aget_many(contents)
+        return cached, [idx for idx, result in enumerate(cached) if result is None]
+
+    def moderate_batch(self, contents: list[str]) -> None | list[Moderation]:
+        """
+        Moderates several contents with a single multi-input call to OpenAI's moderation API.
+
+        Contents found in the cache are not sent; if all of them are cached, no call is made.
+        Identical contents, in the batch or in flight in another call, are sent only once.
+
+        Args:
+            contents (list[str]): The contents to moderate, sent together in one request.
+
+        Returns:
+            None | list[Moderation]: One moderation result per content, in the same order
+            as `contents`, or None if a failure occurred.
+        """
+        cached, missing = self._lookup(contents)
+        if not missing:
+            return cached  # type: ignore[return-value]
+
+        # Duplicates, within the batch or in flight elsewhere, are only sent once
+        keys = [content_key(contents[idx]) for idx in missing]
+        by_key = dict(zip(keys, (contents[idx] for idx in missing)))
+        fetched = self._single_flight.do_many(
+            keys,
+            lambda led: self._moderate_uncached_batch([by_key[key] for key in led]),
+        )
+        return self._merge(cached, missing, fetched)
+
+    def _moderate_uncached_batch(self, contents: list[str]) -> list[None | Moderation]:
+        results = self._create_batch(contents)
+        if results is None:
+            return [None] * len(contents)
+        if self.cache is not None:
+            for content, moderation in zip(contents, results):
+                self.cache.put(content, moderation)
+        return results  # type: ignore[return-value]
+
+    def _create_batch(self, contents: list[str]) -> None | list[Moderation]:
+        """Calls the moderation API, retrying transient failures with backoff."""
+
+        for attempt in range(self.max_retries):
+            key = self.key_pool.choose()
+            key.limiter.acquire()
+            lease = (
+                self.shared_budget.acquire(estimate_tokens(contents))
+                if self.shared_budget is not None
+                else None
             )
-            retries += 1
-            time.sleep(retry_delay)
+            succeeded = False
+            try:
+                # Call OpenAI's moderation API
+                response = self._sync_client_for(key).moderations.create(input=contents)
+
+                if len(response.results) != len(contents):
+                    raise ValueError(
+                        f"Expected {len(contents)} moderation results, got {len(response.results)}"
+                    )
+
+                # Return the response if successful
+                succeeded = True
+                return list(response.results)
+
+            except (openai.RateLimitError, openai.APIConnectionError) as e:
+                delay = self._retry_delay(e, attempt, key)
+
+            except openai.OpenAIError as e:
+                logging.error(f"OpenAI API error: {e}")
+                raise
+
+            except Exception as e:
+                logging.error(f"An unexpected error occurred: {e}")
+                raise
 
-        except openai.APIConnectionError as e:
+            finally:
+                key.limiter.release(succeeded)
+                if lease is not None:
+                    self.shared_budget.release(lease)
+
+            if delay and attempt + 1 < self.max_retries:
+                time.sleep(delay)
+
+        logging.error("Max retries reached. Failed to moderate content.")
+        return None
+
+    def _retry_delay(
+        self, error: openai.OpenAIError, attempt: int, key: PooledKey
+    ) -> float:
+        """Logs a transient failure and returns how long to wait before retrying it."""
+        delay, budget_pause = self._transient_failure(error, attempt, key)
+        if budget_pause:
+            self.shared_budget.pause(budget_pause)
+        return delay
+
+    async def _aretry_delay(
+        self, error: openai.OpenAIError, attempt: int, key: PooledKey
+    ) -> float:
+        """Async counterpart of `_retry_delay` that pauses the budget off the event loop."""
+        delay, budget_pause = self._transient_failure(error, attempt, key)
+        if budget_pause:
+            await asyncio.to_thread(self.shared_budget.pause, budget_pause)
+        return delay
+
+    def _transient_failure(
+        self, error: openai.OpenAIError, attempt: int, key: PooledKey
+    ) -> tuple[float, float]:
+        """
+        Logs a transient failure and returns how long to wait before retrying it, and how
+        long to pause the shared budget for.
+        """
+        budget_pause = 0.0
+        rate_limited = isinstance(error, openai.RateLimitError)
+        if attempt + 1 < self.max_retries:
+            self.retries["rate_limit" if rate_limited else "connection"] += 1
+
+        if not rate_limited:
+            delay = key.limiter.backoff_delay(attempt)
             logging.error(
-                f"Connection error: {e}. Retrying in {retry_delay} seconds..."
+                f"Connection error: {error}. Retrying in {delay:.2f} seconds..."
+            )
+            return delay, budget_pause
+
+        retry_after = retry_after_seconds(
+            getattr(getattr(error, "response", None), "headers", None)
+        )
+        key.limiter.throttle(retry_after)
+        delay = key.limiter.backoff_delay(attempt, retry_after)
+        self.key_pool.cooldown(key, delay)
+
+        if len(self.key_pool.keys) == 1:
+            if self.shared_budget is not None and retry_after:
+                # Hold back the other processes sharing the quota as well
+                budget_pause = retry_after
+        elif self.key_pool.available():
+            logging.warning(
+                f"Rate limit exceeded for key {key.label}: {error}. Retrying with another key..."
+            )
+            return 0.0, budget_pause
+
+        logging.warning(
+            f"Rate limit exceeded for key {key.label}: {error}. Retrying in {delay:.2f} seconds..."
+        )
+        return delay, budget_pause
+
+    def moderate(self, content: str) -> None | Moderation:
+        """
+        Moderates the given content using OpenAI's moderation API.
+
+        Args:
+            content (str): The content to moderate.
+
+        Returns:
+            None | Moderation: The moderation result or None if a failure occurred.
+        """
+        cached, missing = self._lookup([content])
+        if not missing:
+            return cached[0]
+
+        return self._single_flight.do(
+            content_key(content), lambda: self._moderate_uncached(content)
+        )
+
+    def _moderate_uncached(self, content: str) -> None | Moderation:
+        results = self._create_batch([content])
+        if results is None:
+            return None
+        if self.cache is not None:
+            self.cache.put(content, results[0])
+        return results[0]
+
+    async def amoderate_batch(self, contents: list[str]) -> None | list[Moderation]:
+        """
+        Async counterpart of `moderate_batch` that awaits the call and its retry delays.
+
+        Args:
+            contents (list[str]): The contents to moderate, sent together in one request.
+
+        Returns:
+            None | list[Moderation]: One moderation result per content, in the same order
+            as `contents`, or None if a failure occurred.
+        """
+        cached, missing = await self._alookup(contents)
+        if not missing:
+            return cached  # type: ignore[return-value]
+
+        # Duplicates, within the batch or in flight elsewhere, are only sent once
+        keys = [content_key(contents[idx]) for idx in missing]
+        by_key = dict(zip(keys, (contents[idx] for idx in missing)))
+        fetched = await self._async_single_flight.do_many(
+            keys,
+            lambda led: self._amoderate_uncached_batch([by_key[key] for key in led]),
+        )
+        return self._merge(cached, missing, fetched)
+
+    async def _amoderate_uncached_batch(
+        self, contents: list[str]
+    ) -> list[None | Moderation]:
+        results = await self._acreate_batch(contents)
+        if results is None:
+            return [None] * len(contents)
+        if self.cache is not None:
+            await self.cache.aput_many(list(zip(contents, results)))
+        return results  # type: ignore[return-value]
+
+    async def _acreate_batch(self, contents: list[str]) -> None | list[Moderation]:
+        """Async counterpart of `_create_batch`."""
+
+        for attempt in range(self.max_retries):
+            key = self.key_pool.choose()
+            await key.limiter.aacquire()
+            lease = (
+                await self.shared_budget.aacquire(estimate_tokens(contents))
+                if self.shared_budget is not None
+                else None
             )
-            retries += 1
-            time.sleep(retry_delay)
+            succeeded = False
+            try:
+                response = await self._async_client_for(key).moderations.create(
+                    input=contents
+                )
+
+                if len(response.results) != len(contents):
+                    raise ValueError(
+                        f"Expected {len(contents)} moderation results, got {len(response.results)}"
+                    )
+
+                succeeded = True
+                return list(response.results)
+
+            except (openai.RateLimitError, openai.APIConnectionError) as e:
+                delay = await self._aretry_delay(e, attempt, key)
+
+            except openai.OpenAIError as e:
+                logging.error(f"OpenAI API error: {e}")
+                raise
+
+            except Exception as e:
+                logging.error(f"An unexpected error occurred: {e}")
+                raise
+
+            finally:
+                key.limiter.release(succeeded)
+                if lease is not None:
+                    await asyncio.to_thread(self.shared_budget.release, lease)
+
+            if delay and attempt + 1 < self.max_retries:
+                await asyncio.sleep(delay)
+
+        logging.error("Max retries reached. Failed to moderate content.")
+        return None
+
+    async def amoderate(self, content: str) -> None | Moderation:
+        """
+        Async counterpart of `moderate`; cache misses go through the micro-batcher if enabled.
+
+        Args:
+            content (str): The content to moderate.
+
+        Returns:
+            None | Moderation: The moderation result or None if a failure occurred.
+        """
+        cached, missing = await self._alookup([content])
+        if not missing:
+            return cached[0]
 
-        except openai.OpenAIError as e:
-            logging.error(f"OpenAI API error: {e}")
-            raise
+        return await self._async_single_flight.do(
+            content_key(content), lambda: self._amoderate_uncached(content)
+        )
 
-        except Exception as e:
-            logging.error(f"An unexpected error occurred: {e}")
-            raise
+    async def _amoderate_uncached(self, content: str) -> None | Moderation:
+        if self.batcher is None:
+            results = await self._acreate_batch([content])
+            moderation = None if results is None else results[0]
+        else:
+            moderation = await self.batcher.submit(content)
 
-    logging.error("Max retries reached. Failed to moderate content.")
-    return None
+        if moderation is not None and self.cache is not None:
+            await self.cache.aput_many([(content, moderation)])
+        return moderation
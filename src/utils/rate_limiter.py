@@ -0,0 +1,282 @@
+import asyncio
+import math
+import random
+import re
+import threading
+import time
+from collections import deque
+from email.utils import parsedate_to_datetime
+from typing import Mapping
+
+DEFAULT_MAX_BACKOFF_SECONDS = 60.0
+
+_DURATION_PART = re.compile(r"(\d+(?:\.\d+)?)(ms|h|m|s)")
+_DURATION_UNITS = {"ms": 0.001, "s": 1.0, "m": 60.0, "h": 3600.0}
+
+
+def parse_duration(value: str) -> float | None:
+    """
+    Parses a rate-limit reset duration such as "20ms", "1.5s" or "6m0s".
+
+    Args:
+        value (str): The header value.
+
+    Returns:
+        float | None: The duration in seconds, or None if it cannot be parsed.
+    """
+    parts = _DURATION_PART.findall(value.strip())
+    if not parts or "".join(n + u for n, u in parts) != value.strip():
+        return None
+    return sum(float(number) * _DURATION_UNITS[unit] for number, unit in parts)
+
+
+def retry_after_seconds(headers: Mapping[str, str] | None) -> float | None:
+    """
+    Reads how long the server asked to wait from `retry-after-ms` or `retry-after`.
+
+    Args:
+        headers (Mapping[str, str] | None): The headers of a rate-limited response.
+
+    Returns:
+        float | None: The delay in seconds, or None if the server did not give one.
+    """
+    if not headers:
+        return None
+
+    try:
+        retry_after_ms = headers.get("retry-after-ms")
+        if retry_after_ms is not None:
+            return max(0.0, float(retry_after_ms) / 1000)
+
+        retry_after = headers.get("retry-after")
+        if retry_after is None:
+            return None
+        try:
+            return max(0.0, float(retry_after))
+        except ValueError:
+            # An HTTP date rather than a number of seconds
+            return max(
+                0.0, parsedate_to_datetime(retry_after).timestamp() - time.time()
+            )
+    except (TypeError, ValueError):
+        return None
+
+
+class AdaptiveRateLimiter:
+    """
+    Paces upstream calls to stay just below the account's rate limits.
+
+    Three mechanisms are combined, and shared by every thread or task of a client:
+
+    - a token bucket whose rate and fill level are tuned from the `x-ratelimit-*`
+      headers of each response, so requests are spread out instead of bursting into 429s
+    - a concurrency limit that grows by one per window of successful calls and halves
+      on every 429 (AIMD); it starts unbounded unless `max_concurrency` is given, so
+      only 429s lower it below the callers' own concurrency
+    - a pause of all new calls for the `Retry-After` delay of a 429, so that callers do
+      not retry in lockstep before the server is ready
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int | None = None,
+        requests_per_second: float | None = None,
+        base_delay: float = 1.0,
+        max_delay: float = DEFAULT_MAX_BACKOFF_SECONDS,
+    ) -> None:
+        """
+        Args:
+            max_concurrency (int | None): The upper bound of the adaptive concurrency limit,
+                or None for no bound other than the one learnt from 429s.
+            requests_per_second (float | None): The initial request rate, or None to leave
+                calls unpaced until the rate-limit headers are known.
+            base_delay (float): The backoff delay in seconds of the first retry.
+            max_delay (float): The maximum backoff delay in seconds.
+        """
+        self.max_concurrency = max_concurrency or math.inf
+        self.concurrency_limit = float(self.max_concurrency)
+        self.rate = requests_per_second
+        self.tokens = requests_per_second or 0.0
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.in_flight = 0
+        self.throttled = 0
+
+        self._paused_until = 0.0
+        self._refilled_at = time.monotonic()
+        self._cond = threading.Condition()
+        # Async callers waiting for a concurrency slot, woken by `release`
+        self._async_waiters: deque[asyncio.Future] = deque()
+
+    def acquire(self) -> None:
+        """Blocks until a call may be made, then takes its slot."""
+        with self._cond:
+            while True:
+                delay = self._try_acquire()
+                if delay == 0:
+                    return
+                self._cond.wait(delay)
+
+    async def aacquire(self) -> None:
+        """
+        Async counterpart of `acquire`.
+
+        Waiting for a concurrency slot does not poll: the caller sleeps until `release`
+        wakes it up. Only the delays of the rate and of pauses are timed sleeps.
+        """
+        while True:
+            waiter = None
+            with self._cond:
+                delay = self._try_acquire()
+                if delay == 0:
+                    return
+                if delay is None:
+                    waiter = asyncio.get_running_loop().create_future()
+                    self._async_waiters.append(waiter)
+
+            if waiter is None:
+                await asyncio.sleep(delay)
+                continue
+            try:
+                await waiter
+            except asyncio.CancelledError:
+                with self._cond:
+                    if waiter in self._async_waiters:
+                        self._async_waiters.remove(waiter)
+                    else:
+                        # Already woken up: hand the free slot over to the next waiter
+                        self._wake_async_waiters(1)
+                raise
+
+    def release(self, succeeded: bool) -> None:
+        """
+        Frees the slot of a finished call.
+
+        Args:
+            succeeded (bool): Whether the call succeeded, which lets the concurrency grow.
+        """
+        with self._cond:
+            self.in_flight -= 1
+            if succeeded:
+                # Additive increase: about one more slot per window of successful calls
+                self.concurrency_limit = min(
+                    self.max_concurrency,
+                    self.concurrency_limit + 1 / self.concurrency_limit,
+                )
+            self._cond.notify_all()
+            # One async waiter per free slot, so a release does not wake all of them
+            if math.isfinite(self.concurrency_limit):
+                free = math.floor(self.concurrency_limit) - self.in_flight
+                self._wake_async_waiters(max(1, free))
+            else:
+                self._wake_async_waiters()
+
+    def throttle(self, retry_after: float | None = None) -> None:
+        """
+        Reacts to a 429 by halving the concurrency and pausing for `retry_after`.
+
+        Args:
+            retry_after (float | None): The delay in seconds requested by the server.
+        """
+        with self._cond:
+            self.throttled += 1
+            # Multiplicative decrease, from the calls actually in flight while unbounded
+            current = (
+                self.concurrency_limit
+                if math.isfinite(self.concurrency_limit)
+                else self.in_flight
+            )
+            self.concurrency_limit = max(1.0, current / 2)
+            self.tokens = 0.0
+            if retry_after:
+                self._paused_until = max(
+                    self._paused_until, time.monotonic() + retry_after
+                )
+
+    def update_from_headers(self, headers: Mapping[str, str]) -> None:
+        """
+        Tunes the token bucket from the `x-ratelimit-*` headers of an upstream response.
+
+        Args:
+            headers (Mapping[str, str]): The response headers.
+        """
+        try:
+            limit = headers.get("x-ratelimit-limit-requests")
+            remaining = headers.get("x-ratelimit-remaining-requests")
+            reset = headers.get("x-ratelimit-reset-requests")
+            limit = float(limit) if limit is not None else None
+            remaining = float(remaining) if remaining is not None else None
+            reset = parse_duration(reset) if reset is not None else None
+        except (TypeError, ValueError):
+            return
+        if not limit:
+            return
+
+        with self._cond:
+            self._refill()
+            # The limit is per minute; allow bursts of at most one second of calls
+            self.rate = limit / 60
+            self.tokens = min(self.tokens, self.rate)
+            if remaining is not None and remaining < self.tokens:
+                self.tokens = remaining
+            if remaining == 0 and reset:
+                self._paused_until = max(self._paused_until, time.monotonic() + reset)
+            self._cond.notify_all()
+
+    def backoff_delay(self, attempt: int, retry_after: float | None = None) -> float:
+        """
+        Returns how long to wait before retrying a failed call.
+
+        Args:
+            attempt (int): The number of the failed attempt, starting at 0.
+            retry_after (float | None): The delay in seconds requested by the server.
+
+        Returns:
+            float: `retry_after` if given, otherwise an exponential backoff with full jitter.
+        """
+        if retry_after is not None:
+            return retry_after
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2**attempt))
+
+    def _wake_async_waiters(self, count: int | None = None) -> None:
+        """Wakes up the first `count` async waiters, or all of them; `_cond` must be held."""
+        while self._async_waiters and (count is None or count > 0):
+            waiter = self._async_waiters.popleft()
+            # The waiter may belong to the event loop of another thread
+            waiter.get_loop().call_soon_threadsafe(_wake, waiter)
+            if count is not None:
+                count -= 1
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        if self.rate is not None:
+            self.tokens = min(
+                self.rate, self.tokens + (now - self._refilled_at) * self.rate
+            )
+        self._refilled_at = now
+
+    def _try_acquire(self) -> float | None:
+        """
+        Takes a slot if one is free; otherwise returns how long to wait, or None to
+        wait for a running call to finish.
+        """
+        self._refill()
+        now = time.monotonic()
+
+        if now < self._paused_until:
+            return self._paused_until - now
+        # The limit is fractional while it grows back; only its whole slots are usable
+        if self.in_flight + 1 > self.concurrency_limit:
+            return None
+        if self.rate is not None:
+            if self.tokens < 1:
+                return (1 - self.tokens) / self.rate
+            self.tokens -= 1
+
+        self.in_flight += 1
+        return 0
+
+
+def _wake(waiter: asyncio.Future) -> None:
+    if not waiter.done():
+        waiter.set_result(None)
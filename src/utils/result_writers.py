@@ -0,0 +1,215 @@
+import json
+import os
+from typing import Any, TextIO
+
+import numpy as np
+
+from src.utils.columnar import (
+    FORMAT_NAME,
+    FORMAT_VERSION,
+    META_FILE,
+    NpyAppender,
+)
+from src.utils.journal import Journal
+
+# Completed batches held back at most, by default, to restore the input order
+DEFAULT_REORDER_BUFFER = 256
+
+
+class ResultWriter:
+    """
+    Receives moderated messages batch by batch, as the batches complete.
+
+    Each batch carries the sequence number of its position in the input. With `ordered`,
+    a batch completing ahead of an earlier one is held back until that one arrives, so
+    results are emitted in input order; `flushed` counts the batches emitted so far and
+    lets the caller bound how far ahead of it work may be scheduled.
+
+    With a `journal`, every batch is also recorded there as soon as it completes, even
+    while it is held back.
+    """
+
+    def __init__(self, ordered: bool = False, journal: Journal | None = None) -> None:
+        """
+        Args:
+            ordered (bool): Whether to emit the batches in input order.
+            journal (Journal | None): The open journal of the run, if any.
+        """
+        self.ordered = ordered
+        self.journal = journal
+        self.flushed = 0
+        self._held: dict[int, list[dict[str, Any]]] = {}
+
+    def write(self, seq: int, results: list[dict[str, Any]]) -> None:
+        """
+        Emits the results of a batch, or holds them back until the previous batches arrive.
+
+        Args:
+            seq (int): The position of the batch in the input, starting at 0.
+            results (list[dict[str, Any]]): The moderated messages of the batch.
+        """
+        if self.journal is not None:
+            self.journal.append(results)
+
+        if not self.ordered:
+            self._emit(results)
+            self.flushed += 1
+            return
+
+        self._held[seq] = results
+        while self.flushed in self._held:
+            self._emit(self._held.pop(self.flushed))
+            self.flushed += 1
+
+    def extend(self, results: list[dict[str, Any]]) -> None:
+        """
+        Emits results right away, without journaling them, e.g. those of a previous run.
+
+        Args:
+            results (list[dict[str, Any]]): The moderated messages.
+        """
+        self._emit(results)
+
+    def _emit(self, results: list[dict[str, Any]]) -> None:
+        raise NotImplementedError
+
+
+class ResultCollector(ResultWriter):
+    """Keeps the moderated messages in memory, in `results`."""
+
+    def __init__(self, ordered: bool = False, journal: Journal | None = None) -> None:
+        super().__init__(ordered, journal)
+        self.results: list[dict[str, Any]] = []
+
+    def _emit(self, results: list[dict[str, Any]]) -> None:
+        self.results.extend(results)
+
+
+class JsonlResultWriter(ResultWriter):
+    """
+    Appends moderated messages to a JSON Lines file, one per line.
+
+    The file is flushed after every batch so that the results survive an interrupted run.
+    """
+
+    def __init__(
+        self, file: TextIO, ordered: bool = False, journal: Journal | None = None
+    ) -> None:
+        """
+        Args:
+            file (TextIO): The open output file.
+            ordered (bool): Whether to write the batches in input order.
+            journal (Journal | None): The open journal of the run, if any.
+        """
+        super().__init__(ordered, journal)
+        self.file = file
+
+    def _emit(self, results: list[dict[str, Any]]) -> None:
+        for result in results:
+            self.file.write(json.dumps(result, ensure_ascii=False))
+            self.file.write("\n")
+        self.file.flush()
+
+
+class ColumnarResultWriter(ResultWriter):
+    """
+    Writes moderated messages as memory-mappable NumPy columns in a directory:
+
+    - `message_id.npy`: the message IDs, as int64
+    - `scores.npy`: the full score vectors, as a float32 matrix with one column per category
+    - `content.npy` and `content_offsets.npy`: the UTF-8 contents back to back, and the
+      offset where each one starts, followed by the total length
+    - `meta.json`: the names of the score columns and the selected categories
+
+    Rows are appended as batches complete; the headers are completed by `close`.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        categories: list[str],
+        ordered: bool = False,
+        journal: Journal | None = None,
+    ) -> None:
+        """
+        Args:
+            path (str): The output directory, created if needed.
+            categories (list[str]): The categories selected for `category_scores`.
+            ordered (bool): Whether to write the batches in input order.
+            journal (Journal | None): The open journal of the run, if any.
+        """
+        super().__init__(ordered, journal)
+        self.path = path
+        self.categories = categories
+        self.columns: list[str] | None = None
+        os.makedirs(path, exist_ok=True)
+        self._message_ids = NpyAppender(self._column_path("message_id"), np.int64)
+        self._content = NpyAppender(self._column_path("content"), np.uint8)
+        self._content_offsets = NpyAppender(
+            self._column_path("content_offsets"), np.int64
+        )
+        self._content_offsets.append([0])
+        self._content_size = 0
+        self._scores: NpyAppender | None = None
+
+    def _column_path(self, name: str) -> str:
+        return os.path.join(self.path, f"{name}.npy")
+
+    def _emit(self, results: list[dict[str, Any]]) -> None:
+        if not results:
+            return
+        if self._scores is None:
+            first = results[0]
+            self.columns = list(
+                first.get("all_category_scores") or first["category_scores"]
+            )
+            self._scores = NpyAppender(
+                self._column_path("scores"), np.float32, (len(self.columns),)
+            )
+
+        encoded = [result["content"].encode("utf-8") for result in results]
+        offsets = np.cumsum([len(content) for content in encoded]) + self._content_size
+        self._content_size = int(offsets[-1])
+
+        self._message_ids.append([result["message_id"] for result in results])
+        self._scores.append(
+            [
+                [
+                    (r.get("all_category_scores") or r["category_scores"])[column]
+                    for column in self.columns
+                ]
+                for r in results
+            ]
+        )
+        self._content.append(np.frombuffer(b"".join(encoded), dtype=np.uint8))
+        self._content_offsets.append(offsets)
+
+    def close(self) -> None:
+        """Completes the column files and writes `meta.json`."""
+        if self._scores is None:
+            # No results: an empty matrix with a column per selected category
+            self.columns = list(self.categories)
+            self._scores = NpyAppender(
+                self._column_path("scores"), np.float32, (len(self.columns),)
+            )
+        for column in (
+            self._message_ids,
+            self._scores,
+            self._content,
+            self._content_offsets,
+        ):
+            column.close()
+        meta = {
+            "format": FORMAT_NAME,
+            "version": FORMAT_VERSION,
+            "columns": self.columns,
+            "categories": self.categories,
+        }
+        with open(os.path.join(self.path, META_FILE), "w", encoding="utf-8") as file:
+            json.dump(meta, file, indent=4)
+
+    def __enter__(self) -> "ColumnarResultWriter":
+        return self
+
+    def __exit__(self, *exc_info) -> None:
+        self.close()
@@ -0,0 +1,287 @@
+import asyncio
+import hashlib
+import logging
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from openai.types.moderation import Moderation
+
+DEFAULT_CACHE_FILE = ".moderation_cache.sqlite3"
+# A full result takes about 6 KB in memory, so the memory tier stays around 60 MB
+DEFAULT_MAX_MEMORY_ENTRIES = 10_000
+DEFAULT_TTL_SECONDS = 30 * 24 * 60 * 60
+
+# Bump to invalidate entries written by an incompatible version of the cache
+CACHE_VERSION = "1"
+
+# Expired rows are purged from disk every this many writes
+_PURGE_INTERVAL = 1_000
+
+
+def normalize_content(content: str) -> str:
+    """
+    Normalizes content so that trivially different copies share a cache entry.
+
+    Args:
+        content (str): The message content.
+
+    Returns:
+        str: The NFKC-normalized content with runs of whitespace collapsed.
+    """
+    return " ".join(unicodedata.normalize("NFKC", content).split())
+
+
+def content_key(content: str, upstream: str | None = None) -> str:
+    """
+    Computes the cache key of a message content.
+
+    Args:
+        content (str): The message content.
+        upstream (str | None): The moderation API the result comes from, None for OpenAI's.
+
+    Returns:
+        str: The hex SHA-256 digest of the normalized content and of its upstream.
+    """
+    normalized = normalize_content(content)
+    # OpenAI's results keep the keys they had before other upstreams were supported
+    prefix = CACHE_VERSION if upstream is None else f"{CACHE_VERSION}\0{upstream}"
+    return hashlib.sha256(f"{prefix}\0{normalized}".encode("utf-8")).hexdigest()
+
+
+class ScoreCache:
+    """
+    Two-tier cache of moderation results keyed by a hash of the normalized content.
+
+    Results are kept in a bounded in-memory LRU and, when `path` is set, in a SQLite
+    file that persists across runs and can be shared by the CLI and the server.
+    Entries older than `ttl_seconds` are treated as misses and evicted. Results of
+    another `upstream`, e.g. a local stub, never answer for OpenAI's. The async
+    methods, for the server and the asyncio engine, only touch SQLite in worker threads.
+    """
+
+    def __init__(
+        self,
+        path: str | None = DEFAULT_CACHE_FILE,
+        max_memory_entries: int = DEFAULT_MAX_MEMORY_ENTRIES,
+        ttl_seconds: float = DEFAULT_TTL_SECONDS,
+        upstream: str | None = None,
+    ) -> None:
+        """
+        Args:
+            path (str | None): The SQLite file of the persistent tier, or None for memory only.
+            max_memory_entries (int): The maximum number of results kept in memory, each
+                taking about 6 KB.
+            ttl_seconds (float): How long a cached result stays valid.
+            upstream (str | None): The moderation API the cached results come from, e.g.
+                the base URL of a stub; None for OpenAI's.
+        """
+        self.path = path
+        self.upstream = upstream
+        self.max_memory_entries = max_memory_entries
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+        self._memory: OrderedDict[str, tuple[float, Moderation]] = OrderedDict()
+        # The memory tier never waits on the disk one, so the event loop can read it inline
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()
+        self._writes = 0
+        self._db: sqlite3.Connection | None = None
+
+        if path:
+            self._db = sqlite3.connect(path, check_same_thread=False)
+            # WAL lets several processes read while one of them writes
+            self._db.execute("PRAGMA journal_mode=WAL")
+            # A lost cache write only costs a repeated API call, so skip the fsyncs
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS scores ("
+                "key TEXT PRIMARY KEY, moderation TEXT NOT NULL, expires_at REAL NOT NULL)"
+            )
+            self._purge_expired()
+
+    def close(self) -> None:
+        """Closes the persistent tier."""
+        with self._db_lock:
+            if self._db is not None:
+                self._db.close()
+                self._db = None
+
+    def stats(self) -> dict[str, float]:
+        """
+        Returns the hit and miss counters of the cache.
+
+        Returns:
+            dict[str, float]: The `hits`, `misses` and `hit_rate` of this cache instance.
+        """
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+    def get(self, content: str) -> Moderation | None:
+        """
+        Looks up the moderation result of a content.
+
+        Args:
+            content (str): The message content.
+
+        Returns:
+            Moderation | None: The cached result, or None on a miss.
+        """
+        key = content_key(content, self.upstream)
+        now = time.time()
+        moderation = self._get_memory(key, now)
+        if moderation is None:
+            moderation = self._get_persistent([key], now)[0]
+        self._count([moderation])
+        return moderation
+
+    async def aget_many(self, contents: list[str]) -> list[Moderation | None]:
+        """
+        Async counterpart of `get` for several contents.
+
+        The memory tier is read inline and the memory misses are looked up on disk
+        together in a worker thread, so the event loop never waits on SQLite.
+
+        Args:
+            contents (list[str]): The message contents.
+
+        Returns:
+            list[Moderation | None]: The cached result of each content, None on a miss.
+        """
+        keys = [content_key(content, self.upstream) for content in contents]
+        now = time.time()
+        cached = [self._get_memory(key, now) for key in keys]
+        missing = [idx for idx, result in enumerate(cached) if result is None]
+        if missing and self._db is not None:
+            found = await asyncio.to_thread(
+                self._get_persistent, [keys[idx] for idx in missing], now
+            )
+            for idx, moderation in zip(missing, found):
+                cached[idx] = moderation
+        self._count(cached)
+        return cached
+
+    def put(self, content: str, moderation: Moderation) -> None:
+        """
+        Stores the moderation result of a content in both tiers.
+
+        Args:
+            content (str): The message content.
+            moderation (Moderation): Its full moderation result.
+        """
+        key = content_key(content, self.upstream)
+        expires_at = time.time() + self.ttl_seconds
+        self._remember(key, expires_at, moderation)
+        self._put_persistent([(key, expires_at, moderation)])
+
+    async def aput_many(self, results: list[tuple[str, Moderation]]) -> None:
+        """
+        Async counterpart of `put` for several contents.
+
+        The memory tier is updated inline and the disk tier in a worker thread, with
+        a single commit.
+
+        Args:
+            results (list[tuple[str, Moderation]]): Each content with its full result.
+        """
+        expires_at = time.time() + self.ttl_seconds
+        rows = [
+            (content_key(content, self.upstream), expires_at, moderation)
+            for content, moderation in results
+        ]
+        for row in rows:
+            self._remember(*row)
+        if rows and self._db is not None:
+            await asyncio.to_thread(self._put_persistent, rows)
+
+    def _count(self, results: list[Moderation | None]) -> None:
+        hits = sum(result is not None for result in results)
+        with self._lock:
+            self.hits += hits
+            self.misses += len(results) - hits
+
+    def _get_memory(self, key: str, now: float) -> Moderation | None:
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[0] <= now:
+                del self._memory[key]
+                return None
+            self._memory.move_to_end(key)
+            return entry[1]
+
+    def _remember(self, key: str, expires_at: float, moderation: Moderation) -> None:
+        with self._lock:
+            self._memory[key] = (expires_at, moderation)
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.max_memory_entries:
+                self._memory.popitem(last=False)
+
+    def _get_persistent(self, keys: list[str], now: float) -> list[Moderation | None]:
+        found: list[Moderation | None] = [None] * len(keys)
+        with self._db_lock:
+            if self._db is None:
+                return found
+            try:
+                rows = [
+                    self._db.execute(
+                        "SELECT moderation, expires_at FROM scores WHERE key = ?",
+                        (key,),
+                    ).fetchone()
+                    for key in keys
+                ]
+            except sqlite3.Error as e:
+                logging.warning(f"Could not read cached moderation result: {e}")
+                return found
+
+        for idx, (key, row) in enumerate(zip(keys, rows)):
+            if row is None or row[1] <= now:
+                continue
+            try:
+                found[idx] = Moderation.model_validate_json(row[0])
+            except ValueError as e:
+                logging.warning(f"Ignoring unreadable cached moderation result: {e}")
+                continue
+            # Promote to the memory tier for the next lookups
+            self._remember(key, row[1], found[idx])
+        return found
+
+    def _put_persistent(self, rows: list[tuple[str, float, Moderation]]) -> None:
+        with self._db_lock:
+            if self._db is None:
+                return
+            try:
+                with self._db:
+                    self._db.executemany(
+                        "INSERT OR REPLACE INTO scores VALUES (?, ?, ?)",
+                        [
+                            (key, moderation.model_dump_json(by_alias=True), expires_at)
+                            for key, expires_at, moderation in rows
+                        ],
+                    )
+            except sqlite3.Error as e:
+                logging.warning(f"Could not persist cached moderation result: {e}")
+                return
+
+            previous_writes = self._writes
+            self._writes += len(rows)
+            if self._writes // _PURGE_INTERVAL > previous_writes // _PURGE_INTERVAL:
+                self._purge_expired()
+
+    def _purge_expired(self) -> None:
+        try:
+            with self._db:
+                self._db.execute(
+                    "DELETE FROM scores WHERE expires_at <= ?", (time.time(),)
+                )
+        except sqlite3.Error as e:
+            logging.warning(f"Could not purge expired moderation results: {e}")
@@ -0,0 +1,230 @@
+import asyncio
+import math
+import sqlite3
+import threading
+import time
+
+DEFAULT_BUDGET_FILE = ".moderation_budget.sqlite3"
+
+# A slot held longer than this is assumed to belong to a crashed process
+DEFAULT_LEASE_SECONDS = 120.0
+
+# Rough size of a token, used to charge requests against the tokens-per-minute budget
+CHARS_PER_TOKEN = 4
+
+# How often callers check for a free concurrency slot held by another process
+_POLL_INTERVAL = 0.05
+
+
+def estimate_tokens(contents: list[str]) -> int:
+    """
+    Estimates the number of tokens a moderation request is charged.
+
+    Args:
+        contents (list[str]): The contents sent in the request.
+
+    Returns:
+        int: About one token per `CHARS_PER_TOKEN` characters, at least 1.
+    """
+    return max(
+        1, math.ceil(sum(len(content) for content in contents) / CHARS_PER_TOKEN)
+    )
+
+
+def create_shared_budget(
+    path: str,
+    requests_per_minute: float | None,
+    tokens_per_minute: float | None,
+    max_concurrency: int | None,
+) -> "SharedBudget | None":
+    """
+    Opens the shared budget if any of its limits is set.
+
+    Args:
+        path (str): The SQLite file shared by the processes.
+        requests_per_minute (float | None): The host-wide request rate.
+        tokens_per_minute (float | None): The host-wide token rate.
+        max_concurrency (int | None): The host-wide number of calls in flight.
+
+    Returns:
+        SharedBudget | None: The budget, or None when no limit is set.
+    """
+    if not (requests_per_minute or tokens_per_minute or max_concurrency):
+        return None
+    return SharedBudget(path, requests_per_minute, tokens_per_minute, max_concurrency)
+
+
+class SharedBudget:
+    """
+    Request, token and concurrency budget shared by every process using the same file.
+
+    The buckets live in a SQLite file and are updated in `BEGIN IMMEDIATE` transactions,
+    so CLI runs and server workers on one host draw from a single quota instead of each
+    assuming they have it to themselves. Each bucket holds at most one second of its
+    per-minute rate. A request larger than the token bucket is let through when the bucket
+    is not in debt, and the debt is paid back before the next one.
+    """
+
+    def __init__(
+        self,
+        path: str = DEFAULT_BUDGET_FILE,
+        requests_per_minute: float | None = None,
+        tokens_per_minute: float | None = None,
+        max_concurrency: int | None = None,
+        lease_seconds: float = DEFAULT_LEASE_SECONDS,
+    ) -> None:
+        """
+        Args:
+            path (str): The SQLite file shared by the processes.
+            requests_per_minute (float | None): The host-wide request rate, or None for no limit.
+            tokens_per_minute (float | None): The host-wide token rate, or None for no limit.
+            max_concurrency (int | None): The host-wide number of calls in flight, or None
+                for no limit.
+            lease_seconds (float): How long a concurrency slot is held at most.
+        """
+        self.path = path
+        self.requests_per_minute = requests_per_minute
+        self.tokens_per_minute = tokens_per_minute
+        self.max_concurrency = max_concurrency
+        self.lease_seconds = lease_seconds
+
+        self._lock = threading.Lock()
+        # Transactions are started explicitly so that they can take the write lock up front
+        self._db = sqlite3.connect(
+            path, timeout=30, isolation_level=None, check_same_thread=False
+        )
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS budget ("
+            "id INTEGER PRIMARY KEY CHECK (id = 0), requests REAL NOT NULL, "
+            "tokens REAL NOT NULL, updated_at REAL NOT NULL, paused_until REAL NOT NULL)"
+        )
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS leases ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, expires_at REAL NOT NULL)"
+        )
+        self._db.execute(
+            "INSERT OR IGNORE INTO budget VALUES (0, ?, ?, ?, 0)",
+            (self._request_capacity, self._token_capacity, time.time()),
+        )
+
+    @property
+    def _request_capacity(self) -> float:
+        return max(1.0, (self.requests_per_minute or 0) / 60)
+
+    @property
+    def _token_capacity(self) -> float:
+        return max(1.0, (self.tokens_per_minute or 0) / 60)
+
+    def close(self) -> None:
+        """Closes the budget file."""
+        with self._lock:
+            self._db.close()
+
+    def acquire(self, tokens: int) -> int:
+        """
+        Blocks until the budget allows a request of `tokens` tokens, then charges it.
+
+        Args:
+            tokens (int): The estimated number of tokens of the request.
+
+        Returns:
+            int: The lease of the concurrency slot, to be given back to `release`.
+        """
+        while True:
+            lease, delay = self._try_acquire(tokens)
+            if lease is not None:
+                return lease
+            time.sleep(delay)
+
+    async def aacquire(self, tokens: int) -> int:
+        """Async counterpart of `acquire`."""
+        while True:
+            # The file lock may be held by another process, so keep it off the event loop
+            lease, delay = await asyncio.to_thread(self._try_acquire, tokens)
+            if lease is not None:
+                return lease
+            await asyncio.sleep(delay)
+
+    def release(self, lease: int) -> None:
+        """
+        Gives back the concurrency slot of a finished request.
+
+        Args:
+            lease (int): The lease returned by `acquire`.
+        """
+        with self._lock:
+            self._db.execute("DELETE FROM leases WHERE id = ?", (lease,))
+
+    def pause(self, seconds: float) -> None:
+        """
+        Holds back the requests of every process, e.g. for the `Retry-After` of a 429.
+
+        Args:
+            seconds (float): How long to pause.
+        """
+        with self._lock:
+            self._db.execute(
+                "UPDATE budget SET paused_until = MAX(paused_until, ?) WHERE id = 0",
+                (time.time() + seconds,),
+            )
+
+    def _try_acquire(self, tokens: int) -> tuple[int | None, float]:
+        """Charges the request and takes a slot, or returns how long to wait."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                lease, delay = self._charge(tokens, time.time())
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return lease, delay
+
+    def _charge(self, tokens: int, now: float) -> tuple[int | None, float]:
+        requests, token_level, updated_at, paused_until = self._db.execute(
+            "SELECT requests, tokens, updated_at, paused_until FROM budget WHERE id = 0"
+        ).fetchone()
+        if now < paused_until:
+            return None, paused_until - now
+
+        elapsed = max(0.0, now - updated_at)
+        if self.requests_per_minute:
+            requests = min(
+                self._request_capacity,
+                requests + elapsed * self.requests_per_minute / 60,
+            )
+        if self.tokens_per_minute:
+            token_level = min(
+                self._token_capacity,
+                token_level + elapsed * self.tokens_per_minute / 60,
+            )
+        self._db.execute(
+            "UPDATE budget SET requests = ?, tokens = ?, updated_at = ? WHERE id = 0",
+            (requests, token_level, now),
+        )
+
+        if self.requests_per_minute and requests < 1:
+            return None, (1 - requests) * 60 / self.requests_per_minute
+        if self.tokens_per_minute and token_level <= 0:
+            return None, (-token_level + 1) * 60 / self.tokens_per_minute
+
+        if self.max_concurrency:
+            self._db.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+            (in_flight,) = self._db.execute("SELECT COUNT(*) FROM leases").fetchone()
+            if in_flight >= self.max_concurrency:
+                return None, _POLL_INTERVAL
+
+        if self.requests_per_minute:
+            requests -= 1
+        if self.tokens_per_minute:
+            token_level -= tokens
+        self._db.execute(
+            "UPDATE budget SET requests = ?, tokens = ? WHERE id = 0",
+            (requests, token_level),
+        )
+        cursor = self._db.execute(
+            "INSERT INTO leases (expires_at) VALUES (?)", (now + self.lease_seconds,)
+        )
+        return cursor.lastrowid, 0.0
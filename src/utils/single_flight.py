@@ -0,0 +1,199 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls for the same key, across threads, into one execution.
+
+    The first caller for a key runs the function; callers arriving while it is still
+    running wait for it and receive the same result or exception.
+    """
+
+    def __init__(self) -> None:
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, Future] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        """
+        Runs `fn` unless a call for `key` is already in flight, then shares its outcome.
+
+        Args:
+            key (Hashable): Identifies calls that are interchangeable.
+            fn (Callable[[], T]): The call to make.
+
+        Returns:
+            T: The result of the call made for `key`.
+        """
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+            else:
+                self.coalesced += 1
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(fn())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+    def do_many(
+        self, keys: list[Hashable], fn: Callable[[list[Hashable]], list[T]]
+    ) -> list[T]:
+        """
+        Runs `fn` once for the keys without a call in flight, then shares every outcome.
+
+        Duplicate keys in `keys`, and keys already in flight, wait for the call made for
+        them instead of being passed to `fn`.
+
+        Args:
+            keys (list[Hashable]): Identify the interchangeable calls.
+            fn (Callable[[list[Hashable]], list[T]]): Makes the calls for a list of
+                distinct keys, returning one result per key in the same order.
+
+        Returns:
+            list[T]: The result of the call made for each key, in the order of `keys`.
+        """
+        futures: dict[Hashable, Future] = {}
+        led = []
+        with self._lock:
+            for key in keys:
+                if key in futures:
+                    self.coalesced += 1
+                    continue
+                future = self._calls.get(key)
+                if future is None:
+                    future = self._calls[key] = Future()
+                    led.append(key)
+                else:
+                    self.coalesced += 1
+                futures[key] = future
+
+        if led:
+            try:
+                for key, result in zip(led, fn(led), strict=True):
+                    futures[key].set_result(result)
+            except BaseException as e:
+                for key in led:
+                    if not futures[key].done():
+                        futures[key].set_exception(e)
+            finally:
+                with self._lock:
+                    for key in led:
+                        del self._calls[key]
+        return [futures[key].result() for key in keys]
+
+
+class AsyncSingleFlight:
+    """
+    Coalesces concurrent coroutine calls for the same key into one execution.
+
+    The shared call runs as its own task, so cancelling one waiting caller does not
+    cancel it for the others.
+    """
+
+    def __init__(self) -> None:
+        self.coalesced = 0
+        self._calls: dict[Hashable, asyncio.Future] = {}
+        self._running: set[asyncio.Task] = set()
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]]) -> T:
+        """
+        Awaits `fn` unless a call for `key` is already in flight, then shares its outcome.
+
+        Args:
+            key (Hashable): Identifies calls that are interchangeable.
+            fn (Callable[[], Awaitable[T]]): Creates the coroutine to await.
+
+        Returns:
+            T: The result of the call made for `key`.
+        """
+        task = self._calls.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            task.add_done_callback(lambda _: self._calls.pop(key, None))
+
+        return await asyncio.shield(task)
+
+    async def do_many(
+        self, keys: list[Hashable], fn: Callable[[list[Hashable]], Awaitable[list[T]]]
+    ) -> list[T]:
+        """
+        Awaits `fn` once for the keys without a call in flight, then shares every outcome.
+
+        Duplicate keys in `keys`, and keys already in flight, wait for the call made for
+        them instead of being passed to `fn`.
+
+        Args:
+            keys (list[Hashable]): Identify the interchangeable calls.
+            fn (Callable[[list[Hashable]], Awaitable[list[T]]]): Creates the coroutine
+                making the calls for a list of distinct keys, which returns one result per
+                key in the same order.
+
+        Returns:
+            list[T]: The result of the call made for each key, in the order of `keys`.
+        """
+        loop = asyncio.get_running_loop()
+        futures: dict[Hashable, asyncio.Future] = {}
+        led = []
+        for key in keys:
+            if key in futures:
+                self.coalesced += 1
+                continue
+            future = self._calls.get(key)
+            if future is None:
+                future = self._calls[key] = loop.create_future()
+                led.append(key)
+            else:
+                self.coalesced += 1
+            futures[key] = future
+
+        if led:
+            task = asyncio.ensure_future(fn(led))
+            # Keep a reference so the shared call is not garbage collected while running
+            self._running.add(task)
+
+            def settle(task: asyncio.Task) -> None:
+                self._running.discard(task)
+                for key in led:
+                    self._calls.pop(key, None)
+                if task.cancelled():
+                    for key in led:
+                        futures[key].cancel()
+                    return
+                error = task.exception()
+                if error is None and len(task.result()) != len(led):
+                    error = ValueError(
+                        f"Expected {len(led)} results, got {len(task.result())}"
+                    )
+                for idx, key in enumerate(led):
+                    if error is not None:
+                        futures[key].set_exception(error)
+                    else:
+                        futures[key].set_result(task.result()[idx])
+
+            task.add_done_callback(settle)
+
+        # Every outcome is retrieved, so a shared failure is not reported as unhandled
+        results = await asyncio.gather(
+            *(asyncio.shield(futures[key]) for key in keys), return_exceptions=True
+        )
+        for result in results:
+            if isinstance(result, BaseException):
+                raise result
+        return results
@@ -0,0 +1,23 @@
+import pytest
+from openai.types.moderation import CategoryScores, Moderation
+
+
+def build_moderation(**scores: float) -> Moderation:
+    """Build a complete Moderation result, with 0.0 for every score not given."""
+    fields = CategoryScores.model_fields
+    all_scores = {
+        field.alias or name: scores.get(name, 0.0) for name, field in fields.items()
+    }
+    return Moderation.model_validate(
+        {
+            "categories": {key: score > 0.5 for key, score in all_scores.items()},
+            "category_applied_input_types": {key: ["text"] for key in all_scores},
+            "category_scores": all_scores,
+            "flagged": any(score > 0.5 for score in all_scores.values()),
+        }
+    )
+
+
+@pytest.fixture
+def make_moderation():
+    return build_moderation
@@ -1,5 +1,10 @@
+import asyncio
 from fastapi.testclient import TestClient
-from src.app import app
+from unittest import mock
+import openai
+from src.app import app, get_moderation_client
+from src.utils.openai_moderation_handler import ModerationClient
+from src.utils.score_cache import ScoreCache
 import os
 
 client = TestClient(app)
@@ -51,3 +56,244 @@ def test_authentication_required():
         },
     )
     assert response.status_code == 403  # Unauthorized
+
+
+def test_moderation_awaits_shared_async_client():
+    """Test that the endpoint awaits the shared async OpenAI client."""
+    moderation = mock.MagicMock()
+    moderation.category_scores.sexual = 0.75
+    moderation_client = ModerationClient(api_key="mock-api-key")
+    moderation_client._async_client = async_client = mock.MagicMock()
+    async_client.moderations.create = mock.AsyncMock(
+        return_value=mock.MagicMock(results=[moderation])
+    )
+    app.dependency_overrides[get_moderation_client] = lambda: moderation_client
+    try:
+        response = client.post(
+            "/moderate",
+            json={
+                "message_id": "test123",
+                "content": "This is a test message.",
+                "categories": ["sexual"],
+            },
+            headers={"Authorization": "Bearer 1234"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.json()["category_scores"] == {"sexual": 0.75}
+    async_client.moderations.create.assert_awaited_once()
+
+
+def test_moderation_client_is_resolved_on_the_event_loop():
+    """Test that the per-request dependency does not hop to the threadpool."""
+    assert asyncio.iscoroutinefunction(get_moderation_client)
+
+
+def test_moderation_unavailable():
+    """Test that exhausted retries are reported instead of crashing the handler."""
+    moderation_client = mock.MagicMock()
+    moderation_client.amoderate = mock.AsyncMock(return_value=None)
+    app.dependency_overrides[get_moderation_client] = lambda: moderation_client
+    try:
+        response = client.post(
+            "/moderate",
+            json={
+                "message_id": "test123",
+                "content": "This is a test message.",
+                "categories": ["sexual"],
+            },
+            headers={"Authorization": "Bearer 1234"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 503
+
+
+@mock.patch("src.app.ModerationClient")
+def test_startup_warms_moderation_client(mock_client_class):
+    """Test that the server warms the shared client's pool before serving requests."""
+    moderation_client = mock_client_class.return_value
+    moderation_client.awarm_up = mock.AsyncMock()
+    moderation_client.aclose = mock.AsyncMock()
+
+    with TestClient(app):
+        moderation_client.awarm_up.assert_awaited_once()
+
+    moderation_client.aclose.assert_awaited_once()
+
+
+@mock.patch.dict(
+    os.environ,
+    {"OPENAI_KEY_FILE": "missing_openai_key.txt", "MODERATION_CACHE_FILE": ""},
+)
+def test_server_starts_without_openai_key(monkeypatch):
+    """Test that a missing OpenAI key does not prevent the server from starting."""
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.delenv("OPENAI_API_KEYS", raising=False)
+
+    with TestClient(app) as started_client:
+        response = started_client.post(
+            "/moderate",
+            json={
+                "message_id": "test123",
+                "content": "This is a test message.",
+                "categories": ["invalid_category"],
+            },
+            headers={"Authorization": "Bearer 1234"},
+        )
+
+    assert response.status_code == 422
+
+
+def test_batch_moderation_reports_partial_failures(make_moderation):
+    """Test that a failing message only fails its own item of a batch."""
+
+    async def amoderate_batch(contents):
+        # OpenAI rejects the whole call, so the chunk is split to find the bad message
+        if "bad" in contents:
+            raise openai.BadRequestError(
+                "bad input", response=mock.MagicMock(), body=None
+            )
+        return [make_moderation(sexual=0.1 * len(c)) for c in contents]
+
+    moderation_client = mock.MagicMock()
+    moderation_client.amoderate_batch = amoderate_batch
+    app.dependency_overrides[get_moderation_client] = lambda: moderation_client
+    try:
+        response = client.post(
+            "/moderate/batch",
+            json={
+                "messages": [
+                    {"message_id": "1", "content": "a", "categories": ["sexual"]},
+                    {"message_id": "2", "content": "bad", "categories": ["sexual"]},
+                    {"message_id": "3", "content": "ccc", "categories": ["hate"]},
+                ]
+            },
+            headers={"Authorization": "Bearer 1234"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["message_id"] for r in results] == ["1", "2", "3"]
+    assert results[0]["category_scores"] == {"sexual": 0.1}
+    assert results[1]["category_scores"] is None and results[1]["error"]
+    assert results[2]["category_scores"] == {"hate": 0.0}
+
+
+def test_batch_moderation_fails_chunk_when_retries_are_exhausted():
+    """Test that a rate-limited chunk fails at once instead of one call per message."""
+    moderation_client = mock.MagicMock()
+    moderation_client.amoderate_batch = mock.AsyncMock(return_value=None)
+    app.dependency_overrides[get_moderation_client] = lambda: moderation_client
+    try:
+        response = client.post(
+            "/moderate/batch",
+            json={
+                "messages": [
+                    {"message_id": str(i), "content": c, "categories": ["sexual"]}
+                    for i, c in enumerate(["a", "b", "c"])
+                ]
+            },
+            headers={"Authorization": "Bearer 1234"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert all(r["error"] for r in response.json()["results"])
+    moderation_client.amoderate_batch.assert_awaited_once_with(["a", "b", "c"])
+
+
+@mock.patch.dict(os.environ, {"MODERATION_MAX_BATCH_SIZE": "2"})
+def test_batch_moderation_chunks_by_configured_batch_size(make_moderation):
+    """Test that the batch endpoint sends chunks of the server's max batch size."""
+
+    async def amoderate_batch(contents):
+        return [make_moderation() for _ in contents]
+
+    moderation_client = mock.MagicMock()
+    moderation_client.amoderate_batch = mock.AsyncMock(side_effect=amoderate_batch)
+    app.dependency_overrides[get_moderation_client] = lambda: moderation_client
+    try:
+        response = client.post(
+            "/moderate/batch",
+            json={
+                "messages": [
+                    {"message_id": str(i), "content": c, "categories": ["sexual"]}
+                    for i, c in enumerate(["a", "b", "c"])
+                ]
+            },
+            headers={"Authorization": "Bearer 1234"},
+        )
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert [
+        call.args[0] for call in moderation_client.amoderate_batch.await_args_list
+    ] == [
+        ["a", "b"],
+        ["c"],
+    ]
+
+
+def test_key_stats_reports_usage_per_key():
+    """Test that the usage of each pooled key is reported with the key masked."""
+    moderation_client = ModerationClient(api_keys=["sk-first-0001", "sk-second-0002"])
+    moderation_client.key_pool.choose()
+    app.dependency_overrides[get_moderation_client] = lambda: moderation_client
+    try:
+        response = client.get("/keys/stats", headers={"Authorization": "Bearer 1234"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert [(k["key"], k["requests"]) for k in response.json()["keys"]] == [
+        ("sk-...0001", 1),
+        ("sk-...0002", 0),
+    ]
+
+
+def test_metrics_report_stages_and_client_counters(make_moderation):
+    """Test that /metrics reports the stages of each request and the client counters."""
+    moderation_client = ModerationClient(
+        api_keys=["sk-first-0001"], cache=ScoreCache(path=None)
+    )
+
+    async def amoderate(content):
+        moderation_client.cache.get(content)
+        return make_moderation(sexual=0.5)
+
+    moderation_client.amoderate = amoderate
+    moderation_client.retries["rate_limit"] = 2
+    app.dependency_overrides[get_moderation_client] = lambda: moderation_client
+    try:
+        client.post(
+            "/moderate",
+            json={"message_id": "1", "content": "a", "categories": ["sexual"]},
+            headers={"Authorization": "Bearer 1234"},
+        )
+        response = client.get("/metrics", headers={"Authorization": "Bearer 1234"})
+    finally:
+        app.dependency_overrides.clear()
+
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.text.splitlines()
+    # Other tests also moderated, so only the presence of each series is checked
+    for stage in ["auth", "validation", "upstream", "serialization"]:
+        series = f'{{endpoint="/moderate",stage="{stage}"}}'
+        assert any(
+            line.startswith(f"moderation_request_stage_duration_seconds_count{series}")
+            for line in lines
+        )
+    assert 'moderation_upstream_retries_total{reason="rate_limit"} 2' in lines
+    assert "moderation_cache_misses_total 1" in lines
+    assert "moderation_cache_hit_ratio 0" in lines
+    # The scrape itself is in flight
+    assert "moderation_requests_in_flight 1" in lines
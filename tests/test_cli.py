@@ -0,0 +1,45 @@
+import json
+
+import pytest
+from click.testing import CliRunner
+
+from src.cli import cli
+
+
+@pytest.mark.parametrize(
+    "options",
+    [["--ordered"], ["--reorder-buffer", "8"], ["--stream", "--reorder-buffer", "8"]],
+)
+def test_moderate_rejects_ignored_ordering_options(tmp_path, options):
+    input_file = tmp_path / "conversations.json"
+    input_file.write_text(json.dumps([]))
+    output_file = tmp_path / "out.json"
+
+    result = CliRunner().invoke(
+        cli,
+        [
+            "moderate",
+            str(input_file),
+            str(output_file),
+            "--categories",
+            "hate",
+            *options,
+        ],
+    )
+
+    assert result.exit_code == 2
+    assert "--reorder-buffer" in result.output
+    assert not output_file.exists()
+
+
+def test_pipeline_rejects_reorder_buffer_without_ordered(tmp_path):
+    input_file = tmp_path / "conversations.txt"
+    input_file.write_text("")
+    output_file = tmp_path / "out.jsonl"
+
+    args = ["pipeline", str(input_file), str(output_file), "--categories", "hate"]
+
+    result = CliRunner().invoke(cli, [*args, "--reorder-buffer", "8"])
+
+    assert result.exit_code == 2
+    assert "--reorder-buffer requires --ordered" in result.output
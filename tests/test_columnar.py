@@ -0,0 +1,84 @@
+import json
+
+import numpy as np
+import pytest
+
+from src.scripts.test_client import load_results
+from src.utils.columnar import (
+    NpyAppender,
+    is_columnar,
+    iter_result_records,
+    load_columnar,
+)
+from src.utils.result_writers import ColumnarResultWriter
+
+
+def make_result(message_id, content, sexual, hate):
+    return {
+        "message_id": message_id,
+        "content": content,
+        "category_scores": {"hate": hate},
+        "all_category_scores": {"sexual": sexual, "hate": hate},
+    }
+
+
+def test_npy_appender_writes_loadable_array(tmp_path):
+    path = str(tmp_path / "scores.npy")
+    appender = NpyAppender(path, np.float32, (2,))
+    appender.append([[0.5, 0.25]])
+    appender.append(np.array([[1, 2], [3, 4]]))
+    appender.close()
+
+    array = np.load(path, mmap_mode="r")
+
+    assert array.dtype == np.float32
+    assert array.tolist() == [[0.5, 0.25], [1, 2], [3, 4]]
+
+
+def test_columnar_writer_round_trip(tmp_path):
+    path = str(tmp_path / "moderated")
+    with ColumnarResultWriter(path, ["hate"], ordered=True) as writer:
+        writer.write(1, [make_result(7, "späť", 0.5, 0.75)])
+        writer.write(0, [make_result(3, "hi", 0.25, 0.125), make_result(5, "", 0, 1)])
+
+    results = load_columnar(path)
+
+    assert is_columnar(path)
+    assert isinstance(results.scores, np.memmap)
+    assert results.message_ids.tolist() == [3, 5, 7]
+    assert results.category_scores().tolist() == [[0.125], [1.0], [0.75]]
+    assert results.category_scores(["sexual"]).tolist() == [[0.25], [0.0], [0.5]]
+    assert [results.content_at(idx) for idx in range(3)] == ["hi", "", "späť"]
+    assert list(iter_result_records(path)) == [
+        make_result(3, "hi", 0.25, 0.125),
+        make_result(5, "", 0.0, 1.0),
+        make_result(7, "späť", 0.5, 0.75),
+    ]
+
+
+def test_columnar_writer_without_results(tmp_path):
+    path = str(tmp_path / "moderated")
+    ColumnarResultWriter(path, ["hate", "sexual"]).close()
+
+    results = load_columnar(path)
+
+    assert len(results) == 0
+    assert results.category_scores().shape == (0, 2)
+
+
+def test_load_columnar_rejects_unknown_version(tmp_path):
+    with ColumnarResultWriter(str(tmp_path), ["hate"]):
+        pass
+    meta = json.loads((tmp_path / "meta.json").read_text())
+    (tmp_path / "meta.json").write_text(json.dumps({**meta, "version": 99}))
+
+    with pytest.raises(ValueError):
+        load_columnar(str(tmp_path))
+
+
+def test_load_results_reads_columnar_output(tmp_path):
+    path = str(tmp_path / "moderated")
+    with ColumnarResultWriter(path, ["hate"]) as writer:
+        writer.write(0, [make_result(3, "hi", 0.25, 0.125)])
+
+    assert load_results(path) == {3: make_result(3, "hi", 0.25, 0.125)}
@@ -1,12 +1,24 @@
 import json
+import time
+import numpy as np
 import pytest
 from unittest import mock
 from src.scripts.content_moderator import (
+    batch_messages,
     moderate_message,
+    process_batch,
     process_message,
     process_conversations,
+    process_conversations_async,
     moderate_conversations,
+    moderate_transcript,
+    project_results,
 )
+from src.scripts.file_converter import _parse_conversations, iter_conversations
+from src.utils.columnar import load_columnar
+from src.utils.json_stream import iter_json_records
+from src.utils.openai_moderation_handler import ModerationClient
+from src.utils.score_cache import ScoreCache
 from openai import OpenAIError
 
 
@@ -77,6 +89,16 @@ def categories():
     return ["sexual", "hate", "violence"]
 
 
+@pytest.fixture
+def moderation_client():
+    # Create a ModerationClient whose upstream OpenAI clients are mocked
+    client = ModerationClient(api_key="mock-api-key")
+    client.sync_client = mock.MagicMock()
+    client._async_client = mock.MagicMock()
+    client._async_client.close = mock.AsyncMock()
+    return client
+
+
 # Sample conversation data
 conversations = [
     {
@@ -89,9 +111,8 @@ conversations = [
 
 
 # Test the `moderate_message` function
-@mock.patch("openai.moderations.create")
-@mock.patch("openai.api_key", "mock-api-key")  # Mock the api_key
-def test_moderate_message(mock_create, mock_moderation_response):
+def test_moderate_message(moderation_client, mock_moderation_response):
+    mock_create = moderation_client.sync_client.moderations.create
     moderation = mock.MagicMock()
     moderation.category_scores = mock_moderation_response["results"][0][
         "category_scores"
@@ -100,21 +121,21 @@ def test_moderate_message(mock_create, mock_moderation_response):
     mock_create.return_value.results = [moderation]
 
     content = "This is a test message"
-    response = moderate_message(content)
+    response = moderate_message(content, moderation_client)
 
     assert response.category_scores["sexual"] == 0.98
     assert response.category_scores["hate"] == 0.01
 
 
 # Test the `process_message` function
-@mock.patch("openai.moderations.create")
-@mock.patch("openai.api_key", "mock-api-key")  # Mock the api_key
-def test_process_message(mock_create, mock_moderation, sample_message, categories):
+def test_process_message(
+    moderation_client, mock_moderation, sample_message, categories
+):
     # Mock the response from the OpenAI API
-    mock_create.return_value = mock_moderation
+    moderation_client.sync_client.moderations.create.return_value = mock_moderation
 
     # Call the function with the sample message
-    result = process_message(sample_message, categories)
+    result = process_message(sample_message, categories, moderation_client)
 
     # Assert that the result is as expected
     assert result["message_id"] == "1234"
@@ -135,7 +156,9 @@ def test_process_conversations(mock_process_message):
     categories = ["sexual", "violence"]
     num_threads = 2
 
-    result = process_conversations(conversations, categories, num_threads)
+    result = process_conversations(
+        conversations, categories, num_threads, mock.MagicMock()
+    )
 
     assert len(result) == 2
     assert result[0]["message_id"] == 1
@@ -160,7 +183,11 @@ def test_moderate_conversations(mock_openai, mock_process_conversations, tmp_pat
 
     # Test the moderation process
     moderate_conversations(
-        str(input_file), str(output_file), "sexual,violence", 2, str(api_key_file)
+        str(input_file),
+        str(output_file),
+        "sexual,violence",
+        2,
+        ModerationClient(str(api_key_file)),
     )
 
     # Check that output file was written with moderated content
@@ -180,6 +207,337 @@ def test_process_message_api_error(mock_moderate_message):
     message = {"message_id": 1, "content": "This is a sexual message"}
     categories = ["sexual", "violence"]
 
-    result = process_message(message, categories)
+    result = process_message(message, categories, mock.MagicMock())
 
     assert result == {}  # Expecting empty result on API error
+
+
+# Test the `process_batch` function
+def test_process_batch(moderation_client, mock_moderation, categories):
+    mock_create = moderation_client.sync_client.moderations.create
+    other = mock.MagicMock()
+    other.category_scores.sexual = 0.1
+    other.category_scores.hate = 0.2
+    other.category_scores.violence = 0.3
+    mock_create.return_value.results = [mock_moderation.results[0], other]
+
+    result = process_batch(conversations[0]["messages"], categories, moderation_client)
+
+    # A single upstream request carries both messages
+    mock_create.assert_called_once_with(
+        input=["This is a sexual message", "This is a hate message"]
+    )
+    assert [r["message_id"] for r in result] == [1, 2]
+    assert result[0]["category_scores"]["sexual"] == 0.98
+    assert result[1]["category_scores"]["violence"] == 0.3
+
+
+# Test the `batch_messages` function
+def test_batch_messages_respects_limits():
+    messages = [{"message_id": i, "content": "x" * 10} for i in range(5)]
+
+    def sizes(*args, **kwargs):
+        return [len(batch) for batch in batch_messages(messages, *args, **kwargs)]
+
+    assert sizes(2) == [2, 2, 1]
+    assert sizes(10, max_batch_chars=25) == [2, 2, 1]
+    # Oversized messages are sent on their own
+    assert sizes(10, max_batch_chars=5) == [1, 1, 1, 1, 1]
+
+
+# Test `process_conversations` with batching enabled
+@mock.patch("src.scripts.content_moderator.process_batch")
+def test_process_conversations_batched(mock_process_batch):
+    mock_process_batch.side_effect = lambda batch, *args: [
+        {"message_id": m["message_id"], "category_scores": {"sexual": 0.9}}
+        for m in batch
+    ]
+
+    result = process_conversations(
+        conversations, ["sexual"], 2, mock.MagicMock(), batch_size=2
+    )
+
+    mock_process_batch.assert_called_once()
+    assert sorted(r["message_id"] for r in result) == [1, 2]
+
+
+# Test that `process_conversations` only reads more messages as slots free up
+@mock.patch("src.scripts.content_moderator.process_message")
+def test_process_conversations_bounded(mock_process_message):
+    completed = []
+    read_ahead = []
+
+    def moderated(message, *args):
+        time.sleep(0.001)
+        completed.append(message["message_id"])
+        return {"message_id": message["message_id"]}
+
+    def counting_batches(*args, **kwargs):
+        for batch in batch_messages(*args, **kwargs):
+            read_ahead.append(len(read_ahead) + 1 - len(completed))
+            yield batch
+
+    mock_process_message.side_effect = moderated
+    many = [{"messages": [{"message_id": i, "content": "x"} for i in range(200)]}]
+    with mock.patch(
+        "src.scripts.content_moderator.batch_messages", side_effect=counting_batches
+    ):
+        result = process_conversations(many, ["sexual"], 2, mock.MagicMock())
+
+    assert sorted(r["message_id"] for r in result) == list(range(200))
+    # Twice the number of threads are pending at most, plus one batch waiting for a slot
+    assert max(read_ahead) <= 2 * 2 + 1
+
+
+# Test `process_conversations_async`
+def test_process_conversations_async(moderation_client, mock_moderation, categories):
+    mock_create = mock.AsyncMock(return_value=mock_moderation)
+    moderation_client.async_client.moderations.create = mock_create
+
+    result = process_conversations_async(
+        conversations, categories, 2, moderation_client
+    )
+
+    assert mock_create.await_count == 2
+    assert sorted(r["message_id"] for r in result) == [1, 2]
+    assert result[0]["category_scores"]["sexual"] == 0.98
+
+
+# Test that results keep the full score vector and can be projected later
+def test_project_results(moderation_client, make_moderation, tmp_path):
+    moderation_client.sync_client.moderations.create.return_value.results = [
+        make_moderation(sexual=0.9, harassment=0.4, self_harm=0.2)
+    ]
+    result = process_message(
+        {"message_id": 1, "content": "hello"}, ["sexual"], moderation_client
+    )
+    assert result["category_scores"] == {"sexual": 0.9}
+    assert result["all_category_scores"]["harassment"] == 0.4
+
+    input_file = tmp_path / "moderated.json"
+    input_file.write_text(json.dumps([result]))
+    output_file = tmp_path / "projected.json"
+
+    project_results(str(input_file), str(output_file), "harassment,self-harm")
+
+    projected = json.loads(output_file.read_text())
+    assert projected[0]["category_scores"] == {"harassment": 0.4, "self-harm": 0.2}
+    moderation_client.sync_client.moderations.create.assert_called_once()
+
+
+# Test projecting files without stored score vectors from the cache
+def test_project_results_from_cache(make_moderation, tmp_path):
+    cache = ScoreCache(path=None)
+    cache.put("hello", make_moderation(violence=0.6))
+    input_file = tmp_path / "moderated.json"
+    input_file.write_text(
+        json.dumps(
+            [
+                {"message_id": 1, "content": "hello", "category_scores": {}},
+                {"message_id": 2, "content": "unknown", "category_scores": {}},
+            ]
+        )
+    )
+    output_file = tmp_path / "projected.json"
+
+    project_results(str(input_file), str(output_file), "violence", cache)
+
+    projected = json.loads(output_file.read_text())
+    assert [p["message_id"] for p in projected] == [1]
+    assert projected[0]["category_scores"] == {"violence": 0.6}
+
+
+def write_structured_file(path, message_count, per_conversation=3):
+    messages = [
+        {"message_id": i, "content": f"message {i}"} for i in range(message_count)
+    ]
+    path.write_text(
+        json.dumps(
+            [
+                {
+                    "conversation_id": str(i),
+                    "messages": messages[i : i + per_conversation],
+                }
+                for i in range(0, message_count, per_conversation)
+            ]
+        )
+    )
+
+
+# Test that `--stream` writes JSON Lines in input order with `ordered`
+@mock.patch("src.scripts.content_moderator.process_message")
+def test_moderate_conversations_stream_ordered(mock_process_message, tmp_path):
+    def slow_even_messages(message, *args):
+        # Complete even messages late so that results arrive out of order
+        if message["message_id"] % 2 == 0:
+            time.sleep(0.01)
+        return {"message_id": message["message_id"], "category_scores": {}}
+
+    mock_process_message.side_effect = slow_even_messages
+    input_file = tmp_path / "structured.json"
+    output_file = tmp_path / "moderated.jsonl"
+    write_structured_file(input_file, 20)
+
+    moderate_conversations(
+        str(input_file),
+        str(output_file),
+        "sexual",
+        4,
+        mock.MagicMock(),
+        stream=True,
+        ordered=True,
+        reorder_buffer=2,
+    )
+
+    lines = output_file.read_text().splitlines()
+    assert [json.loads(line)["message_id"] for line in lines] == list(range(20))
+
+
+# Test streaming with the async engine and multi-input batches
+def test_moderate_conversations_stream_async(
+    moderation_client, make_moderation, tmp_path
+):
+    async def create(input):
+        return mock.MagicMock(results=[make_moderation(sexual=0.5)] * len(input))
+
+    mock_create = mock.AsyncMock(side_effect=create)
+    moderation_client.async_client.moderations.create = mock_create
+    input_file = tmp_path / "structured.json"
+    output_file = tmp_path / "moderated.jsonl"
+    write_structured_file(input_file, 10)
+
+    moderate_conversations(
+        str(input_file),
+        str(output_file),
+        "sexual",
+        2,
+        moderation_client,
+        batch_size=4,
+        engine="async",
+        stream=True,
+    )
+
+    results = [json.loads(line) for line in output_file.read_text().splitlines()]
+    assert sorted(r["message_id"] for r in results) == list(range(10))
+    assert mock_create.await_count == 3
+    assert results[0]["category_scores"] == {"sexual": 0.5}
+
+
+# Test that an interrupted run can be resumed from its journal
+@pytest.mark.parametrize("stream", [False, True])
+@mock.patch("src.scripts.content_moderator.process_message")
+def test_moderate_conversations_resume(mock_process_message, stream, tmp_path):
+    def moderated(message, categories, client):
+        all_scores = {"sexual": 0.1, "hate": 0.2}
+        if message["message_id"] == 5 and categories == ["sexual"]:
+            raise KeyboardInterrupt
+        return {
+            "message_id": message["message_id"],
+            "content": message["content"],
+            "category_scores": {c: all_scores[c] for c in categories},
+            "all_category_scores": all_scores,
+        }
+
+    mock_process_message.side_effect = moderated
+    input_file = tmp_path / "structured.json"
+    output_file = tmp_path / "moderated.json"
+    journal_file = tmp_path / "moderated.json.journal"
+    write_structured_file(input_file, 9)
+
+    def run(categories, **kwargs):
+        moderate_conversations(
+            str(input_file),
+            str(output_file),
+            categories,
+            1,
+            None,
+            stream=stream,
+            **kwargs,
+        )
+
+    run("sexual")
+    journaled = {
+        json.loads(line)["message_id"] for line in journal_file.read_text().splitlines()
+    }
+    assert {0, 1, 2, 3, 4} <= journaled and 5 not in journaled
+
+    mock_process_message.reset_mock()
+    run("hate", resume=True)
+
+    # Only the messages missing from the journal were moderated again
+    resumed_ids = {c.args[0]["message_id"] for c in mock_process_message.call_args_list}
+    assert resumed_ids == set(range(9)) - journaled
+    results = list(iter_json_records(str(output_file)))
+    assert sorted(r["message_id"] for r in results) == list(range(9))
+    # Journaled results are projected onto the categories of the resumed run
+    assert all(r["category_scores"] == {"hate": 0.2} for r in results)
+    assert not journal_file.exists()
+
+
+# Test that a transcript is moderated while it is still being parsed
+@mock.patch("src.scripts.content_moderator.process_message")
+def test_moderate_transcript(mock_process_message, tmp_path):
+    parsed = {"done": False}
+    calls_before_parsed = []
+
+    def parse_lazily(lines):
+        yield from iter_conversations(lines)
+        parsed["done"] = True
+
+    def moderate(message, *args):
+        calls_before_parsed.append(not parsed["done"])
+        return {"message_id": message["message_id"], "content": message["content"]}
+
+    mock_process_message.side_effect = moderate
+    input_file = tmp_path / "conversations.txt"
+    output_file = tmp_path / "moderated.jsonl"
+    input_file.write_text(
+        "".join(f"USER: Hi {idx}\nAmy: Hey {idx}\n\n" for idx in range(100))
+    )
+
+    with mock.patch("src.scripts.content_moderator.iter_conversations", parse_lazily):
+        moderate_transcript(
+            str(input_file), str(output_file), "sexual", 4, mock.MagicMock()
+        )
+
+    results = [json.loads(line) for line in output_file.read_text().splitlines()]
+    expected = [
+        {"message_id": m["message_id"], "content": m["content"]}
+        for conversation in _parse_conversations(str(input_file))
+        for m in conversation["messages"]
+    ]
+    assert sorted(results, key=lambda r: r["message_id"]) == expected
+    assert calls_before_parsed[0]
+    assert not (tmp_path / "moderated.jsonl.journal").exists()
+
+
+# Test that the columnar output holds the same results as the JSON output
+@pytest.mark.parametrize("stream", [False, True])
+@mock.patch("src.scripts.content_moderator.process_message")
+def test_moderate_conversations_columnar(mock_process_message, stream, tmp_path):
+    mock_process_message.side_effect = lambda message, categories, client: {
+        "message_id": message["message_id"],
+        "content": message["content"],
+        "category_scores": {"sexual": message["message_id"] / 8},
+        "all_category_scores": {"sexual": message["message_id"] / 8, "hate": 0.5},
+    }
+    input_file = tmp_path / "structured.json"
+    output_dir = tmp_path / "moderated"
+    write_structured_file(input_file, 8)
+
+    moderate_conversations(
+        str(input_file),
+        str(output_dir),
+        "sexual",
+        2,
+        mock.MagicMock(),
+        stream=stream,
+        ordered=True,
+        output_format="columnar",
+    )
+
+    results = load_columnar(str(output_dir))
+    assert sorted(results.message_ids.tolist()) == list(range(8))
+    order = np.argsort(results.message_ids)
+    assert results.category_scores()[order, 0].tolist() == [i / 8 for i in range(8)]
+    assert results.category_scores(["hate"]).ravel().tolist() == [0.5] * 8
@@ -1,6 +1,19 @@
+import io
+import json
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import click
 import pytest
-from unittest import mock
-from src.scripts.file_converter import _parse_conversations
+from src.scripts.file_converter import (
+    _map_bounded,
+    _parse_conversations,
+    convert_to_json,
+    convert_to_json_incremental,
+    iter_conversations,
+    split_at_conversations,
+    write_json_array,
+)
 
 
 @pytest.fixture
@@ -16,7 +29,6 @@ def raw_conversation_text():
 def expected_conversations():
     return [
         {
-            "conversation_id": "mock-uuid-1",
             "character_name": "Character",
             "messages": [
                 {"message_id": 0, "role_idx": 0, "content": "Hello there!"},
@@ -24,7 +36,6 @@ def expected_conversations():
             ],
         },
         {
-            "conversation_id": "mock-uuid-2",
             "character_name": "Character",
             "messages": [
                 {"message_id": 2, "role_idx": 0, "content": "How are you?"},
@@ -32,7 +43,6 @@ def expected_conversations():
             ],
         },
         {
-            "conversation_id": "mock-uuid-3",
             "character_name": "Character",
             "messages": [
                 {"message_id": 4, "role_idx": 0, "content": "What is your name?"},
@@ -42,20 +52,180 @@ def expected_conversations():
     ]
 
 
-@mock.patch("src.scripts.file_converter.open")
-def test_parse_conversations(mock_open, raw_conversation_text, expected_conversations):
-    # Mock file reading
-    mock_open.return_value.__enter__.return_value.read.return_value = (
-        raw_conversation_text
+@pytest.fixture
+def input_file(tmp_path, raw_conversation_text):
+    path = tmp_path / "conversations.txt"
+    path.write_text(raw_conversation_text, encoding="utf-8")
+    return str(path)
+
+
+def test_parse_conversations(input_file, expected_conversations):
+    result = _parse_conversations(input_file)
+
+    conversation_ids = [conversation.pop("conversation_id") for conversation in result]
+    assert result == expected_conversations
+    assert len(set(conversation_ids)) == 3
+    assert all(uuid.UUID(cid).version == 5 for cid in conversation_ids)
+
+
+def test_parse_conversations_is_deterministic(input_file):
+    assert _parse_conversations(input_file) == _parse_conversations(input_file)
+
+
+def test_repeated_conversations_get_distinct_ids():
+    lines = io.StringIO("USER: Hi\nAmy: Hey\n\nUSER: Hi\nAmy: Hey\n")
+
+    first, second = iter_conversations(lines)
+
+    assert first["conversation_id"] != second["conversation_id"]
+
+
+def test_iter_conversations_yields_each_conversation_once_closed():
+    lines = iter(["USER: Hi\n", "Amy: Hey\n", "\n", "USER: Bye\n"])
+
+    conversations = iter_conversations(lines)
+    first = next(conversations)
+
+    # The second conversation has not been read yet
+    assert [m["content"] for m in first["messages"]] == ["Hi", "Hey"]
+    assert next(lines) == "USER: Bye\n"
+
+
+def test_iter_conversations_tolerates_extra_blank_lines():
+    lines = io.StringIO("\n\nUSER: Hi\nAmy: Hey\n\n\n  \nUSER: Bye\n\n")
+
+    conversations = list(iter_conversations(lines, first_message_id=10))
+
+    assert [[m["message_id"] for m in c["messages"]] for c in conversations] == [
+        [10, 11],
+        [12],
+    ]
+    assert conversations[1]["character_name"] is None
+
+
+def test_write_json_array_matches_json_dump(input_file):
+    conversations = _parse_conversations(input_file)
+
+    for items in (conversations, []):
+        output = io.StringIO()
+        assert write_json_array(iter(items), output) == len(items)
+        assert output.getvalue() == json.dumps(items, ensure_ascii=False, indent=4)
+
+
+def test_convert_to_json(tmp_path, input_file):
+    output_file = tmp_path / "conversations.structured.json"
+
+    convert_to_json(input_file, str(output_file))
+
+    with open(output_file, encoding="utf-8") as file:
+        assert json.load(file) == _parse_conversations(input_file)
+
+
+@pytest.mark.parametrize(
+    "text",
+    [
+        "",
+        "USER: Hi\nAmy: Hey\n",
+        "\n\nUSER: Hi\nAmy: Hey\n\n \n\nUSER: Hi\nBob: Yo\r\n\r\nUSER: Bye",
+    ],
+)
+def test_parallel_parse_matches_sequential_parse(tmp_path, text):
+    input_file = tmp_path / "conversations.txt"
+    input_file.write_text("".join([text, "\n\n"] * 20), encoding="utf-8")
+    sequential, parallel = tmp_path / "sequential.json", tmp_path / "parallel.json"
+
+    convert_to_json(str(input_file), str(sequential))
+    convert_to_json(str(input_file), str(parallel), workers=2)
+
+    assert parallel.read_text(encoding="utf-8") == sequential.read_text(
+        encoding="utf-8"
     )
 
-    # Mock UUID generation to return predictable values
-    with mock.patch("src.scripts.file_converter.uuid.uuid4") as mock_uuid:
 
-        # Fix the returned value for uuid.uuid4
-        mock_uuid.side_effect = ["mock-uuid-1", "mock-uuid-2", "mock-uuid-3"]
+def test_map_bounded_submits_a_window_ahead_of_the_consumer():
+    class CountingExecutor(ThreadPoolExecutor):
+        submitted = 0
 
-        result = _parse_conversations("fake_path.txt")
+        def submit(self, *args, **kwargs):
+            self.submitted += 1
+            return super().submit(*args, **kwargs)
 
-    # Compare the result with the expected conversations
-    assert result == expected_conversations
+    with CountingExecutor(max_workers=2) as executor:
+        results = _map_bounded(executor, pow, ((v, 2) for v in range(10)), 3)
+        assert next(results) == 0
+        # No call beyond the window was submitted before the first result was taken
+        assert executor.submitted == 3
+        assert list(results) == [v * v for v in range(1, 10)]
+
+
+def test_split_at_conversations_cuts_after_blank_lines(tmp_path):
+    input_file = tmp_path / "conversations.txt"
+    data = "".join(f"USER: Hi {idx}\nAmy: Hey\n\n" for idx in range(50)).encode()
+    input_file.write_bytes(data)
+
+    ranges = split_at_conversations(str(input_file), 8)
+
+    assert len(ranges) == 8
+    assert ranges[0][0] == 0 and ranges[-1][1] == len(data)
+    for (_, end), (start, _) in zip(ranges, ranges[1:]):
+        assert end == start
+        assert data[start - 2 : start] == b"\n\n"
+
+
+@pytest.mark.parametrize("workers", [1, 2])
+def test_incremental_parse_appends_new_conversations(tmp_path, workers):
+    transcript = "".join(
+        f"USER: Hi {idx}\nAmy: Hey\nUSER: Bye\n\n" for idx in range(30)
+    )
+    input_file, output_file = tmp_path / "conversations.txt", tmp_path / "out.json"
+    full_output = tmp_path / "full.json"
+    input_file.write_text(transcript[:500], encoding="utf-8")
+
+    appended = [
+        convert_to_json_incremental(str(input_file), str(output_file), workers=workers)
+    ]
+    with open(input_file, "a", encoding="utf-8") as file:
+        file.write(transcript[500:])
+    appended.append(
+        convert_to_json_incremental(str(input_file), str(output_file), workers=workers)
+    )
+    appended.append(
+        convert_to_json_incremental(str(input_file), str(output_file), workers=workers)
+    )
+
+    convert_to_json(str(input_file), str(full_output))
+    assert output_file.read_text(encoding="utf-8") == full_output.read_text(
+        encoding="utf-8"
+    )
+    assert sum(appended) == 30 and appended[-1] == 0
+    state = json.loads((tmp_path / "out.json.state").read_text())
+    assert state["offset"] == len(transcript) and state["next_message_id"] == 90
+
+
+def test_incremental_parse_holds_back_unfinished_conversation(tmp_path):
+    input_file, output_file = tmp_path / "conversations.txt", tmp_path / "out.json"
+    input_file.write_text("USER: Hi\nAmy: Hey\n\nUSER: Still", encoding="utf-8")
+
+    assert convert_to_json_incremental(str(input_file), str(output_file)) == 1
+
+    with open(input_file, "a", encoding="utf-8") as file:
+        file.write(" typing\nAmy: Ok\n\n")
+    assert convert_to_json_incremental(str(input_file), str(output_file)) == 1
+
+    conversations = json.loads(output_file.read_text(encoding="utf-8"))
+    assert [m["content"] for m in conversations[1]["messages"]] == [
+        "Still typing",
+        "Ok",
+    ]
+    assert conversations[1]["messages"][0]["message_id"] == 2
+
+
+def test_incremental_parse_refuses_rewritten_input(tmp_path):
+    input_file, output_file = tmp_path / "conversations.txt", tmp_path / "out.json"
+    input_file.write_text("USER: Hi\nAmy: Hey\n\n", encoding="utf-8")
+    convert_to_json_incremental(str(input_file), str(output_file))
+
+    input_file.write_text("USER: Ho\nAmy: Hey\n\nUSER: New\nAmy: Yes\n\n")
+
+    with pytest.raises(click.ClickException, match="rewritten"):
+        convert_to_json_incremental(str(input_file), str(output_file))
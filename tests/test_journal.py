@@ -0,0 +1,24 @@
+from src.utils.journal import Journal
+
+
+def test_journal_appends_and_resumes(tmp_path):
+    journal = Journal(str(tmp_path / "run.journal"))
+    with journal.open():
+        journal.append([{"message_id": 1}, {"message_id": 2}])
+
+    # A crash in the middle of a write leaves a truncated last line
+    with open(journal.path, "a", encoding="utf-8") as file:
+        file.write('{"message_id": 3, "cont')
+
+    with journal.open(resume=True):
+        journal.append([{"message_id": 4}])
+    assert [e["message_id"] for e in journal.iter_entries()] == [1, 2, 4]
+
+    # Starting over discards the previous entries
+    with journal.open():
+        journal.append([{"message_id": 5}])
+    assert [e["message_id"] for e in journal.iter_entries()] == [5]
+
+    journal.remove()
+    assert not journal.exists()
+    assert list(journal.iter_entries()) == []
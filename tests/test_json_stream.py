@@ -0,0 +1,37 @@
+import io
+import json
+import pytest
+from src.utils.json_stream import iter_json_array, iter_json_records
+
+records = [
+    {"message_id": i, "content": "x" * i, "scores": [0.5, 1e-7, -3]} for i in range(50)
+]
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 1 << 16])
+def test_iter_json_array_across_chunks(chunk_size):
+    text = json.dumps(records + [12345, "end"], indent=4)
+    assert list(iter_json_array(io.StringIO(text), chunk_size)) == records + [
+        12345,
+        "end",
+    ]
+
+
+def test_iter_json_array_empty():
+    assert list(iter_json_array(io.StringIO(" [ ] "))) == []
+
+
+@pytest.mark.parametrize("text", ["", "{}", "[1,", "[1 2]"])
+def test_iter_json_array_rejects_malformed_input(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), 2))
+
+
+def test_iter_json_records_detects_format(tmp_path):
+    json_file = tmp_path / "results.json"
+    json_file.write_text(json.dumps(records, indent=4))
+    jsonl_file = tmp_path / "results.jsonl"
+    jsonl_file.write_text("\n".join(json.dumps(r) for r in records) + "\n\n")
+
+    assert list(iter_json_records(str(json_file))) == records
+    assert list(iter_json_records(str(jsonl_file))) == records
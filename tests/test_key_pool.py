@@ -0,0 +1,54 @@
+import pytest
+from src.utils.key_pool import KeyPool
+
+
+def test_choose_prefers_the_key_with_most_remaining_requests():
+    pool = KeyPool(["sk-first-0001", "sk-second-0002"])
+    first, second = pool.keys
+
+    # Keys without a known quota are tried first
+    pool.update_from_headers(first, {"x-ratelimit-remaining-requests": "10"})
+    assert pool.choose() is second
+
+    pool.update_from_headers(second, {"x-ratelimit-remaining-requests": "3"})
+    assert pool.choose() is first
+    assert first.remaining == 9
+
+
+def test_rate_limited_keys_leave_the_rotation():
+    pool = KeyPool(["sk-first-0001", "sk-second-0002"])
+    first, second = pool.keys
+
+    pool.cooldown(first, 60)
+    assert [pool.choose() for _ in range(3)] == [second] * 3
+    assert pool.available()
+
+    # With every key cooling down, the one available first is used
+    pool.cooldown(second, 120)
+    assert not pool.available()
+    assert pool.choose() is first
+
+
+def test_find_and_usage():
+    pool = KeyPool(["sk-first-0001", "sk-second-0002", "sk-first-0001"])
+    assert len(pool.keys) == 2
+    assert pool.find("Bearer sk-second-0002") is pool.keys[1]
+    assert pool.find("Bearer sk-unknown") is None
+
+    pool.choose()
+    assert pool.usage()[0] == {
+        "key": "sk-...0001",
+        "requests": 1,
+        "rate_limited": 0,
+        "remaining": None,
+    }
+
+
+def test_empty_pool_is_rejected():
+    with pytest.raises(ValueError):
+        KeyPool([])
+
+
+def test_limiters_share_the_configured_concurrency_bound():
+    pool = KeyPool(["sk-first-0001", "sk-second-0002"], max_concurrency=128)
+    assert [key.limiter.max_concurrency for key in pool.keys] == [128, 128]
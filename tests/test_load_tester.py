@@ -0,0 +1,163 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from src.scripts.load_tester import (
+    LoadTestResult,
+    _connections,
+    endpoint_exists,
+    format_summary,
+    load_contents,
+    run_load_test,
+)
+
+
+class FakeHttpClient:
+    """Answers every request after `latency` seconds with a fixed status."""
+
+    def __init__(self, latency: float = 0.0, status_code: int = 200) -> None:
+        self.latency = latency
+        self.status_code = status_code
+        self.requests = []
+
+    async def post(self, url, json=None, headers=None):
+        self.requests.append((url, json))
+        await asyncio.sleep(self.latency)
+        if self.status_code is None:
+            raise ConnectionError("refused")
+        return SimpleNamespace(status_code=self.status_code)
+
+
+def test_closed_loop_keeps_one_request_per_user():
+    client = FakeHttpClient(latency=0.01)
+    result = asyncio.run(
+        run_load_test(
+            "http://server/",
+            "key",
+            ["a", "b"],
+            ["hate"],
+            users=2,
+            duration=0.1,
+            http_client=client,
+        )
+    )
+
+    # Two users sending back to back for 0.1 s with a 10 ms latency
+    assert 10 <= len(result.latencies) <= 22
+    assert result.statuses == {"200": len(result.latencies)}
+    url, body = client.requests[0]
+    assert url == "http://server/moderate"
+    assert body == {"message_id": "0", "content": "a", "categories": ["hate"]}
+    assert client.requests[1][1]["content"] == "b"
+    assert client.requests[2][1]["content"] == "a"
+
+
+def test_open_loop_sends_at_the_requested_rate():
+    client = FakeHttpClient(latency=0.05)
+    result = asyncio.run(
+        run_load_test(
+            "http://server",
+            "key",
+            ["a", "b", "c"],
+            ["hate"],
+            endpoint="batch",
+            mode="open",
+            rps=100,
+            duration=0.2,
+            batch_size=2,
+            http_client=client,
+        )
+    )
+
+    # Requests do not wait for the previous responses
+    assert len(result.latencies) == 20
+    assert min(result.latencies) >= 0.05
+    url, body = client.requests[1]
+    assert url == "http://server/moderate/batch"
+    assert [m["content"] for m in body["messages"]] == ["c", "a"]
+    assert result.summary()["messages_per_s"] == pytest.approx(2 * 20 / result.duration)
+
+
+def test_errors_are_recorded_by_status():
+    result = asyncio.run(
+        run_load_test(
+            "http://server",
+            "key",
+            ["a"],
+            ["hate"],
+            users=1,
+            duration=0.01,
+            http_client=FakeHttpClient(status_code=None),
+        )
+    )
+
+    assert list(result.statuses) == ["ConnectionError"]
+    assert result.latencies == [] and result.error_latencies
+    summary = result.summary()
+    assert summary["error_rate"] == 1.0
+    assert summary["latency_ms"]["p50"] is None
+    assert "error latency ms" in format_summary(summary)
+
+
+def test_summary():
+    result = LoadTestResult("moderate", "closed", duration=2.0)
+    for latency in [0.001] * 90 + [0.04] * 9 + [3.0]:
+        result.record(latency, "200")
+    # Fast rejections are reported apart instead of lowering the percentiles
+    for _ in range(100):
+        result.record(0.0001, "401")
+
+    summary = result.summary()
+
+    assert summary["requests"] == 200
+    assert summary["errors"] == 100
+    assert summary["requests_per_s"] == pytest.approx(100)
+    assert summary["latency_ms"]["p50"] == pytest.approx(1.0)
+    assert summary["latency_ms"]["max"] == pytest.approx(3000.0)
+    assert summary["error_latency_ms"]["max"] == pytest.approx(0.1)
+    histogram = {bucket["le"]: bucket["count"] for bucket in summary["histogram_ms"]}
+    assert histogram[1] == 90
+    assert histogram[50] == 9
+    assert histogram[5000] == 1
+    assert sum(histogram.values()) == 100
+    assert summary["statuses"] == {"200": 100, "401": 100}
+    json.dumps(summary)
+
+
+def test_summary_without_requests():
+    summary = LoadTestResult("batch", "open").summary()
+
+    assert summary["requests"] == 0
+    assert summary["latency_ms"]["p99"] is None
+    assert summary["requests_per_s"] == 0.0
+
+
+@pytest.mark.parametrize("status_code, exists", [(422, True), (404, False)])
+def test_endpoint_exists(status_code, exists):
+    client = FakeHttpClient(status_code=status_code)
+
+    assert asyncio.run(endpoint_exists("http://server", "batch", client)) is exists
+
+
+def test_load_contents(tmp_path):
+    transcript = tmp_path / "conversations.txt"
+    transcript.write_text("User: hello\nBot: hi\n\nUser: bye\n", encoding="utf-8")
+    structured = tmp_path / "conversations.json"
+    structured.write_text(
+        json.dumps([{"messages": [{"content": "hello"}, {"content": "hi"}]}]),
+        encoding="utf-8",
+    )
+    moderated = tmp_path / "moderated.jsonl"
+    moderated.write_text(json.dumps({"content": "bye"}) + "\n", encoding="utf-8")
+
+    assert load_contents(str(transcript)) == ["hello", "hi", "bye"]
+    assert load_contents(str(structured)) == ["hello", "hi"]
+    assert load_contents(str(moderated)) == ["bye"]
+
+
+def test_open_loop_connections_are_unbounded():
+    # Requests started on schedule must not queue for one of `users` connections
+    assert _connections("closed", 16) == 16
+    assert _connections("open", 16) is None
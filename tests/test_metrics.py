@@ -0,0 +1,89 @@
+import asyncio
+import time
+
+from src.utils.metrics import (
+    CallbackMetric,
+    Counter,
+    Gauge,
+    Histogram,
+    MetricsRegistry,
+    StageTimer,
+    monitor_event_loop,
+)
+
+
+def test_counter_and_gauge():
+    registry = MetricsRegistry()
+    requests = registry.register(Counter("requests_total", "Requests.", ["path"]))
+    in_flight = registry.register(Gauge("in_flight", "In flight."))
+    requests.inc("/a")
+    requests.inc("/a", amount=2)
+    requests.inc('/"b"')
+    in_flight.inc()
+    in_flight.inc()
+    in_flight.dec()
+
+    assert registry.render() == (
+        "# HELP requests_total Requests.\n"
+        "# TYPE requests_total counter\n"
+        'requests_total{path="/a"} 3\n'
+        'requests_total{path="/\\"b\\""} 1\n'
+        "# HELP in_flight In flight.\n"
+        "# TYPE in_flight gauge\n"
+        "in_flight 1\n"
+    )
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram("latency_seconds", "Latency.", ["stage"], buckets=[0.1, 1])
+    for value in [0.05, 0.1, 0.5, 3]:
+        histogram.observe(value, "upstream")
+
+    assert histogram.render().splitlines()[2:] == [
+        'latency_seconds_bucket{stage="upstream",le="0.1"} 2',
+        'latency_seconds_bucket{stage="upstream",le="1"} 3',
+        'latency_seconds_bucket{stage="upstream",le="+Inf"} 4',
+        'latency_seconds_sum{stage="upstream"} 3.65',
+        'latency_seconds_count{stage="upstream"} 4',
+    ]
+
+
+def test_callback_metrics_are_read_at_render_time():
+    hits = {"value": 1}
+    registry = MetricsRegistry()
+    metric = CallbackMetric(
+        "hits_total", "Hits.", "counter", lambda: [({}, hits["value"])]
+    )
+    hits["value"] = 5
+
+    assert registry.render([metric]).splitlines()[-1] == "hits_total 5"
+
+
+def test_stage_timer_adds_up_repeated_stages():
+    timer = StageTimer()
+    timer.mark("validation")
+    timer.mark("auth")
+    timer.mark("validation")
+
+    assert list(timer.stages) == ["validation", "auth"]
+    assert sum(timer.stages.values()) <= timer.elapsed()
+
+
+def test_monitor_event_loop_records_stalls():
+    histogram = Histogram("lag_seconds", "Lag.", buckets=[0.01])
+
+    async def main():
+        monitor = asyncio.create_task(monitor_event_loop(histogram, interval=0.01))
+        await asyncio.sleep(0.005)
+        # Blocks the loop while the monitor sleeps
+        time.sleep(0.05)
+        await asyncio.sleep(0.02)
+        monitor.cancel()
+
+    asyncio.run(main())
+
+    samples = dict(line.rsplit(" ", 1) for line in histogram.render().splitlines()[2:])
+    assert float(samples["lag_seconds_sum"]) >= 0.03
+    assert int(samples['lag_seconds_bucket{le="+Inf"}']) > int(
+        samples['lag_seconds_bucket{le="0.01"}']
+    )
@@ -0,0 +1,72 @@
+import asyncio
+from unittest import mock
+
+import openai
+
+from src.utils.micro_batcher import MicroBatcher
+
+
+def run_concurrently(batcher, contents):
+    async def main():
+        return await asyncio.gather(
+            *(batcher.submit(content) for content in contents), return_exceptions=True
+        )
+
+    return asyncio.run(main())
+
+
+def test_concurrent_requests_share_one_upstream_call():
+    moderate_batch = mock.AsyncMock(
+        side_effect=lambda contents: [c.upper() for c in contents]
+    )
+    batcher = MicroBatcher(moderate_batch, 5, 32, 10_000)
+
+    # Each request receives the result at its own position
+    results = run_concurrently(batcher, ["a", "b", "c"])
+
+    assert results == ["A", "B", "C"]
+    moderate_batch.assert_awaited_once_with(["a", "b", "c"])
+    assert batcher.upstream_calls == 1
+
+
+def test_batches_are_bounded_by_size_and_chars():
+    moderate_batch = mock.AsyncMock(side_effect=lambda contents: contents)
+    batcher = MicroBatcher(moderate_batch, 5, 2, 10_000)
+    run_concurrently(batcher, ["a", "b", "c"])
+    assert [c.args[0] for c in moderate_batch.await_args_list] == [["a", "b"], ["c"]]
+
+    moderate_batch.reset_mock()
+    batcher = MicroBatcher(moderate_batch, 5, 32, 4)
+    run_concurrently(batcher, ["aa", "bb", "cc"])
+    assert [c.args[0] for c in moderate_batch.await_args_list] == [
+        ["aa", "bb"],
+        ["cc"],
+    ]
+
+
+def test_failing_content_only_fails_its_own_request():
+    async def moderate_batch(contents):
+        if "bad" in contents:
+            raise openai.BadRequestError(
+                "bad input", response=mock.MagicMock(), body=None
+            )
+        return contents
+
+    batcher = MicroBatcher(moderate_batch, 5, 32, 10_000)
+    results = run_concurrently(batcher, ["a", "bad", "c"])
+
+    assert results[0] == "a" and results[2] == "c"
+    assert isinstance(results[1], openai.BadRequestError)
+
+
+def test_upstream_failure_fails_the_batch_without_splitting_it():
+    error = openai.InternalServerError(
+        "server error", response=mock.MagicMock(status_code=500), body=None
+    )
+    moderate_batch = mock.AsyncMock(side_effect=error)
+    batcher = MicroBatcher(moderate_batch, 5, 32, 10_000)
+
+    results = run_concurrently(batcher, ["a", "b", "c", "d"])
+
+    assert results == [error] * 4
+    moderate_batch.assert_awaited_once_with(["a", "b", "c", "d"])
@@ -0,0 +1,172 @@
+import asyncio
+import threading
+from unittest import mock
+import openai
+from src.utils.openai_moderation_handler import (
+    ModerationClient,
+    load_api_key,
+    load_api_keys,
+)
+from src.utils.score_cache import ScoreCache
+
+
+def test_cached_contents_are_not_sent(make_moderation):
+    client = ModerationClient(api_key="mock-api-key", cache=ScoreCache(path=None))
+    client.sync_client = mock.MagicMock()
+    client.sync_client.moderations.create.side_effect = [
+        mock.MagicMock(results=[make_moderation(sexual=0.1)]),
+        mock.MagicMock(results=[make_moderation(sexual=0.3)]),
+    ]
+
+    client.moderate("first")
+    results = client.moderate_batch(["first", "second"])
+
+    # Only the content missing from the cache was sent the second time
+    assert client.sync_client.moderations.create.call_args_list == [
+        mock.call(input=["first"]),
+        mock.call(input=["second"]),
+    ]
+    assert [r.category_scores.sexual for r in results] == [0.1, 0.3]
+
+    # A fully cached batch needs no upstream call at all
+    client.moderate_batch(["second", "first"])
+    assert client.sync_client.moderations.create.call_count == 2
+
+
+def test_identical_in_flight_requests_are_coalesced(make_moderation):
+    client = ModerationClient(api_key="mock-api-key")
+    moderation = make_moderation(sexual=0.9)
+
+    async def create(input):
+        await asyncio.sleep(0.01)
+        return mock.MagicMock(results=[moderation] * len(input))
+
+    client._async_client = mock.MagicMock()
+    client._async_client.moderations.create.side_effect = create
+
+    async def main():
+        return await asyncio.gather(
+            *(client.amoderate(content) for content in ["spam", "spam", " spam "])
+        )
+
+    # Contents that normalize to the same text share one upstream call
+    assert asyncio.run(main()) == [moderation] * 3
+    assert client._async_client.moderations.create.call_count == 1
+    assert client.coalesced == 2
+
+
+def test_duplicate_contents_of_batches_are_sent_once(make_moderation):
+    client = ModerationClient(api_key="mock-api-key")
+
+    async def create(input):
+        await asyncio.sleep(0.01)
+        return mock.MagicMock(results=[make_moderation(sexual=len(c)) for c in input])
+
+    client._async_client = mock.MagicMock()
+    client._async_client.moderations.create.side_effect = create
+
+    async def main():
+        return await asyncio.gather(
+            client.amoderate_batch(["a", "bb", "a"]),
+            client.amoderate_batch(["bb", "ccc"]),
+        )
+
+    first, second = asyncio.run(main())
+
+    assert [r.category_scores.sexual for r in first + second] == [1, 2, 1, 2, 3]
+    assert [
+        c.kwargs["input"]
+        for c in client._async_client.moderations.create.call_args_list
+    ] == [["a", "bb"], ["ccc"]]
+    assert client.coalesced == 2
+
+
+def test_rate_limited_calls_honour_retry_after(make_moderation):
+    client = ModerationClient(api_key="mock-api-key", max_retries=2)
+    rate_limited = openai.RateLimitError(
+        "Rate limit exceeded",
+        response=mock.MagicMock(status_code=429, headers={"retry-after-ms": "20"}),
+        body=None,
+    )
+    client.sync_client = mock.MagicMock()
+    client.sync_client.moderations.create.side_effect = [
+        rate_limited,
+        mock.MagicMock(results=[make_moderation(sexual=0.2)]),
+    ]
+
+    with mock.patch("src.utils.openai_moderation_handler.time.sleep") as sleep:
+        moderation = client.moderate("hello")
+
+    assert moderation.category_scores.sexual == 0.2
+    sleep.assert_called_once_with(0.02)
+    assert client.rate_limiter.throttled == 1
+    assert client.rate_limiter.in_flight == 0
+    assert client.retries == {"rate_limit": 1, "connection": 0}
+
+
+def test_async_retry_pauses_the_shared_budget_off_the_event_loop(make_moderation):
+    shared_budget = mock.MagicMock()
+    shared_budget.aacquire = mock.AsyncMock(return_value=None)
+    pause_threads = []
+    shared_budget.pause.side_effect = lambda _: pause_threads.append(
+        threading.current_thread()
+    )
+    client = ModerationClient(
+        api_key="mock-api-key", max_retries=2, shared_budget=shared_budget
+    )
+    rate_limited = openai.RateLimitError(
+        "Rate limit exceeded",
+        response=mock.MagicMock(status_code=429, headers={"retry-after-ms": "20"}),
+        body=None,
+    )
+    client._async_client = mock.MagicMock()
+    client._async_client.moderations.create = mock.AsyncMock(
+        side_effect=[
+            rate_limited,
+            mock.MagicMock(results=[make_moderation(sexual=0.2)]),
+        ]
+    )
+
+    moderation = asyncio.run(client.amoderate("hello"))
+
+    assert moderation.category_scores.sexual == 0.2
+    shared_budget.pause.assert_called_once_with(0.02)
+    assert pause_threads != [threading.main_thread()]
+
+
+def test_rate_limited_key_is_replaced_by_another(make_moderation):
+    client = ModerationClient(api_keys=["sk-first-0001", "sk-second-0002"])
+    client.sync_client = mock.MagicMock()
+    client.sync_client.moderations.create.side_effect = openai.RateLimitError(
+        "Rate limit exceeded",
+        response=mock.MagicMock(status_code=429, headers={}),
+        body=None,
+    )
+    second_client = client.sync_client.with_options.return_value
+    second_client.moderations.create.return_value.results = [
+        make_moderation(sexual=0.2)
+    ]
+
+    with mock.patch("src.utils.openai_moderation_handler.time.sleep") as sleep:
+        moderation = client.moderate("hello")
+
+    # The call was retried right away with the second key
+    assert moderation.category_scores.sexual == 0.2
+    client.sync_client.with_options.assert_called_once_with(api_key="sk-second-0002")
+    sleep.assert_not_called()
+    assert [(u["requests"], u["rate_limited"]) for u in client.key_usage()] == [
+        (1, 1),
+        (1, 0),
+    ]
+
+
+def test_load_api_keys(tmp_path, monkeypatch):
+    monkeypatch.delenv("OPENAI_API_KEY", raising=False)
+    monkeypatch.delenv("OPENAI_API_KEYS", raising=False)
+    key_file = tmp_path / "keys.txt"
+    key_file.write_text("sk-one\n\nsk-two\n")
+    assert load_api_keys(str(key_file)) == ["sk-one", "sk-two"]
+    assert load_api_key(str(key_file)) == "sk-one"
+
+    monkeypatch.setenv("OPENAI_API_KEYS", "sk-a, sk-b")
+    assert load_api_keys(str(key_file)) == ["sk-a", "sk-b"]
@@ -0,0 +1,139 @@
+import asyncio
+import time
+from email.utils import formatdate
+import pytest
+from src.utils.rate_limiter import (
+    AdaptiveRateLimiter,
+    parse_duration,
+    retry_after_seconds,
+)
+
+
+@pytest.mark.parametrize(
+    "value, expected",
+    [("20ms", 0.02), ("1.5s", 1.5), ("6m0s", 360.0), ("1h2m", 3720.0), ("soon", None)],
+)
+def test_parse_duration(value, expected):
+    assert parse_duration(value) == expected
+
+
+def test_retry_after_seconds():
+    assert retry_after_seconds({"retry-after-ms": "250", "retry-after": "9"}) == 0.25
+    assert retry_after_seconds({"retry-after": "2"}) == 2.0
+    assert 8 <= retry_after_seconds({"retry-after": formatdate(time.time() + 10)}) <= 10
+    assert retry_after_seconds({"retry-after": "later"}) is None
+    assert retry_after_seconds({}) is None
+
+
+def test_concurrency_halves_on_429_and_grows_back():
+    limiter = AdaptiveRateLimiter(max_concurrency=8)
+    limiter.throttle()
+    limiter.throttle()
+    assert limiter.concurrency_limit == 2
+
+    # Two slots are available, the third caller has to wait for a release
+    limiter.acquire()
+    limiter.acquire()
+    assert limiter._try_acquire() is None
+
+    for _ in range(4):
+        limiter.release(succeeded=True)
+        limiter.acquire()
+    assert 3 <= limiter.concurrency_limit < 4
+
+
+def test_concurrency_is_unbounded_until_a_429():
+    limiter = AdaptiveRateLimiter()
+    for _ in range(1000):
+        limiter.acquire()
+
+    # The limit halves from the calls actually in flight
+    limiter.throttle()
+    assert limiter.concurrency_limit == 500
+    assert limiter._try_acquire() is None
+
+
+def test_token_bucket_is_tuned_from_headers():
+    limiter = AdaptiveRateLimiter()
+    limiter.update_from_headers(
+        {
+            "x-ratelimit-limit-requests": "600",
+            "x-ratelimit-remaining-requests": "599",
+            "x-ratelimit-reset-requests": "100ms",
+        }
+    )
+    assert limiter.rate == 10
+
+    # 600 requests per minute are spread out to one every 100 ms
+    start = time.monotonic()
+    for _ in range(3):
+        limiter.acquire()
+        limiter.release(succeeded=True)
+    assert time.monotonic() - start >= 0.15
+
+
+def test_retry_after_pauses_every_caller():
+    limiter = AdaptiveRateLimiter()
+    limiter.throttle(retry_after=0.05)
+
+    async def acquire():
+        start = time.monotonic()
+        await limiter.aacquire()
+        return time.monotonic() - start
+
+    assert asyncio.run(acquire()) >= 0.04
+
+
+def test_async_callers_wait_for_a_slot_without_polling():
+    limiter = AdaptiveRateLimiter(max_concurrency=1)
+    attempts = 0
+    try_acquire = limiter._try_acquire
+
+    def counting_try_acquire():
+        nonlocal attempts
+        attempts += 1
+        return try_acquire()
+
+    limiter._try_acquire = counting_try_acquire
+
+    async def call():
+        await limiter.aacquire()
+        await asyncio.sleep(0)
+        limiter.release(True)
+
+    async def main():
+        limiter.acquire()
+        tasks = [asyncio.ensure_future(call()) for _ in range(50)]
+        await asyncio.sleep(0.05)
+        # One attempt each while the slot is taken, however long they wait
+        waiting_attempts = attempts
+        limiter.release(True)
+        await asyncio.gather(*tasks)
+        return waiting_attempts
+
+    assert asyncio.run(main()) == 51
+    assert limiter.in_flight == 0
+
+
+def test_cancelled_async_waiter_hands_its_wakeup_over():
+    limiter = AdaptiveRateLimiter(max_concurrency=1)
+
+    async def main():
+        limiter.acquire()
+        first = asyncio.ensure_future(limiter.aacquire())
+        second = asyncio.ensure_future(limiter.aacquire())
+        await asyncio.sleep(0)
+        # The first waiter is woken up, then cancelled before it takes the slot
+        limiter.release(True)
+        first.cancel()
+        await asyncio.wait_for(second, timeout=1)
+
+    asyncio.run(main())
+    assert limiter.in_flight == 1
+
+
+def test_backoff_delay():
+    limiter = AdaptiveRateLimiter(base_delay=1, max_delay=10)
+    assert limiter.backoff_delay(3, retry_after=7) == 7
+    assert all(0 <= limiter.backoff_delay(2) <= 4 for _ in range(100))
+    assert all(limiter.backoff_delay(10) <= 10 for _ in range(100))
@@ -0,0 +1,88 @@
+import asyncio
+from unittest import mock
+from src.utils.score_cache import ScoreCache, content_key
+
+
+def test_content_key_normalizes_whitespace():
+    assert content_key("hello   there ") == content_key("hello there")
+    assert content_key("hello there") != content_key("Hello there")
+
+
+def test_memory_tier_hits_and_misses(make_moderation):
+    cache = ScoreCache(path=None)
+
+    assert cache.get("hi") is None
+    cache.put("hi", make_moderation(sexual=0.2))
+
+    assert cache.get(" hi").category_scores.sexual == 0.2
+    assert cache.stats() == {"hits": 1, "misses": 1, "hit_rate": 0.5}
+
+
+def test_memory_tier_is_bounded(make_moderation):
+    cache = ScoreCache(path=None, max_memory_entries=2)
+    for content in ["a", "b", "c"]:
+        cache.put(content, make_moderation())
+
+    # The least recently used entry was evicted
+    assert cache.get("a") is None
+    assert cache.get("c") is not None
+
+
+def test_persistent_tier_survives_restarts(tmp_path, make_moderation):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ScoreCache(path)
+    cache.put("hello", make_moderation(hate=0.7))
+    cache.close()
+
+    reopened = ScoreCache(path)
+    assert reopened.get("hello").category_scores.hate == 0.7
+    reopened.close()
+
+
+def test_results_of_another_upstream_are_not_shared(tmp_path, make_moderation):
+    path = str(tmp_path / "cache.sqlite3")
+    stub_cache = ScoreCache(path, upstream="http://127.0.0.1:8001/v1")
+    stub_cache.put("hello", make_moderation(hate=0.7))
+    stub_cache.close()
+
+    openai_cache = ScoreCache(path)
+    assert openai_cache.get("hello") is None
+    openai_cache.close()
+    reopened = ScoreCache(path, upstream="http://127.0.0.1:8001/v1")
+    assert reopened.get("hello").category_scores.hate == 0.7
+    reopened.close()
+
+
+def test_expired_entries_are_misses(tmp_path, make_moderation):
+    cache = ScoreCache(str(tmp_path / "cache.sqlite3"), ttl_seconds=60)
+    cache.put("hello", make_moderation())
+
+    with mock.patch("src.utils.score_cache.time.time", return_value=1e12):
+        assert cache.get("hello") is None
+    cache.close()
+
+
+def test_async_lookups_read_and_write_both_tiers(tmp_path, make_moderation):
+    path = str(tmp_path / "cache.sqlite3")
+    cache = ScoreCache(path)
+    asyncio.run(cache.aput_many([("hello", make_moderation(hate=0.7))]))
+    cache.close()
+
+    reopened = ScoreCache(path)
+    cached = asyncio.run(reopened.aget_many(["hello", "other"]))
+
+    assert cached[0].category_scores.hate == 0.7 and cached[1] is None
+    assert reopened.stats()["hits"] == 1 and reopened.stats()["misses"] == 1
+    reopened.close()
+
+
+def test_memory_hits_do_not_wait_on_the_disk_tier(tmp_path, make_moderation):
+    cache = ScoreCache(str(tmp_path / "cache.sqlite3"))
+    cache.put("hello", make_moderation())
+
+    # As if another thread were committing a write
+    with cache._db_lock:
+        cached = asyncio.run(cache.aget_many(["hello"]))
+
+    assert cached[0] is not None
+    cache.close()
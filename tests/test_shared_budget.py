@@ -0,0 +1,57 @@
+import time
+from src.utils.shared_budget import SharedBudget, create_shared_budget, estimate_tokens
+
+
+def test_requests_per_minute_is_shared(tmp_path):
+    path = str(tmp_path / "budget.sqlite3")
+    # Two instances on one file stand for two processes
+    first = SharedBudget(path, requests_per_minute=600)
+    second = SharedBudget(path, requests_per_minute=600)
+
+    # The bucket holds one second of requests, whoever draws from it
+    for _ in range(10):
+        first.release(first.acquire(1))
+    lease, delay = second._try_acquire(1)
+    assert lease is None and 0 < delay <= 0.1
+
+    start = time.monotonic()
+    second.release(second.acquire(1))
+    assert time.monotonic() - start >= 0.05
+
+
+def test_tokens_per_minute_lets_large_requests_through_once(tmp_path):
+    budget = SharedBudget(str(tmp_path / "budget.sqlite3"), tokens_per_minute=600)
+    budget.release(budget.acquire(estimate_tokens(["x" * 400])))
+
+    # The bucket is now 90 tokens in debt, paid back at 10 tokens per second
+    lease, delay = budget._try_acquire(1)
+    assert lease is None and delay > 9
+
+
+def test_concurrency_is_shared_and_leases_expire(tmp_path):
+    path = str(tmp_path / "budget.sqlite3")
+    first = SharedBudget(path, max_concurrency=1)
+    second = SharedBudget(path, max_concurrency=1)
+
+    lease = first.acquire(1)
+    assert second._try_acquire(1)[0] is None
+    first.release(lease)
+    second.release(second.acquire(1))
+
+    # A slot left behind by a crashed process is reclaimed after its lease
+    crashed = SharedBudget(path, max_concurrency=1, lease_seconds=0.01)
+    crashed.acquire(1)
+    time.sleep(0.02)
+    assert second._try_acquire(1)[0] is not None
+
+
+def test_pause_holds_back_every_process(tmp_path):
+    path = str(tmp_path / "budget.sqlite3")
+    SharedBudget(path).pause(5)
+    lease, delay = SharedBudget(path)._try_acquire(1)
+    assert lease is None and 4 < delay <= 5
+
+
+def test_no_budget_without_limits(tmp_path):
+    assert create_shared_budget(str(tmp_path / "b"), None, None, None) is None
+    assert create_shared_budget(str(tmp_path / "b"), 60, None, None) is not None
@@ -0,0 +1,132 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from src.utils.single_flight import AsyncSingleFlight, SingleFlight
+
+
+def test_concurrent_threads_share_one_call():
+    flight = SingleFlight()
+    release = threading.Event()
+    calls = []
+
+    def slow_call():
+        calls.append(1)
+        release.wait(timeout=5)
+        return "result"
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        futures = [executor.submit(flight.do, "key", slow_call) for _ in range(4)]
+        # Wait until the followers are queued behind the leader
+        while flight.coalesced < 3:
+            time.sleep(0.001)
+        release.set()
+        results = [future.result() for future in futures]
+
+    assert results == ["result"] * 4
+    assert len(calls) == 1
+    assert flight.coalesced == 3
+
+
+def test_sequential_calls_are_not_coalesced():
+    flight = SingleFlight()
+    assert flight.do("key", lambda: 1) == 1
+    assert flight.do("key", lambda: 2) == 2
+    assert flight.coalesced == 0
+
+
+def test_exceptions_are_shared_and_do_not_stick():
+    flight = SingleFlight()
+
+    def failing_call():
+        raise ValueError("boom")
+
+    with pytest.raises(ValueError):
+        flight.do("key", failing_call)
+    assert flight.do("key", lambda: "ok") == "ok"
+
+
+def test_concurrent_coroutines_share_one_call():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def slow_call():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        return await asyncio.gather(
+            *(flight.do("key", slow_call) for _ in range(3)),
+            flight.do("other", slow_call),
+        )
+
+    assert asyncio.run(main()) == ["result"] * 4
+    assert len(calls) == 2
+    assert flight.coalesced == 2
+
+
+def test_cancelled_waiter_does_not_cancel_shared_call():
+    flight = AsyncSingleFlight()
+
+    async def slow_call():
+        await asyncio.sleep(0.01)
+        return "result"
+
+    async def main():
+        first = asyncio.ensure_future(flight.do("key", slow_call))
+        second = asyncio.ensure_future(flight.do("key", slow_call))
+        await asyncio.sleep(0)
+        first.cancel()
+        return await second
+
+    assert asyncio.run(main()) == "result"
+
+
+def test_batch_calls_send_each_key_once():
+    flight = SingleFlight()
+    calls = []
+
+    def call_batch(keys):
+        calls.append(keys)
+        return [key.upper() for key in keys]
+
+    assert flight.do_many(["a", "b", "a"], call_batch) == ["A", "B", "A"]
+    assert calls == [["a", "b"]]
+    assert flight.coalesced == 1
+
+
+def test_concurrent_batches_share_in_flight_keys():
+    flight = AsyncSingleFlight()
+    calls = []
+
+    async def call_batch(keys):
+        calls.append(keys)
+        await asyncio.sleep(0.01)
+        return [key.upper() for key in keys]
+
+    async def main():
+        return await asyncio.gather(
+            flight.do_many(["a", "b"], call_batch),
+            flight.do_many(["b", "c", "c"], call_batch),
+            flight.do("a", lambda: call_batch(["a"])),
+        )
+
+    assert asyncio.run(main()) == [["A", "B"], ["B", "C", "C"], "A"]
+    assert calls == [["a", "b"], ["c"]]
+    assert flight.coalesced == 3
+
+
+def test_batch_exceptions_are_shared_and_do_not_stick():
+    flight = AsyncSingleFlight()
+
+    async def failing_batch(keys):
+        raise ValueError("boom")
+
+    async def main():
+        with pytest.raises(ValueError):
+            await flight.do_many(["a", "a"], failing_batch)
+        return await flight.do_many(["a"], lambda keys: asyncio.sleep(0, ["ok"]))
+
+    assert asyncio.run(main()) == ["ok"]
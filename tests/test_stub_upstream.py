@@ -0,0 +1,118 @@
+import asyncio
+import statistics
+
+import pytest
+from fastapi.testclient import TestClient
+
+from src.cli import STUB_LATENCY_DISTRIBUTIONS
+from src.stub_upstream import (
+    CATEGORIES,
+    LATENCY_DISTRIBUTIONS,
+    LatencySampler,
+    StubConfig,
+    create_stub_app,
+    serve_stub,
+    stub_scores,
+)
+from src.utils.openai_moderation_handler import ModerationClient, get_category_scores
+
+
+def test_scores_are_derived_from_the_content():
+    scores = stub_scores("hello")
+
+    assert list(scores) == CATEGORIES
+    assert all(0 <= score <= 1 for score in scores.values())
+    assert stub_scores("hello") == scores
+    assert stub_scores("hello!") != scores
+
+
+def test_moderations_endpoint():
+    client = TestClient(create_stub_app())
+
+    response = client.post("/v1/moderations", json={"input": ["a", "b"]})
+
+    assert response.status_code == 200
+    results = response.json()["results"]
+    assert [r["category_scores"] for r in results] == [
+        stub_scores("a"),
+        stub_scores("b"),
+    ]
+    assert client.get("/stats").json() == {
+        "requests": 1,
+        "inputs": 2,
+        "rate_limited": 0,
+        "failed": 0,
+    }
+
+
+def test_rate_limits_are_injected():
+    client = TestClient(create_stub_app(StubConfig(rate_limit_rate=1, retry_after=2)))
+
+    response = client.post("/v1/moderations", json={"input": "a"})
+
+    assert response.status_code == 429
+    assert response.headers["retry-after"] == "2"
+    assert response.json()["error"]["code"] == "rate_limit_exceeded"
+
+
+@pytest.mark.parametrize(
+    "distribution", ["fixed", "uniform", "exponential", "lognormal"]
+)
+def test_latency_distributions_keep_their_mean(distribution):
+    sampler = LatencySampler(
+        StubConfig(latency_ms=20, latency_distribution=distribution, seed=1)
+    )
+
+    latencies = [sampler.latency() for _ in range(20_000)]
+
+    assert statistics.mean(latencies) == pytest.approx(0.02, rel=0.05)
+    assert min(latencies) >= 0
+
+
+def test_faults_are_replayed_with_a_seed():
+    config = StubConfig(rate_limit_rate=0.2, failure_rate=0.3, seed=7)
+    sampler, replay = LatencySampler(config), LatencySampler(config)
+    drawn = [sampler.fault() for _ in range(1000)]
+
+    assert drawn == [replay.fault() for _ in range(1000)]
+    assert drawn.count("rate_limit") == pytest.approx(200, abs=50)
+    assert drawn.count("failure") == pytest.approx(300, abs=50)
+
+
+def test_unknown_latency_distribution():
+    with pytest.raises(ValueError):
+        LatencySampler(StubConfig(latency_distribution="pareto"))
+
+
+def test_start_stub_offers_every_latency_distribution():
+    assert STUB_LATENCY_DISTRIBUTIONS == LATENCY_DISTRIBUTIONS
+
+
+def test_client_retries_injected_faults_end_to_end():
+    config = StubConfig(
+        latency_ms=1, rate_limit_rate=0.2, retry_after=0, failure_rate=0.2, seed=3
+    )
+    with serve_stub(config) as url:
+        client = ModerationClient(
+            api_key="stub", base_url=url, retry_delay=0.001, max_retries=20
+        )
+
+        async def main():
+            try:
+                return await asyncio.gather(
+                    *(client.amoderate(f"message {idx}") for idx in range(20))
+                )
+            finally:
+                await client.aclose()
+
+        results = asyncio.run(main())
+        batch = client.moderate_batch(["a", "b"])
+        client.close()
+
+    assert [get_category_scores(r) for r in results] == [
+        stub_scores(f"message {idx}") for idx in range(20)
+    ]
+    assert [get_category_scores(r) for r in batch] == [
+        stub_scores("a"),
+        stub_scores("b"),
+    ]
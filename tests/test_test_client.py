@@ -0,0 +1,147 @@
+import csv
+import json
+from unittest import mock
+
+import numpy as np
+import pytest
+
+from src.scripts.test_client import (
+    compare_results,
+    dump_discrepancies,
+    file_score,
+    format_summary,
+    main,
+)
+
+
+@pytest.fixture
+def scores():
+    file_scores = np.array([[0.5, 0.0], [0.2, 0.0001], [0.1, 0.3], [0.4, 0.4]])
+    api_scores = np.array([[0.5, 0.0], [0.3, 0.0002], [0.1, 0.3], [np.nan] * 2])
+    return file_scores, api_scores
+
+
+def test_compare_results(scores):
+    stats = compare_results(*scores, ["sexual", "hate"], threshold=0.05)
+
+    sexual, hate = stats["sexual"], stats["hate"]
+    # The failed request (NaN) is left out
+    assert sexual["n"] == hate["n"] == 3
+    assert sexual["max"] == pytest.approx(0.1)
+    assert sexual["mean"] == pytest.approx(0.1 / 3)
+    assert sexual["p50"] == pytest.approx(0.0)
+    assert sexual["max_relative"] == pytest.approx(0.5)
+    assert sexual["above_threshold"] == 1
+    # A near-zero baseline is compared against the minimum baseline, not forced to 0%
+    assert hate["max_relative"] == pytest.approx(0.0001 / 1e-3)
+    assert hate["above_threshold"] == 0
+
+
+def test_compare_results_without_valid_rows():
+    nan = np.full((2, 1), np.nan)
+    assert compare_results(np.zeros((2, 1)), nan, ["hate"]) == {}
+
+
+def test_compare_results_masks_missing_scores_per_category():
+    file_scores = np.array([[0.5, np.nan], [0.2, 0.1]])
+    api_scores = np.array([[0.5, 0.3], [0.3, 0.1]])
+
+    stats = compare_results(file_scores, api_scores, ["hate", "violence"])
+
+    assert stats["hate"]["n"] == 2
+    assert stats["violence"]["n"] == 1
+
+
+def test_compare_results_leaves_out_categories_without_scores():
+    file_scores = np.array([[0.5, np.nan], [0.2, np.nan]])
+
+    stats = compare_results(file_scores, file_scores.copy(), ["hate", "violence"])
+
+    assert list(stats) == ["hate"]
+
+
+def test_format_summary(scores):
+    summary = format_summary(compare_results(*scores, ["sexual", "hate"]), 0.01)
+
+    lines = summary.splitlines()
+    assert len(lines) == 3
+    assert lines[1].split()[:2] == ["sexual", "3"]
+
+
+@pytest.mark.parametrize("suffix", ["csv", "jsonl"])
+def test_dump_discrepancies(scores, tmp_path, suffix):
+    dump_file = tmp_path / f"discrepancies.{suffix}"
+
+    dump_discrepancies(str(dump_file), [1, 2, 3, 4], *scores, ["sexual", "hate"])
+
+    with open(dump_file, encoding="utf-8") as file:
+        if suffix == "csv":
+            rows = list(csv.DictReader(file))
+        else:
+            rows = [json.loads(line) for line in file]
+    assert len(rows) == 8
+    assert rows[2]["category"] == "sexual"
+    assert float(rows[2]["absolute"]) == pytest.approx(0.1)
+    if suffix == "jsonl":
+        assert rows[-1]["api_score"] is None
+
+
+@mock.patch("src.scripts.test_client.requests.post")
+def test_main_prints_summary(mock_post, tmp_path, capsys):
+    results_file = tmp_path / "moderated.json"
+    results_file.write_text(
+        json.dumps(
+            [
+                {
+                    "message_id": idx,
+                    "content": f"m{idx}",
+                    "category_scores": {"hate": 0.5},
+                }
+                for idx in range(10)
+            ]
+        )
+    )
+    mock_post.return_value.json.return_value = {"category_scores": {"hate": 0.6}}
+
+    main(str(results_file), "http://api", "key", "hate", 2, threshold=0.05)
+
+    output = capsys.readouterr().out.splitlines()
+    assert len(output) == 2
+    assert output[1].split()[:3] == ["hate", "10", "0.1000"]
+
+
+@mock.patch("src.scripts.test_client.requests.post")
+def test_main_compares_the_categories_of_the_file(mock_post, tmp_path, capsys):
+    results_file = tmp_path / "moderated.json"
+    results_file.write_text(
+        json.dumps(
+            [
+                {
+                    "message_id": idx,
+                    "content": f"m{idx}",
+                    "category_scores": {"violence": 0.1, "hate": 0.5},
+                }
+                for idx in range(4)
+            ]
+        )
+    )
+    mock_post.return_value.json.return_value = {
+        "category_scores": {"hate": 0.5, "violence": 0.1}
+    }
+
+    main(str(results_file), "http://api", "key", None, 2)
+
+    assert mock_post.call_args.kwargs["json"]["categories"] == ["hate", "violence"]
+    rows = [line.split()[:2] for line in capsys.readouterr().out.splitlines()[1:]]
+    assert rows == [["hate", "4"], ["violence", "4"]]
+
+
+def test_file_score_falls_back_to_the_full_score_vector():
+    result = {
+        "category_scores": {"hate": 0.5},
+        "all_category_scores": {"hate": 0.5, "violence": 0.25},
+    }
+
+    assert file_score(result, "hate") == 0.5
+    assert file_score(result, "violence") == 0.25
+    assert np.isnan(file_score({"category_scores": {"hate": 0.5}}, "violence"))